@@ -0,0 +1,168 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QRectF
+from PyQt5.QtGui import QPainter, QColor
+from PyQt5.QtWidgets import QDockWidget, QWidget, QVBoxLayout, QHBoxLayout, QTableView, QHeaderView, \
+                            QAbstractItemView, QLabel, QComboBox, QSpinBox, QPushButton
+import chess
+import chess.engine
+from LiveAnalysis import LiveAnalysis, AnalysisSnapshot
+from GameAnalysis import format_score
+from ChessEventManager import eventManager
+
+class EvalBar(QWidget):
+    """ A vertical bar filled with white by white's expected score. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setFixedWidth(24)
+        self.expectation = 0.5
+        self.text = ""
+
+    def set_score(self, score) -> None:
+        """ Sets a chess.engine.Score from white's point of view, None to reset. """
+        self.expectation = score.wdl().expectation() if score is not None else 0.5
+        self.text = format_score(score)
+        self.update()
+
+    def paintEvent(self, event) -> None:
+        painter = QPainter(self)
+        height = self.height()
+        white_height = round(height*self.expectation)
+        painter.fillRect(0, 0, self.width(), height-white_height, QColor(50, 50, 50))
+        painter.fillRect(0, height-white_height, self.width(), white_height, QColor(235, 235, 235))
+        if self.text:
+            font = painter.font()
+            font.setPointSize(7)
+            painter.setFont(font)
+            white_ahead = self.expectation >= 0.5
+            painter.setPen(QColor(50, 50, 50) if white_ahead else QColor(235, 235, 235))
+            flags = Qt.AlignHCenter | (Qt.AlignBottom if white_ahead else Qt.AlignTop)
+            painter.drawText(QRectF(0, 2, self.width(), height-4), flags, self.text.lstrip("+"))
+        painter.end()
+
+class AnalysisLinesModel(QAbstractTableModel):
+    """ The principal variations of the newest analysis snapshot. """
+
+    headers = ("Score", "Depth", "Line")
+    max_line_moves = 12
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rows = []
+
+    def set_snapshot(self, snapshot: AnalysisSnapshot) -> None:
+        self.beginResetModel()
+        self.rows = [ (format_score(info["score"].white()), str(info.get("depth", "")),
+                       snapshot.board.variation_san(info["pv"][:self.max_line_moves]), info["pv"][0])
+                      for info in snapshot.lines if info["pv"] ]
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        return self.rows[index.row()][index.column()]
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or orientation != Qt.Horizontal:
+            return None
+        return self.headers[section]
+
+class AnalysisGUI(QDockWidget):
+    """ Live engine analysis of the board position.
+
+    Shows the lines of the newest snapshot LiveAnalysis publishes
+    through eventManager.onAnalysis and drives the eval bar beside the
+    board. Snapshots arrive at the refresh rate at most, however fast
+    the engine sends info lines.
+    """
+
+    def __init__(self, live_analysis: LiveAnalysis, eval_bar: EvalBar, engine_defs: list, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setAllowedAreas(Qt.LeftDockWidgetArea | Qt.RightDockWidgetArea)
+        self.setMinimumSize(300, 150)
+        self.setWindowTitle("Analysis")
+        self.live_analysis = live_analysis
+        self.eval_bar = eval_bar
+        self.engine_defs = engine_defs
+        eventManager.onAnalysis += self.snapshot_ready
+        self.live_analysis.analysisError.connect(self.analysis_error)
+
+        controls = QWidget()
+        controls.setLayout(QHBoxLayout())
+        controls.layout().setContentsMargins(0, 0, 0, 0)
+        self.engineComboBox = QComboBox()
+        self.engineComboBox.addItems([ engine_def.name for engine_def in engine_defs ])
+        controls.layout().addWidget(self.engineComboBox, 1)
+        self.multipvSpinBox = QSpinBox()
+        self.multipvSpinBox.setRange(1, 10)
+        self.multipvSpinBox.setValue(live_analysis.multipv)
+        self.multipvSpinBox.setPrefix("Lines: ")
+        controls.layout().addWidget(self.multipvSpinBox)
+        self.analyseButton = QPushButton("Analyse")
+        self.analyseButton.setCheckable(True)
+        self.analyseButton.toggled.connect(self.analyse_toggled)
+        controls.layout().addWidget(self.analyseButton)
+
+        self.model = AnalysisLinesModel()
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setShowGrid(False)
+        self.table.verticalHeader().hide()
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.status = QLabel()
+
+        self.mainWidget = QWidget()
+        self.mainWidget.setLayout(QVBoxLayout())
+        self.mainWidget.layout().addWidget(controls)
+        self.mainWidget.layout().addWidget(self.table)
+        self.mainWidget.layout().addWidget(self.status)
+        self.setWidget(self.mainWidget)
+        self.eval_bar.hide()
+
+    def engine_def(self):
+        index = self.engineComboBox.currentIndex()
+        return self.engine_defs[index] if 0 <= index < len(self.engine_defs) else None
+
+    def analyse_toggled(self, checked: bool) -> None:
+        engine_def = self.engine_def()
+        if checked and engine_def is None:
+            self.analyseButton.setChecked(False)
+            self.status.setText("No engine to analyse with, add one in the preferences")
+            return
+        if checked:
+            self.live_analysis.start(engine_def, self.multipvSpinBox.value())
+            self.status.setText(f"Starting {engine_def.name}...")
+            self.eval_bar.show()
+        else:
+            self.live_analysis.stop()
+            self.model.set_snapshot(AnalysisSnapshot(0, chess.Board()))
+            self.eval_bar.set_score(None)
+            self.eval_bar.hide()
+            self.status.setText("")
+        self.engineComboBox.setEnabled(not checked)
+        self.multipvSpinBox.setEnabled(not checked)
+
+    def snapshot_ready(self, snapshot: AnalysisSnapshot) -> None:
+        if not self.live_analysis.running() or snapshot.session != self.live_analysis.session:
+            return
+        self.model.set_snapshot(snapshot)
+        self.eval_bar.set_score(snapshot.score())
+        if not snapshot.lines and snapshot.board.is_game_over():
+            self.status.setText(f"Game over: {snapshot.board.result()}")
+            return
+        self.status.setText(f"Depth {snapshot.depth}/{snapshot.seldepth}, "
+                            f"{snapshot.nodes/1000:.0f} kN, {snapshot.nps/1000:.0f} kN/s")
+
+    def analysis_error(self, message: str) -> None:
+        self.analyseButton.setChecked(False)
+        self.status.setText(f"Analysis stopped: {message}")
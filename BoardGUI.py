@@ -1,30 +1,21 @@
-from PyQt5.QtCore import Qt, QRectF, QPointF, QSize
-from PyQt5.QtGui import QPixmap, QPainter
+import os, time
+from PyQt5.QtCore import Qt, QRect, QRectF, QPointF, QSize, QSizeF, QTimer, pyqtSignal
+from PyQt5.QtGui import QPixmap, QPainter, QTransform, QColor, QGuiApplication
 from PyQt5.QtWidgets import QWidget, QGraphicsScene, QGraphicsItem, \
-                            QGraphicsPixmapItem, QGraphicsDropShadowEffect, \
+                            QGraphicsPixmapItem, QGraphicsView, \
                             QStyleOptionGraphicsItem
 import chess
 
 from ChessEventManager import eventManager
+from SpriteCache import spriteCache
+from Instrumentation import instrumentation
 
-piece_source = dict()
-
-piece_source["P"] = "imgs//Pawn White.png"
-piece_source["R"] = "imgs//Rook White.png"
-piece_source["N"] = "imgs//Knight White.png"
-piece_source["B"] = "imgs//Bishop White.png"
-piece_source["Q"] = "imgs//Queen White.png"
-piece_source["K"] = "imgs//King White.png"
-
-piece_source["p"] = "imgs//Pawn Black.png"
-piece_source["r"] = "imgs//Rook Black.png"
-piece_source["n"] = "imgs//Knight Black.png"
-piece_source["b"] = "imgs//Bishop Black.png"
-piece_source["q"] = "imgs//Queen Black.png"
-piece_source["k"] = "imgs//King Black.png"
+piece_symbols = "PRNBQKprnbqk"
 
 square_size = 256
 
+DEBUG = bool(os.environ.get("CHESSBOY_DEBUG"))
+
 def square_to_pos(square: int):    
     return (square % 8 + .5)*square_size, (7.5-(square//8))*square_size
 
@@ -37,141 +28,507 @@ class BoardGUI(QGraphicsScene):
         super().__init__()
 
         self.scale = 1.0
+        self.squares = dict() # square -> PieceGfx currently shown there
+        # only a handful of items, most of them move: no BSP tree to maintain
+        self.setItemIndexMethod(QGraphicsScene.NoIndex)
         self.init_graphics()
-        self.pool = PiecesPool()
-        eventManager.newPieceOnBoard += self.newPieceOnBoard
+        self.init_drag()
+        self.pool = PiecesPool(self)
+        self.pool.preallocate()
 
     def init_graphics(self):
         self.board = BoardGfx()
         self.addItem(self.board)
+        self.coordinates = CoordinatesGfx()
+        self.coordinates.setVisible(False)
+        self.addItem(self.coordinates)
+        self.highlights = HighlightGfx()
+        self.addItem(self.highlights)
+
+    def init_drag(self):
+        # mouse moves are coalesced to one setPos per display frame
+        self.drag_piece = None
+        self.drag_pos = None
+        self.drag_timer = QTimer(self)
+        self.drag_timer.setSingleShot(True)
+        self.drag_timer.timeout.connect(self.apply_drag)
+        screen = QGuiApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen is not None else 60.0
+        self.drag_timer.setInterval(max(1, int(1000/(refresh_rate or 60.0))))
+
+    def drag_to(self, piece: "PieceGfx", pos: QPointF) -> None:
+        self.drag_piece = piece
+        self.drag_pos = pos
+        if not self.drag_timer.isActive():
+            self.drag_timer.start()
+
+    def apply_drag(self) -> None:
+        if self.drag_piece is not None:
+            self.drag_piece.setPos(self.drag_pos)
+
+    def stop_drag(self) -> None:
+        self.drag_timer.stop()
+        self.drag_piece = None
+        self.drag_pos = None
+
+    def show_coordinates(self, visible: bool) -> None:
+        self.coordinates.setVisible(visible)
+
+    def invalidate_theme(self) -> None:
+        self.board.invalidate()
+        self.coordinates.update()
 
     def fit_to_window_scale(self, window_size: QSize, padding=100) -> float:
         size_base = min(window_size.width(), window_size.height())
         size_div = self.board.rect.bottomRight().x()
         return size_base/(size_div+padding)
 
+    def set_view_scale(self, scale: float, pixel_ratio: float = 1.0) -> None:
+        """ Pre-scales all sprites for the new zoom before the next paint. """
+        self.scale = scale
+        spriteCache.prescale(round(square_size*scale*pixel_ratio))
+
+    @instrumentation.timed("board")
     def setup_board(self, board:chess.Board) -> None:
+        """ Full rebuild. Only needed for new games, takebacks and jumps. """
         self.pool.clear_pieces()
+        self.squares.clear()
+        for square, piece in board.piece_map().items():
+            self.squares[square] = self.add_piece(piece.symbol(), *square_to_pos(square))
+
+    @instrumentation.timed("board")
+    def make_move(self, board: chess.Board, move: chess.Move) -> None:
+        """ Diff update after `move` was pushed onto `board`.
+
+        Only the squares touched by the move are synced, so the cost
+        is the same for every move no matter how full the board is.
+        """
+        piece = self.squares.pop(move.from_square, None)
+        captured = self.squares.pop(move.to_square, None)
+        if captured is not None:
+            self.pool.release(captured)
+        if piece is not None:
+            self.squares[move.to_square] = piece
+            piece.setPos(*square_to_pos(move.to_square))
+        for square in move_squares(move):
+            self.sync_square(board, square)
+
+    @instrumentation.timed("board")
+    def sync_board(self, board: chess.Board) -> None:
+        """ Diff update against an arbitrary position. """
         for square in chess.SQUARES:
-            piece = board.piece_at(square)
-            if piece!=None:
-                pos=square_to_pos(square)
-                self.add_piece(piece.symbol(), *pos)
-
-    def newPieceOnBoard(self, piece):
-        self.addItem(piece)
-
-    def add_piece(self, pieceType: str, x: int, y: int):
+            self.sync_square(board, square)
+
+    def sync_square(self, board: chess.Board, square: int) -> None:
+        piece = board.piece_at(square)
+        symbol = piece.symbol() if piece is not None else None
+        current = self.squares.get(square)
+        if current is not None and current.type == symbol:
+            return
+        if current is not None:
+            self.pool.release(current)
+            del self.squares[square]
+        if symbol is not None:
+            self.squares[square] = self.add_piece(symbol, *square_to_pos(square))
+
+    def add_piece(self, pieceType: str, x: int, y: int) -> "PieceGfx":
         piece = self.pool.get_piece(pieceType)
         piece.setPos(x, y)
+        return piece
 
 
-class BoardGfx(QGraphicsItem):
+class BoardView(QGraphicsView):
+    """ The view on the board, tuned to repaint as little as possible. """
+
+    wheelScrolled = pyqtSignal(int) # whole notches, positive away from the user
+
     def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        # only repaint the old and new rects of items that changed
+        self.setViewportUpdateMode(QGraphicsView.MinimalViewportUpdate)
+        self.setOptimizationFlags(QGraphicsView.DontAdjustForAntialiasing)
+        self.frame_timer = FrameTimer() if DEBUG else None
+        self.painted = False # whether the first frame is out
+        self.wheel_delta = 0
+
+    def wheelEvent(self, event):
+        # one step per wheel notch, touchpads send smaller deltas
+        self.wheel_delta += event.angleDelta().y()
+        steps = int(self.wheel_delta/120)
+        if steps:
+            self.wheel_delta -= steps*120
+            self.wheelScrolled.emit(steps)
+        event.accept()
+
+    def paintEvent(self, event):
+        self.painted = True
+        if self.frame_timer is None and not instrumentation.enabled:
+            return super().paintEvent(event)
+        start = time.perf_counter()
+        super().paintEvent(event)
+        end = time.perf_counter()
+        if self.frame_timer is not None:
+            self.frame_timer.add_frame(start, end)
+        if instrumentation.enabled:
+            instrumentation.record("BoardView.paintEvent", "paint", start, end)
+
+class FrameTimer:
+    """ Frame rate and paint time of the board view, for debug builds.
+
+    Set the CHESSBOY_DEBUG environment variable to enable it.
+    """
+
+    def __init__(self, report_interval: float = 1.0) -> None:
+        self.report_interval = report_interval
+        self.reset()
+
+    def reset(self) -> None:
+        self.frames = 0
+        self.paint_time = 0.0
+        self.max_paint_time = 0.0
+        self.window_start = time.perf_counter()
+
+    def add_frame(self, start: float, end: float) -> None:
+        self.frames += 1
+        self.paint_time += end-start
+        self.max_paint_time = max(self.max_paint_time, end-start)
+        if end-self.window_start >= self.report_interval:
+            print(self.report(end))
+            self.reset()
+
+    def report(self, now: float) -> str:
+        fps = self.frames/(now-self.window_start)
+        mean = self.paint_time/max(1, self.frames)
+        return f"BoardView: {fps:.1f} fps, paint {mean*1000:.2f} ms avg, {self.max_paint_time*1000:.2f} ms max"
+
+def move_squares(move: chess.Move) -> tuple:
+    """ All squares a move can change: from/to plus the en passant
+    victim and the castling rook. Extra squares are harmless, they
+    are only synced against the board. """
+    squares = [move.from_square, move.to_square]
+    from_file, to_file = chess.square_file(move.from_square), chess.square_file(move.to_square)
+    from_rank, to_rank = chess.square_rank(move.from_square), chess.square_rank(move.to_square)
+    if from_rank in (3, 4) and abs(to_rank-from_rank) == 1 and abs(to_file-from_file) == 1:
+        # possible en passant
+        squares.append(chess.square(to_file, from_rank))
+    if from_file == 4 and from_rank == to_rank and from_rank in (0, 7) and abs(to_file-from_file) == 2:
+        # possible castling, rook hops over the king
+        rook_from = 7 if to_file == 6 else 0
+        rook_to = 5 if to_file == 6 else 3
+        squares.append(chess.square(rook_from, from_rank))
+        squares.append(chess.square(rook_to, from_rank))
+    return tuple(squares)
+
+
+def snapped_rect(transform: QTransform, rect: QRectF) -> QRect:
+    """ Maps a scene rect to device pixels, snapping both edges so
+    neighbouring sprites neither overlap nor leave gaps. """
+    target = transform.mapRect(rect)
+    left, top = round(target.left()), round(target.top())
+    return QRect(left, top, round(target.right())-left, round(target.bottom())-top)
+
+class BoardGfx(QGraphicsItem):
+    """ The board background.
+
+    By default all 64 squares are painted once into a single cached
+    layer, which is only rendered again when the board size or the
+    theme changes. With `single_layer=False` every square is its own
+    SquareGfx child item instead.
+    """
+
+    def __init__(self, *args, single_layer: bool = True, **kwargs):
         super().__init__(*args, *kwargs)
+        self.setAcceptedMouseButtons(Qt.NoButton)
+        self.setZValue(-2)
         # Setup squares
         self.square_source = dict()
-        self.square_source[0] = "imgs//Field Light.png"
-        self.square_source[1] = "imgs//Field Dark.png"
-        self.rect = QRectF( QPointF(0, 0), QPointF(1, 1))
+        self.square_source[0] = "light"
+        self.square_source[1] = "dark"
+        self.square_size = spriteCache.source("light").width()
+        self.rect = QRectF(0, 0, self.square_size*8, self.square_size*8)
+        self.single_layer = single_layer
+        self.layer = None
+        self.layer_size = 0
+        if not single_layer:
+            for squareID in range(0, 64):
+                square = SquareGfx()
+                square.set_sprite(self.square_color(squareID))
+                square.setPos(self.square_size*(squareID % 8), self.square_size*(squareID//8))
+                square.setParentItem(self)
+
+    def square_color(self, squareID: int) -> str:
+        """ Sprite of a square, counted from the top left. """
+        bw = ((squareID//8) % 2 + squareID % 2) % 2
+        return self.square_source[bw]
+
+    def boundingRect(self) -> QRectF:
+        return self.rect
+
+    def invalidate(self) -> None:
+        """ Drops the cached layer, e.g. after a theme change. """
+        self.layer = None
+        self.update()
+
+    def render_layer(self, size: int) -> QPixmap:
+        layer = QPixmap(size*8, size*8)
+        painter = QPainter(layer)
         for squareID in range(0, 64):
-            square = SquareGfx()
-            bw = ((squareID//8) % 2 + squareID % 2) % 2
-            sqx = QPixmap(self.square_source[bw])
-            square.setPixmap(sqx)
-            x = sqx.width()*(squareID % 8)
-            y = sqx.height()*(squareID//8)
-            square.setPos(x, y)
-            square.setParentItem(self)
-        self.rect.setBottomRight(
-            QPointF(x+sqx.width(), y+sqx.height()))
-        self.square_size = sqx.width()
-    
+            painter.drawPixmap(size*(squareID % 8), size*(squareID//8),
+                               spriteCache.pixmap(self.square_color(squareID), size))
+        painter.end()
+        self.layer = layer
+        self.layer_size = size
+        return layer
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget = None):
+        if not self.single_layer:
+            return
+        transform = painter.worldTransform()
+        pixel_ratio = painter.device().devicePixelRatioF()
+        size = round(self.square_size*transform.m11()*pixel_ratio)
+        layer = self.layer
+        if layer is None or self.layer_size != size:
+            layer = self.render_layer(size)
+        if transform.type() > QTransform.TxScale:
+            painter.drawPixmap(self.rect, layer, QRectF(layer.rect()))
+            return
+        layer.setDevicePixelRatio(pixel_ratio)
+        painter.save()
+        painter.setWorldTransform(QTransform())
+        painter.drawPixmap(snapped_rect(transform, self.rect), layer)
+        painter.restore()
+
+class CoordinatesGfx(QGraphicsItem):
+    """ File and rank labels on the edge squares. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, *kwargs)
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
+        self.setAcceptedMouseButtons(Qt.NoButton)
+        self.setZValue(-1)
+        self.rect = QRectF(0, 0, square_size*8, square_size*8)
+        self.light = QColor(230, 230, 230)
+        self.dark = QColor(80, 80, 80)
+
     def boundingRect(self) -> QRectF:
         return self.rect
 
-    # def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget):
-    #     painter.drawPixmap()
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget = None):
+        font = painter.font()
+        font.setPixelSize(square_size//6)
+        painter.setFont(font)
+        margin = square_size//20
+        for file in range(8):
+            # a1 is dark, so the label takes the colour of the other square
+            painter.setPen(self.dark if file % 2 else self.light)
+            painter.drawText(QRectF(file*square_size, 7*square_size, square_size-margin, square_size-margin),
+                             Qt.AlignRight | Qt.AlignBottom, chess.FILE_NAMES[file])
+        for rank in range(8):
+            painter.setPen(self.dark if rank % 2 else self.light)
+            painter.drawText(QRectF(margin, (7-rank)*square_size+margin, square_size, square_size),
+                             Qt.AlignLeft | Qt.AlignTop, chess.RANK_NAMES[rank])
+
+class HighlightGfx(QGraphicsItem):
+    """ Coloured square overlays, e.g. the last move or legal targets. """
 
-class SquareGfx(QGraphicsPixmapItem):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, *kwargs)
+        self.setAcceptedMouseButtons(Qt.NoButton)
+        self.setZValue(-1)
+        self.rect = QRectF(0, 0, square_size*8, square_size*8)
+        self.squares = dict() # square -> QColor
 
-class PieceGfx(QGraphicsPixmapItem):
+    def boundingRect(self) -> QRectF:
+        return self.rect
+
+    def square_rect(self, square: int) -> QRectF:
+        x, y = square_to_pos(square)
+        return QRectF(x-square_size/2, y-square_size/2, square_size, square_size)
+
+    def set_squares(self, squares, color: QColor) -> None:
+        self.clear()
+        for square in squares:
+            self.squares[square] = color
+            self.update(self.square_rect(square))
+
+    def clear(self) -> None:
+        for square in self.squares:
+            self.update(self.square_rect(square))
+        self.squares.clear()
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget = None):
+        for square, color in self.squares.items():
+            painter.fillRect(self.square_rect(square), color)
+
+class SpriteGfx(QGraphicsPixmapItem):
+    """ Pixmap item that paints a pre-scaled sprite from the sprite cache.
+
+    The unscaled source only defines the geometry. When painting, the
+    sprite matching the device size is blitted without a transform, so
+    the 256 px source never gets rescaled per frame.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, *kwargs)
+        self.sprite = None
+
+    def set_sprite(self, key: str):
+        self.sprite = key
+        self.setPixmap(spriteCache.source(key))
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget = None):
+        transform = painter.worldTransform()
+        if self.sprite is None or transform.type() > QTransform.TxScale:
+            return super().paint(painter, option, widget)
+        pixel_ratio = painter.device().devicePixelRatioF()
+        target = QRectF(self.offset(), QSizeF(self.pixmap().size()))
+        pixmap = spriteCache.pixmap(self.sprite, round(square_size*transform.m11()*pixel_ratio))
+        pixmap.setDevicePixelRatio(pixel_ratio)
+        painter.save()
+        painter.setWorldTransform(QTransform())
+        painter.drawPixmap(snapped_rect(transform, target), pixmap)
+        painter.restore()
+
+class SquareGfx(SpriteGfx):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, *kwargs)
+
+class PieceGfx(SpriteGfx):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, *kwargs)
         self.setAcceptedMouseButtons(Qt.LeftButton | Qt.RightButton)
         self.setAcceptHoverEvents(True)
-        self.setTransformationMode(Qt.SmoothTransformation)
         self.type=""
+        self.lifted = False
 
     def set_piece(self, pieceType: str):
         self.type=pieceType
-        self.setPixmap(QPixmap(piece_source[pieceType]))
+        self.set_sprite(pieceType)
         size = self.pixmap().size()
         self.setOffset(-size.width()/2, -size.height()/2)
 
+    def boundingRect(self) -> QRectF:
+        rect = super().boundingRect()
+        if self.lifted:
+            margin = spriteCache.shadow_margin
+            rect.adjust(-margin, -margin, margin, margin)
+        return rect
+
+    def set_lifted(self, lifted: bool) -> None:
+        """ A lifted piece is drawn bigger with a pre-rendered shadow. """
+        self.prepareGeometryChange()
+        self.lifted = lifted
+        self.setScale(1.1 if lifted else 1.0)
+        self.setZValue(2 if lifted else 0)
+
+    def paint(self, painter: QPainter, option: QStyleOptionGraphicsItem, widget: QWidget = None):
+        transform = painter.worldTransform()
+        if not self.lifted or transform.type() > QTransform.TxScale:
+            return super().paint(painter, option, widget)
+        pixel_ratio = painter.device().devicePixelRatioF()
+        pixmap = spriteCache.shadow(self.sprite, round(square_size*transform.m11()*pixel_ratio))
+        pixmap.setDevicePixelRatio(pixel_ratio)
+        painter.save()
+        painter.setWorldTransform(QTransform())
+        painter.drawPixmap(snapped_rect(transform, self.boundingRect()), pixmap)
+        painter.restore()
+
     def mousePressEvent(self, event):
         self.old_pos = self.pos()
         self.old_square = pos_to_square(self.pos().x(), self.pos().y())
         self.setPos(event.scenePos())
-        self.setGraphicsEffect(QGraphicsDropShadowEffect())
-        self.setScale(1.1)
-        self.setZValue(2)
+        self.set_lifted(True)
         eventManager.onPieceLifted(self)
 
     def mouseMoveEvent(self, event):
-        self.setPos(event.scenePos())
+        scene = self.scene()
+        if isinstance(scene, BoardGUI):
+            scene.drag_to(self, event.scenePos())
+        else:
+            self.setPos(event.scenePos())
 
     def mouseReleaseEvent(self, event):
-        self.setGraphicsEffect(None)
-        self.setScale(1.0)
-        self.setZValue(0)
-        self.new_square = pos_to_square(self.pos().x(), self.pos().y())
+        scene = self.scene()
+        if isinstance(scene, BoardGUI):
+            scene.stop_drag()
+        self.set_lifted(False)
+        eventManager.onPieceDropped(self)
+        pos = event.scenePos()
+        self.new_square = pos_to_square(pos.x(), pos.y())
         self.setPos(self.old_pos)
-        if self.old_square != self.new_square:
+        on_board = 0 <= pos.x() < square_size*8 and 0 <= pos.y() < square_size*8
+        if on_board and self.old_square != self.new_square:
             move = chess.Move.from_uci(
                 chess.SQUARE_NAMES[self.old_square] + chess.SQUARE_NAMES[self.new_square])
             eventManager.onMoveTry(move)
 
 class PiecesPool:
-    """ Manages piece instances so we don't need to create them twice. """
-
-    def __init__(self) -> None:
-        self.pieces = dict()
-
-        self.pieces["P"] = []
-        self.pieces["R"] = []
-        self.pieces["N"] = []
-        self.pieces["B"] = []
-        self.pieces["Q"] = []
-        self.pieces["K"] = []
-
-        self.pieces["p"] = []
-        self.pieces["r"] = []
-        self.pieces["n"] = []
-        self.pieces["b"] = []
-        self.pieces["q"] = []
-        self.pieces["k"] = []
+    """ Manages piece instances so we don't need to create them twice.
+
+    Every piece symbol has a stack of free pieces and a set of pieces in
+    use, so acquiring and releasing are O(1). Call preallocate() once
+    to create a full set up front, nothing gets allocated during play.
+    """
+
+    # A full set plus spare queens for promotions
+    full_set = { "P": 8, "R": 2, "N": 2, "B": 2, "Q": 3, "K": 1,
+                 "p": 8, "r": 2, "n": 2, "b": 2, "q": 3, "k": 1 }
+
+    def __init__(self, scene: QGraphicsScene = None) -> None:
+        self.scene = scene
+        self.free = { symbol: [] for symbol in piece_symbols }
+        self.used = { symbol: set() for symbol in piece_symbols }
+        self.allocations = 0
+
+    def preallocate(self, counts: dict = None) -> None:
+        counts = counts or self.full_set
+        for symbol, count in counts.items():
+            missing = count - len(self.free[symbol]) - len(self.used[symbol])
+            for i in range(missing):
+                self.free[symbol].append(self.new_piece(symbol))
+
+    def new_piece(self, pieceType: str) -> PieceGfx:
+        piece = PieceGfx()
+        piece.set_piece(pieceType)
+        piece.setVisible(False)
+        self.allocations += 1
+        if self.scene is not None:
+            self.scene.addItem(piece)
+        eventManager.newPieceOnBoard(piece)
+        return piece
 
     def clear_pieces(self):
-        for pieces in self.pieces.values():
-            for piece in pieces:
+        for symbol, used in self.used.items():
+            for piece in used:
                 piece.setVisible(False)
+            self.free[symbol].extend(used)
+            used.clear()
 
     def get_piece(self, pieceType: str) -> PieceGfx:
-        free_pieces = [ piece for piece in self.pieces[pieceType] if not piece.isVisible() ]
-        if len(free_pieces)<1:
-            piece = PieceGfx()
-            piece.set_piece(pieceType)
-            self.pieces[pieceType].append(piece)
-            eventManager.newPieceOnBoard(piece)
-            return piece
-        else:
-            piece = free_pieces[0]
-            piece.setVisible(True)
-            return piece
+        free = self.free[pieceType]
+        piece = free.pop() if free else self.new_piece(pieceType)
+        self.used[pieceType].add(piece)
+        piece.setVisible(True)
+        return piece
+
+    def release(self, piece: PieceGfx):
+        piece.setVisible(False)
+        self.used[piece.type].discard(piece)
+        self.free[piece.type].append(piece)
+
+    def stats(self) -> dict:
+        """ Pool statistics, per symbol and in total. """
+        stats = dict()
+        for symbol in piece_symbols:
+            stats[symbol] = { "free": len(self.free[symbol]),
+                              "used": len(self.used[symbol]) }
+        stats["free"] = sum(len(free) for free in self.free.values())
+        stats["used"] = sum(len(used) for used in self.used.values())
+        stats["allocations"] = self.allocations
+        return stats
 
 if __name__=="__main__":
 
@@ -0,0 +1,83 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtWidgets import QDockWidget, QTableView, QHeaderView, QAbstractItemView
+import chess
+from ChessEventManager import eventManager
+from OpeningBook import OpeningBooks
+
+class BookMovesModel(QAbstractTableModel):
+    """ The book moves of the current position. """
+
+    headers = ("Move", "Weight", "Books")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.moves = []
+        self.sans = []
+
+    def set_moves(self, board: chess.Board, moves: list) -> None:
+        self.beginResetModel()
+        self.moves = moves
+        self.sans = [ board.san(book_move.move) for book_move in moves ]
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.moves)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        book_move = self.moves[index.row()]
+        if index.column() == 0:
+            return self.sans[index.row()]
+        if index.column() == 1:
+            return f"{100*book_move.weight:.1f}%"
+        return ", ".join(book_move.books)
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or orientation != Qt.Horizontal:
+            return None
+        return self.headers[section]
+
+class BookGUI(QDockWidget):
+    """ Shows the book moves of the board position, a click plays one. """
+
+    def __init__(self, books: OpeningBooks, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setAllowedAreas(Qt.LeftDockWidgetArea | Qt.RightDockWidgetArea)
+        self.setMinimumSize(300, 200)
+        self.setWindowTitle("Opening Book")
+        self.books = books
+        self.board = None
+        eventManager.onMove += self.position_changed
+        eventManager.onJump += self.position_changed
+        eventManager.onGameLoaded += self.position_changed
+        eventManager.newGame += self.position_changed
+
+        self.model = BookMovesModel()
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setShowGrid(False)
+        self.table.verticalHeader().hide()
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.clicked.connect(self.move_clicked)
+        self.setWidget(self.table)
+
+    def set_board(self, board: chess.Board) -> None:
+        self.board = board
+        self.position_changed()
+
+    def position_changed(self, *args) -> None:
+        # lookups take well under a millisecond, no need for a thread
+        if self.board is not None:
+            self.model.set_moves(self.board, self.books.moves(self.board))
+
+    def move_clicked(self, index: QModelIndex) -> None:
+        if index.isValid():
+            eventManager.onMoveTry(self.model.moves[index.row()].move)
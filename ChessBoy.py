@@ -3,25 +3,28 @@
 # -------------------------------
 # V 0.1
 
-import sys
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPalette, QColor, QIcon, QBrush, QPen, QPainter, QTransform
+import multiprocessing, sys
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QPalette, QColor, QIcon, QBrush, QPen, QPainter, QTransform, QCursor
 from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, \
-                            QVBoxLayout, QPushButton, \
+                            QVBoxLayout, QHBoxLayout, QPushButton, \
                             QGraphicsScene, QGraphicsView, \
                             QMenuBar, QMenu, QAction, \
-                            QDockWidget, QTextBrowser
+                            QDockWidget, QTextBrowser, QFileDialog
 
+from Instrumentation import instrumentation, startup
+from SpriteCache import spriteCache
+spriteCache.preload() # decodes while the rest is imported
 from ChessEventManager import eventManager
 from Preferences import Preferences
-from BoardGUI import BoardGUI
-from NotationGUI import NotationGUI
-from GameSettings import GameSettings
+from BoardGUI import BoardGUI, BoardView
+from LegalMoves import LegalMoveIndex
+from GameHistory import GameHistory
+
+# Docks and engines are imported once the board is on screen, see init_deferred()
 
 import chess
 
-from GameSettings import GameSettings
-# import chess.engine
 # import chess.svg
 
 class MainWindow(QMainWindow):
@@ -37,17 +40,64 @@ class MainWindow(QMainWindow):
         self.light_palette = QApplication.instance().palette()
 
         eventManager.onMoveTry += self.makeMoveEvent
+        eventManager.onJumpTry += self.jumpEvent
+        eventManager.onGameLoadTry += self.loadGameEvent
+        eventManager.onPieceLifted += self.pieceLiftedEvent
+        eventManager.onPieceDropped += self.pieceDroppedEvent
 
+        startup.mark("imports")
+        self.ready = False
         self.init_prefs()
         self.init_chess_board()
         self.init_gui()
 
         self.board_scene.setup_board(self.board)
+        startup.mark("window")
+        self.first_frame_waits = 0
+        QTimer.singleShot(0, self.wait_for_first_frame)
+
+    def wait_for_first_frame(self):
+        # the window system exposes the window some time after show()
+        if not self.board_view.painted and self.first_frame_waits < 100:
+            self.first_frame_waits += 1
+            QTimer.singleShot(5, self.wait_for_first_frame)
+            return
+        self.init_deferred()
+
+    def init_deferred(self):
+        """ Everything but the board, built right after its first frame.
+
+        Engines, books, tablebases and the docks import most of the
+        application, chess.engine and numpy among it. Until they are
+        ready the board takes no input and their menu entries are off.
+        """
+        if self.ready:
+            return
+        startup.mark("first frame" if self.board_view.painted else "no frame yet")
+
+        self.init_engines()
+        self.init_player_settings_dock()
+        self.init_notation_dock()
+        self.init_database_dock()
+        self.init_book_dock()
+        self.init_tablebase_dock()
+        self.init_analysis_dock()
+        self.init_game_analysis()
+        self.init_instrumentation()
+
+        self.ready = True
+        for action in self.deferred_actions:
+            action.setEnabled(True)
+        self.board_view.setInteractive(True)
         eventManager.newGame()
+        startup.mark("ready")
+        if "--startup-report" in QApplication.instance().arguments():
+            print(startup.report())
 
     # ---- Preferences
 
     def init_prefs(self):
+        # the settings only, the dialog is built when it is first shown
         self.prefs = Preferences(self)
 
     def show_prefs(self):
@@ -56,10 +106,12 @@ class MainWindow(QMainWindow):
     def set_dark_mode(self):
         app = QApplication.instance()
         app.setPalette(get_dark_mode())
+        self.board_scene.invalidate_theme()
 
     def set_light_mode(self):
         app = QApplication.instance()
         app.setPalette(self.light_palette)
+        self.board_scene.invalidate_theme()
 
     # --- Main GUI
 
@@ -68,14 +120,10 @@ class MainWindow(QMainWindow):
         self.setWindowIcon(QIcon(self.iconName))
         self.setGeometry(300, 300, self.width, self.height)
 
-        self.init_menu_bar()
         self.init_board_gui()
+        self.init_menu_bar()
         self.init_tool_bar()
 
-        # docks
-        self.init_player_settings_dock()
-        self.init_notation_dock()
-
         self.show()
 
     def init_menu_bar(self):
@@ -85,6 +133,12 @@ class MainWindow(QMainWindow):
         self.new_game_action = QAction("New Game", self)
         self.new_game_action.triggered.connect(self.new_game)
         fileMenu.addAction(self.new_game_action)
+        self.open_pgn_action = QAction("Open PGN...", self)
+        self.open_pgn_action.triggered.connect(self.open_pgn)
+        fileMenu.addAction(self.open_pgn_action)
+        self.import_pgn_action = QAction("Import PGN into Database...", self)
+        self.import_pgn_action.triggered.connect(self.import_pgn)
+        fileMenu.addAction(self.import_pgn_action)
         menuBar.addMenu(fileMenu)
 
         editMenu = QMenu("&Edit", self)
@@ -95,16 +149,48 @@ class MainWindow(QMainWindow):
         self.light_mode_action = QAction("Set Light Mode", self)
         self.light_mode_action.triggered.connect(self.set_light_mode)
         editMenu.addAction(self.light_mode_action)
+        self.coordinates_action = QAction("Show Coordinates", self)
+        self.coordinates_action.setCheckable(True)
+        self.coordinates_action.toggled.connect(self.board_scene.show_coordinates)
+        editMenu.addAction(self.coordinates_action)
+        editMenu.addSeparator()
+        self.take_back_action = QAction("Take Back Move", self)
+        self.take_back_action.setShortcut("Ctrl+Z")
+        self.take_back_action.triggered.connect(self.take_back)
+        editMenu.addAction(self.take_back_action)
         editMenu.addSeparator()
         self.show_prefs_action = QAction("Preferences", self)
         self.show_prefs_action.triggered.connect(self.show_prefs)
         editMenu.addAction(self.show_prefs_action)
 
+        analysisMenu = QMenu("&Analysis", self)
+        self.analyse_game_action = QAction("Analyse Game", self)
+        self.analyse_game_action.triggered.connect(self.analyse_game)
+        analysisMenu.addAction(self.analyse_game_action)
+        self.cancel_analysis_action = QAction("Cancel Game Analysis", self)
+        self.cancel_analysis_action.triggered.connect(self.cancel_game_analysis)
+        analysisMenu.addAction(self.cancel_analysis_action)
+        analysisMenu.addSeparator()
+        self.engine_match_action = QAction("Engine Match...", self)
+        self.engine_match_action.triggered.connect(self.show_engine_match)
+        analysisMenu.addAction(self.engine_match_action)
+        menuBar.addMenu(analysisMenu)
+
         helpMenu = QMenu("&Help", self)
+        self.show_performance_action = QAction("Performance Monitor", self)
+        self.show_performance_action.triggered.connect(self.show_performance)
+        helpMenu.addAction(self.show_performance_action)
+        helpMenu.addSeparator()
         self.show_about_action = QAction("About ChessBoy", self)
         helpMenu.addAction(self.show_about_action)
         menuBar.addMenu(helpMenu)
 
+        # these need the docks and engines of init_deferred()
+        self.deferred_actions = [ self.import_pgn_action, self.analyse_game_action,
+                                  self.cancel_analysis_action, self.engine_match_action ]
+        for action in self.deferred_actions:
+            action.setEnabled(False)
+
     def init_tool_bar(self):
         pass
 
@@ -112,49 +198,269 @@ class MainWindow(QMainWindow):
 
     def init_chess_board(self):
         self.board = chess.Board()
+        self.history = GameHistory() # mainline, can be longer than the board's move stack
+        self.move_index = LegalMoveIndex(self.board)
 
     def init_board_gui(self):
         # self.board_scene = QGraphicsScene()
         self.board_scene = BoardGUI()
-        self.board_view = QGraphicsView(self.board_scene)
-        self.board_view.setVerticalScrollBarPolicy(
-            Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
-        self.board_view.setHorizontalScrollBarPolicy(
-            Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.board_view = BoardView(self.board_scene)
         self.board_view.setAcceptDrops(True)
-        self.setCentralWidget(self.board_view)
+        self.board_view.setInteractive(False) # until init_deferred()
+        central = QWidget()
+        central.setLayout(QHBoxLayout())
+        central.layout().setContentsMargins(0, 0, 0, 0)
+        central.layout().addWidget(self.board_view)
+        self.setCentralWidget(central)
+        self.board_view.wheelScrolled.connect(self.scrub)
 
     def init_player_settings_dock(self):
+        from GameSettings import GameSettings
         self.player_settings_dock = GameSettings()
         self.player_settings_dock.resizeEvent = self.resizeEvent
         self.addDockWidget(Qt.RightDockWidgetArea, self.player_settings_dock)
+        engine_defs = self.prefs.engine_settings.engine_defs
+        infos = { engine.name: self.engine_info.get(engine) for engine in engine_defs }
+        self.player_settings_dock.set_engines([ engine.name for engine in engine_defs ],
+            { name: info for name, info in infos.items() if info is not None })
+        self.init_engine_players()
+
+    # ---- Engines
+
+    def init_engines(self):
+        from OpeningBook import OpeningBooks
+        from Tablebases import Tablebases
+        self.opening_books = OpeningBooks(self.prefs.book_settings.book_defs)
+        self.tablebases = Tablebases(self.prefs.tablebase_settings.directories)
+        self.tablebases.preload()
+        self.prefs.tablebase_settings.changed = self.tablebases.set_directories
+        self.init_engine_info()
+
+    def init_engine_info(self):
+        # what the engines are comes from the cache, only new or changed binaries get started
+        from EngineInfo import engineInfoCache
+        self.engine_info = engineInfoCache
+        self.prefs.set_engine_info(engineInfoCache, self.refresh_engine_info)
+        self.refresh_engine_info(self.prefs.engine_settings.engine_defs)
+
+    def refresh_engine_info(self, engine_defs: list) -> None:
+        from EngineInfo import engineInfoCache
+        from EnginePlayer import engineThread
+        engineThread.submit(engineInfoCache.refresh(engine_defs, probed=eventManager.onEngineInfo))
+
+    def init_engine_players(self):
+        from EnginePlayer import EnginePlayers
+        self.engine_players = EnginePlayers(self.board, self.prefs.engine_settings.engine_defs,
+                                            self.opening_books, self.tablebases)
+        self.player_settings_dock.whiteComboBox.currentTextChanged.connect(
+            lambda name: self.engine_players.set_player(chess.WHITE, name))
+        self.player_settings_dock.blackComboBox.currentTextChanged.connect(
+            lambda name: self.engine_players.set_player(chess.BLACK, name))
+
+    def closeEvent(self, event):
+        if not self.ready:
+            return super().closeEvent(event)
+        self.live_analysis.stop()
+        self.game_analysis.cancel()
+        if hasattr(self, "match_dock"):
+            self.match_dock.shutdown()
+        self.engine_players.shutdown()
+        self.database_dock.shutdown()
+        self.opening_books.close()
+        self.tablebases.close()
+        super().closeEvent(event)
 
     def init_notation_dock(self):
+        from NotationGUI import NotationGUI
         self.notation_dock = NotationGUI()
         self.notation_dock.resizeEvent = self.resizeEvent
         self.addDockWidget(Qt.RightDockWidgetArea, self.notation_dock)
         self.notation_dock.set_board(self.board)
 
+    def init_database_dock(self):
+        from DatabaseGUI import DatabaseGUI
+        self.database_dock = DatabaseGUI()
+        self.database_dock.resizeEvent = self.resizeEvent
+        self.addDockWidget(Qt.RightDockWidgetArea, self.database_dock)
+        self.splitDockWidget(self.notation_dock, self.database_dock, Qt.Vertical)
+        self.database_dock.set_board(self.board)
+
+    def init_book_dock(self):
+        from BookGUI import BookGUI
+        self.book_dock = BookGUI(self.opening_books)
+        self.book_dock.resizeEvent = self.resizeEvent
+        self.addDockWidget(Qt.RightDockWidgetArea, self.book_dock)
+        self.tabifyDockWidget(self.database_dock, self.book_dock)
+        self.book_dock.set_board(self.board)
+
+    def init_tablebase_dock(self):
+        from TablebaseGUI import TablebaseGUI
+        self.tablebase_dock = TablebaseGUI(self.tablebases)
+        self.tablebase_dock.resizeEvent = self.resizeEvent
+        self.addDockWidget(Qt.RightDockWidgetArea, self.tablebase_dock)
+        self.tabifyDockWidget(self.book_dock, self.tablebase_dock)
+        self.database_dock.raise_()
+        self.tablebase_dock.set_board(self.board)
+
+    def init_analysis_dock(self):
+        from LiveAnalysis import LiveAnalysis
+        from AnalysisGUI import AnalysisGUI, EvalBar
+        self.eval_bar = EvalBar()
+        self.centralWidget().layout().insertWidget(0, self.eval_bar)
+        self.live_analysis = LiveAnalysis(self.board, parent=self)
+        self.analysis_dock = AnalysisGUI(self.live_analysis, self.eval_bar,
+                                         self.prefs.engine_settings.engine_defs)
+        self.analysis_dock.resizeEvent = self.resizeEvent
+        self.addDockWidget(Qt.RightDockWidgetArea, self.analysis_dock)
+        self.splitDockWidget(self.player_settings_dock, self.analysis_dock, Qt.Vertical)
+
+    # ---- Game analysis
+
+    def init_game_analysis(self):
+        from GameAnalysis import GameAnalysis
+        self.game_analysis = GameAnalysis(self.board, parent=self)
+        self.game_analysis.plyAnalysed.connect(self.notation_dock.set_evaluation)
+        self.game_analysis.analysisProgress.connect(
+            lambda done, total: self.notation_dock.set_analysis_status(f"Analysing: {done}/{total} positions"))
+        self.game_analysis.analysisDone.connect(self.notation_dock.set_analysis_status)
+        self.game_analysis.analysisError.connect(
+            lambda message: self.notation_dock.set_analysis_status(f"Analysis failed: {message}"))
+
+    def analyse_game(self):
+        engine_def = self.analysis_dock.engine_def()
+        if engine_def is None or not self.history.moves:
+            return
+        self.notation_dock.clear_evaluations()
+        self.game_analysis.analyse(engine_def, self.history.start_fen, self.history.moves)
+
+    def cancel_game_analysis(self):
+        if self.game_analysis.running():
+            self.game_analysis.cancel()
+            self.notation_dock.set_analysis_status("Analysis cancelled")
+
+    # ---- Instrumentation
+
+    def init_instrumentation(self):
+        from EnginePool import enginePool
+        from EvalCache import evalCache
+        instrumentation.add_gauge("startup ms", lambda: round((startup.elapsed("ready") or 0)*1000))
+        instrumentation.add_gauge("first frame ms", lambda: round((startup.elapsed("first frame") or 0)*1000))
+        instrumentation.add_gauge("events/s", lambda: round(instrumentation.rate("event"), 1))
+        instrumentation.add_gauge("repaints/s", lambda: round(instrumentation.rate("paint"), 1))
+        instrumentation.add_gauge("board pieces", lambda: self.board_scene.pool.allocations)
+        instrumentation.add_gauge("board pieces in use", lambda: self.board_scene.pool.stats()["used"])
+        instrumentation.add_gauge("sprite sizes", lambda: len(spriteCache.sizes))
+        instrumentation.add_gauge("engines", lambda: enginePool.stats()["engines"])
+        instrumentation.add_gauge("eval cache hits", lambda: evalCache.stats()["hits"])
+        instrumentation.add_gauge("tablebase probes", lambda: self.tablebases.stats()["probes"])
+        instrumentation.add_gauge("tablebase hit rate", lambda: round(self.tablebases.stats()["hit_rate"], 3))
+
+    def show_performance(self):
+        from DebugGUI import DebugGUI
+        if not hasattr(self, "debug_dock"):
+            self.debug_dock = DebugGUI()
+            self.addDockWidget(Qt.BottomDockWidgetArea, self.debug_dock)
+        self.debug_dock.show()
+        self.debug_dock.raise_()
+
     def new_game(self):
         self.board.reset()
+        self.history.reset()
         self.board_scene.setup_board(self.board)
         eventManager.newGame()
 
+    def open_pgn(self):
+        filepath, _ = QFileDialog.getOpenFileName(self, "Open PGN", "", "PGN files (*.pgn);;All files (*)")
+        if not filepath:
+            return
+        if not hasattr(self, "pgn_browser"):
+            from PgnBrowser import PgnBrowser
+            self.pgn_browser = PgnBrowser()
+            self.addDockWidget(Qt.BottomDockWidgetArea, self.pgn_browser)
+        self.pgn_browser.show()
+        self.pgn_browser.open_file(filepath)
+
+    def import_pgn(self):
+        filepath, _ = QFileDialog.getOpenFileName(self, "Import PGN", "", "PGN files (*.pgn);;All files (*)")
+        if filepath:
+            self.database_dock.import_file(filepath)
+
+    def show_engine_match(self):
+        from MatchGUI import MatchGUI
+        if not hasattr(self, "match_dock"):
+            self.match_dock = MatchGUI(self.prefs.engine_settings.engine_defs, self.tablebases)
+            self.addDockWidget(Qt.BottomDockWidgetArea, self.match_dock)
+        self.match_dock.show()
+        self.match_dock.raise_()
+
     # --- Events
 
+    @instrumentation.timed("board")
     def resizeEvent(self, event):
         scale = self.board_scene.fit_to_window_scale(self.board_view.size())
+        self.board_scene.set_view_scale(scale, self.board_view.devicePixelRatioF())
         transf = QTransform()
         transf.scale(scale, scale)
         self.board_view.setTransform(transf)
 
     def makeMoveEvent(self, move: chess.Move) -> None:
         # print(f"Chessboy: {move}")
-        if move in self.board.legal_moves:
-            san = self.board.san(move)
-            self.board.push(move)
-            self.board_scene.setup_board(self.board)
-            eventManager.onMove(move, san)
+        san = self.move_index.san(move)
+        if san is None:
+            promotions = self.move_index.promotions(move.from_square, move.to_square)
+            if not promotions:
+                return
+            move = chess.Move(move.from_square, move.to_square, self.ask_promotion(promotions))
+            san = self.move_index.san(move)
+            if san is None:
+                return
+        self.board.push(move)
+        self.history.push(self.board)
+        self.board_scene.make_move(self.board, move)
+        eventManager.onMove(move, san)
+
+    def jumpEvent(self, ply: int) -> None:
+        if not 0 <= ply <= len(self.history) or ply == len(self.board.move_stack):
+            return
+        self.history.goto(self.board, ply)
+        self.board_scene.sync_board(self.board)
+        eventManager.onJump(ply)
+
+    def scrub(self, steps: int) -> None:
+        # one ply back per wheel notch away from the user
+        ply = len(self.board.move_stack) - steps
+        self.jumpEvent(max(0, min(ply, len(self.history))))
+
+    def take_back(self) -> None:
+        ply = len(self.board.move_stack)
+        if ply == 0:
+            return
+        self.history.truncate(ply-1)
+        self.history.goto(self.board, ply-1)
+        self.board_scene.sync_board(self.board)
+        eventManager.onTakeback(ply-1)
+        eventManager.onJump(ply-1)
+
+    def loadGameEvent(self, game) -> None:
+        self.history.load(game.board().fen(), list(game.mainline_moves()))
+        self.history.goto(self.board, 0)
+        self.board_scene.setup_board(self.board)
+        eventManager.onGameLoaded(game)
+
+    def ask_promotion(self, promotions: list):
+        menu = QMenu(self)
+        for piece_type in sorted(promotions, reverse=True):
+            action = menu.addAction(chess.piece_name(piece_type).capitalize())
+            action.setData(piece_type)
+        chosen = menu.exec_(QCursor.pos())
+        return chosen.data() if chosen is not None else None
+
+    def pieceLiftedEvent(self, piece) -> None:
+        targets = self.move_index.targets(piece.old_square)
+        self.board_scene.highlights.set_squares(targets, QColor(90, 170, 90, 110))
+
+    def pieceDroppedEvent(self, piece) -> None:
+        self.board_scene.highlights.clear()
 
 def get_dark_mode():
     palette = QPalette()
@@ -174,7 +480,8 @@ def get_dark_mode():
     return palette
 
 if __name__=="__main__":
-    app = QApplication([])
+    multiprocessing.freeze_support() # database workers are spawned, also from a frozen build
+    app = QApplication(sys.argv) # --startup-report prints the startup timings
     app.setStyle("Fusion")
     window = MainWindow()
     sys.exit(app.exec())
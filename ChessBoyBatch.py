@@ -0,0 +1,274 @@
+# -------------------------------
+# ChessBoy Batch
+# -------------------------------
+# Headless analysis of PGN files with the configured engines.
+#
+#   python ChessBoyBatch.py games.pgn --engine Stockfish --depth 18 -o out.jsonl
+#
+# Positions are analysed in parallel by one engine per worker process.
+# Output is written game by game in input order, an interrupted run
+# continues where it stopped with --resume.
+
+import argparse, json, os, sys, time
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import chess
+import chess.engine
+import chess.pgn
+
+from EvalCache import CachedEval
+
+# ---- Worker processes
+
+_engine = None
+_engine_args = None
+
+def init_worker(filepath: str, options: dict, limit: chess.engine.Limit) -> None:
+    global _engine_args
+    _engine_args = (filepath, options, limit)
+    start_engine()
+    # the engine thread would keep the worker alive at shutdown
+    multiprocessing.util.Finalize(None, close_engine, exitpriority=10)
+
+def start_engine() -> None:
+    global _engine
+    filepath, options, limit = _engine_args
+    _engine = chess.engine.SimpleEngine.popen_uci(filepath)
+    if options:
+        _engine.configure(options)
+
+def close_engine() -> None:
+    if _engine is not None:
+        _engine.close()
+
+def analyse_position(fen: str) -> CachedEval:
+    """ The evaluation of one position, None if the engine gave no score. """
+    for attempt in range(2):
+        try:
+            info = _engine.analyse(chess.Board(fen), _engine_args[2])
+            return CachedEval.from_info(info) if "score" in info else None
+        except chess.engine.EngineTerminatedError:
+            if attempt:
+                raise
+            start_engine()
+
+# ---- Games
+
+class GameJob:
+    """ A game waiting for the evaluations of its positions.
+
+    A position the engine failed on keeps no evaluation, the game is
+    still written with the others and the first error.
+    """
+
+    def __init__(self, index: int, game: chess.pgn.Game) -> None:
+        self.index = index
+        self.game = game
+        self.nodes = list(game.mainline())
+        self.evals = [None]*len(self.nodes)
+        self.remaining = len(self.nodes)
+        self.error = None
+
+    def positions(self):
+        board = self.game.board()
+        for ply, node in enumerate(self.nodes):
+            board.push(node.move)
+            yield ply, board.fen()
+
+    def failed(self, ply: int, error: Exception) -> None:
+        if self.error is None:
+            self.error = f"ply {ply+1}: {type(error).__name__}: {error}"
+
+    def done(self) -> bool:
+        return self.remaining == 0
+
+    def to_json(self) -> str:
+        plies = []
+        for ply, (node, evaluation) in enumerate(zip(self.nodes, self.evals)):
+            evaluation = evaluation or CachedEval(0)
+            plies.append({ "ply": ply+1, "move": node.san(), "uci": node.move.uci(),
+                           "depth": evaluation.depth, "cp": evaluation.cp, "mate": evaluation.mate,
+                           "best": evaluation.pv[0] if evaluation.pv else None, "pv": evaluation.pv })
+        result = { "game": self.index, "headers": dict(self.game.headers), "plies": plies }
+        if self.error is not None:
+            result["error"] = self.error
+        return json.dumps(result) + "\n"
+
+    def to_pgn(self) -> str:
+        for node, evaluation in zip(self.nodes, self.evals):
+            if evaluation is not None:
+                node.set_eval(evaluation.score(), evaluation.depth)
+        if self.error is not None:
+            self.game.comment = f"{self.game.comment} Analysis failed at {self.error}".strip()
+        return str(self.game) + "\n\n"
+
+def stream_games(filepaths: list, skip: int = 0):
+    """ Yields (index, game) for all games of all files, one at a time. """
+    index = 0
+    for filepath in filepaths:
+        with open(filepath, encoding="utf-8-sig", errors="replace") as pgn:
+            while index < skip:
+                if not chess.pgn.skip_game(pgn):
+                    break
+                index += 1
+            else:
+                while True:
+                    game = chess.pgn.read_game(pgn)
+                    if game is None:
+                        break
+                    yield index, game
+                    index += 1
+
+# ---- Progress
+
+class Progress:
+    """ Games written so far and the output size after the last one.
+
+    Stored next to the output file, so a resumed run can drop a half
+    written game and skip everything before it.
+    """
+
+    def __init__(self, output: str) -> None:
+        self.path = output + ".progress"
+        self.games_done = 0
+        self.output_size = 0
+
+    def load(self) -> None:
+        if os.path.exists(self.path):
+            with open(self.path) as progressfile:
+                progress = json.load(progressfile)
+            self.games_done = progress["games_done"]
+            self.output_size = progress["output_size"]
+
+    def store(self) -> None:
+        with open(self.path + ".tmp", "w") as progressfile:
+            json.dump({ "games_done": self.games_done, "output_size": self.output_size }, progressfile)
+        os.replace(self.path + ".tmp", self.path)
+
+class Throughput:
+
+    def __init__(self, interval: float = 5.0) -> None:
+        self.interval = interval
+        self.start = self.last_report = time.perf_counter()
+        self.positions = 0
+        self.games = 0
+        self.failed = 0
+
+    def add(self, positions: int = 0, games: int = 0, failed: int = 0) -> None:
+        self.positions += positions
+        self.games += games
+        self.failed += failed
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            print(self.report(), file=sys.stderr)
+
+    def report(self) -> str:
+        elapsed = max(1e-9, time.perf_counter()-self.start)
+        failed = f", {self.failed} failed" if self.failed else ""
+        return f"{self.games} games{failed}, {self.positions} positions, {self.positions/elapsed:.1f} positions/s"
+
+# ---- Main
+
+def find_engine(args):
+    if args.engine_path:
+        return args.engine_path, dict()
+    from Preferences import EnginesSettings
+    engine_settings = EnginesSettings()
+    engine_settings.restore_settings(args.settings)
+    for engine_def in engine_settings.engine_defs:
+        if engine_def.name == args.engine:
+            return engine_def.filepath, engine_def.options
+    raise SystemExit(f"Engine {args.engine} is not configured in {args.settings}")
+
+def run(args) -> Throughput:
+    filepath, options = find_engine(args)
+    limit = chess.engine.Limit(depth=args.depth) if args.time is None else chess.engine.Limit(time=args.time)
+    as_pgn = args.format == "pgn" or (args.format is None and args.output.endswith(".pgn"))
+
+    progress = Progress(args.output)
+    if args.resume:
+        progress.load()
+        size = os.path.getsize(args.output) if os.path.exists(args.output) else -1
+        if size < progress.output_size:
+            print(f"{args.output} is missing or shorter than {progress.path} says, starting over", file=sys.stderr)
+            progress = Progress(args.output)
+    output = open(args.output, "r+" if progress.output_size else "w", encoding="utf-8")
+    output.seek(progress.output_size)
+    output.truncate()
+
+    workers = args.workers or os.cpu_count() or 1
+    max_in_flight = workers*4   # positions queued at the workers
+    max_games = workers*16      # games read ahead of the one written next
+    jobs = dict()
+    in_flight = dict()          # future -> (job, ply)
+    next_game = progress.games_done
+    throughput = Throughput()
+
+    def collect() -> None:
+        done, pending = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            job, ply = in_flight.pop(future)
+            if isinstance(future.exception(), BrokenProcessPool):
+                raise future.exception() # not the position's fault, nothing more can be written
+            if future.exception() is None:
+                job.evals[ply] = future.result()
+            else:
+                job.failed(ply, future.exception())
+            job.remaining -= 1
+        throughput.add(positions=len(done))
+        write_finished()
+
+    def write_finished() -> None:
+        # finished games are written in input order
+        nonlocal next_game
+        while next_game in jobs and jobs[next_game].done():
+            job = jobs.pop(next_game)
+            if job.error is not None:
+                print(f"Game {job.index+1}: analysis failed at {job.error}", file=sys.stderr)
+            output.write(job.to_pgn() if as_pgn else job.to_json())
+            output.flush()
+            next_game += 1
+            progress.games_done = next_game
+            progress.output_size = output.tell()
+            progress.store()
+            throughput.add(games=1, failed=job.error is not None)
+
+    try:
+        with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(filepath, options, limit)) as executor:
+            for index, game in stream_games(args.pgn, skip=progress.games_done):
+                job = jobs[index] = GameJob(index, game)
+                for ply, fen in job.positions():
+                    while len(in_flight) >= max_in_flight:
+                        collect()
+                    in_flight[executor.submit(analyse_position, fen)] = (job, ply)
+                write_finished()
+                while len(jobs) > max_games and in_flight:
+                    collect()
+            while in_flight:
+                collect()
+    except BrokenProcessPool:
+        output.close()
+        raise SystemExit(f"A worker process died. The first {progress.games_done} games are in {args.output}, "
+                         f"run again with --resume to continue from there.")
+    output.close()
+    return throughput
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse PGN files without the GUI.")
+    parser.add_argument("pgn", nargs="+", help="PGN files, read in the given order")
+    parser.add_argument("-o", "--output", required=True, help="output file, .pgn or .jsonl")
+    parser.add_argument("--format", choices=["pgn", "jsonl"], help="output format, default by extension")
+    parser.add_argument("--engine", default="Stockfish", help="engine name from the settings")
+    parser.add_argument("--engine-path", help="engine executable, instead of --engine")
+    parser.add_argument("--settings", default="settings/engines.json")
+    parser.add_argument("--depth", type=int, default=16)
+    parser.add_argument("--time", type=float, help="seconds per position, instead of --depth")
+    parser.add_argument("--workers", type=int, help="engine processes, default one per core")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted run")
+    return parser.parse_args(argv)
+
+if __name__=="__main__":
+    throughput = run(parse_args())
+    print(throughput.report(), file=sys.stderr)
@@ -1,19 +1,164 @@
+import threading, time, traceback, weakref
+from PyQt5 import sip
+from PyQt5.QtCore import QObject, QEvent, QCoreApplication
+from Instrumentation import instrumentation
+
+class Subscription:
+    """ A handler with its priority, bound methods held by weak reference. """
+
+    def __init__(self, eventHandler, priority: int = 0, weak: bool = True):
+        self.priority = priority
+        self.name = getattr(eventHandler, "__qualname__", repr(eventHandler))
+        if weak and hasattr(eventHandler, "__self__") and hasattr(eventHandler, "__func__"):
+            self.key = (id(eventHandler.__self__), eventHandler.__func__)
+            self.ref = weakref.WeakMethod(eventHandler)
+        else:
+            self.key = (id(eventHandler), None)
+            self.ref = lambda: eventHandler
+
+    def handler(self):
+        """ The handler, None once its object is gone or its widget deleted. """
+        eventHandler = self.ref()
+        owner = getattr(eventHandler, "__self__", None)
+        if isinstance(owner, sip.simplewrapper) and sip.isdeleted(owner):
+            return None
+        return eventHandler
+
+class PostedCall(QEvent):
+    """ An event call on its way to the GUI thread. """
+
+    TYPE = QEvent.Type(QEvent.registerEventType())
+
+    def __init__(self, event, call):
+        super().__init__(PostedCall.TYPE)
+        self.event = event
+        self.call = call
+
+class Dispatcher(QObject):
+    """ Runs posted event calls in the thread of the application.
+
+    Calls travel as QEvents, which Qt delivers in the thread the
+    dispatcher lives in, whichever thread posted them.
+    """
+
+    def customEvent(self, posted) -> None:
+        if posted.type() == PostedCall.TYPE:
+            posted.event.dispatch_posted(posted.call)
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def dispatcher():
+    """ The Dispatcher of the application, None without a QCoreApplication. """
+    global _dispatcher
+    app = QCoreApplication.instance()
+    if app is None:
+        return None
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = Dispatcher()
+            _dispatcher.moveToThread(app.thread())
+        return _dispatcher
+
+def in_gui_thread() -> bool:
+    # Qt only runs a GUI from the main thread
+    return threading.get_ident() == threading.main_thread().ident
 
 class Event:
-    def __init__(self):
-        self._eventHandlers = []
+    """ An event handlers can subscribe to with += and leave with -=.
+
+    Handlers run by priority, highest first, then in subscription order.
+    An exception in one handler is printed and the others still run.
+    Bound methods are held weakly, a handler whose object is gone or
+    whose widget was deleted is dropped.
+
+    Handlers always run in the GUI thread: calls from other threads are
+    posted there. A queued event is posted from the GUI thread as well,
+    so a slow handler never holds up the caller. A coalescing event
+    keeps only the latest pending call, for events where only the
+    newest state matters.
+
+    With instrumentation enabled, every handler call is timed as
+    "event name: handler".
+    """
+
+    def __init__(self, queued: bool = False, coalesce: bool = False):
+        self.name = "event" # set by EventManager
+        self.queued = queued or coalesce
+        self.coalesce = coalesce
+        self.subscriptions = ()
+        self.lock = threading.Lock()
+        self.latest = None     # pending call of a coalescing event
+        self.scheduled = False
+
+    def subscribe(self, eventHandler, priority: int = 0, weak: bool = True) -> None:
+        subscription = Subscription(eventHandler, priority, weak)
+        with self.lock:
+            subscriptions = self.subscriptions + (subscription,)
+            # sorted() is stable, equal priorities keep their order
+            self.subscriptions = tuple(sorted(subscriptions, key=lambda entry: -entry.priority))
+
+    def unsubscribe(self, eventHandler) -> None:
+        key = Subscription(eventHandler).key
+        with self.lock:
+            for subscription in self.subscriptions:
+                if subscription.key == key:
+                    self.subscriptions = tuple(entry for entry in self.subscriptions if entry is not subscription)
+                    return
+        raise ValueError(f"{eventHandler} is not subscribed")
 
     def __iadd__(self, eventHandler):
-        self._eventHandlers.append(eventHandler)
+        self.subscribe(eventHandler)
         return self
 
     def __isub__(self, eventHandler):
-        self._eventHandlers.remove(eventHandler)
+        self.unsubscribe(eventHandler)
         return self
 
     def __call__(self, *args, **keywargs):
-        for eventHandler in self._eventHandlers:
-            eventHandler(*args, **keywargs)
+        if not self.queued and in_gui_thread():
+            self.fire(args, keywargs)
+        else:
+            self.post(args, keywargs)
+
+    def post(self, args: tuple, keywargs: dict) -> None:
+        target = dispatcher()
+        if target is None:
+            self.fire(args, keywargs)
+        elif self.coalesce:
+            with self.lock:
+                self.latest = (args, keywargs)
+                if self.scheduled:
+                    return
+                self.scheduled = True
+            QCoreApplication.postEvent(target, PostedCall(self, None))
+        else:
+            QCoreApplication.postEvent(target, PostedCall(self, (args, keywargs)))
+
+    def dispatch_posted(self, call) -> None:
+        if call is None:
+            with self.lock:
+                call, self.latest, self.scheduled = self.latest, None, False
+        self.fire(*call)
+
+    def fire(self, args: tuple, keywargs: dict) -> None:
+        dead = []
+        timed = instrumentation.enabled
+        for subscription in self.subscriptions:
+            eventHandler = subscription.handler()
+            if eventHandler is None:
+                dead.append(subscription)
+                continue
+            start = time.perf_counter() if timed else 0.0
+            try:
+                eventHandler(*args, **keywargs)
+            except Exception:
+                traceback.print_exc()
+            if timed:
+                instrumentation.record(f"{self.name}: {subscription.name}", "event", start, time.perf_counter())
+        if dead:
+            with self.lock:
+                self.subscriptions = tuple(entry for entry in self.subscriptions if entry not in dead)
 
 class EventManager:
     """ My Chess Event Manager.
@@ -41,12 +186,23 @@ class EventManager:
         self.name = name
         self.newGame = Event()
         self.onPieceLifted = Event()
+        self.onPieceDropped = Event()
         self.onMoveTry = Event() # trying a move
         self.onMove = Event()   # move is successful
+        self.onJumpTry = Event() # trying to jump to a ply of the game
+        self.onJump = Event()   # board shows another ply of the game
+        self.onTakeback = Event() # moves after a ply were taken back, onJump follows
+        self.onGameLoadTry = Event() # trying to load a chess.pgn.Game
+        self.onGameLoaded = Event() # board shows the start of a loaded game
         self.newPieceOnBoard = Event() # a new piece was created
         self.getEngineList = Event() # returns a list of engines
-        self.timeOutWhite = Event()
-        self.timeOutBlack = Event()
+        self.onEngineInfo = Event() # an engine binary was probed, called with its EngineDef and EngineInfo
+        self.onAnalysis = Event(coalesce=True) # newest live analysis snapshot
+        self.timeOutWhite = Event(queued=True)
+        self.timeOutBlack = Event(queued=True)
+        for name, event in vars(self).items():
+            if isinstance(event, Event):
+                event.name = name
 
 
 eventManager = EventManager()
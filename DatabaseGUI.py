@@ -0,0 +1,268 @@
+import sqlite3, time
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, pyqtSignal
+from PyQt5.QtWidgets import QDockWidget, QWidget, QVBoxLayout, QHBoxLayout, QSplitter, \
+                            QTableView, QHeaderView, QAbstractItemView, QLabel, \
+                            QComboBox, QPushButton
+import chess
+from ChessEventManager import eventManager
+from GameDatabase import gameDatabase
+from PositionSearch import Query, position_file
+
+class MoveStatsModel(QAbstractTableModel):
+    """ The moves played from the current position with their results. """
+
+    headers = ("Move", "Games", "White", "Draw", "Black")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = []
+        self.sans = []
+
+    def set_stats(self, board: chess.Board, stats: list) -> None:
+        self.beginResetModel()
+        self.stats = stats
+        self.sans = [ board.san(stat.move) if board.is_legal(stat.move) else stat.move.uci()
+                      for stat in stats ]
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.stats)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        stat = self.stats[index.row()]
+        column = index.column()
+        if column == 0:
+            return self.sans[index.row()]
+        if column == 1:
+            return str(stat.games)
+        wins = (stat.white, stat.draws, stat.black)[column-2]
+        return f"{100*wins/stat.games:.0f}%"
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or orientation != Qt.Horizontal:
+            return None
+        return self.headers[section]
+
+class GamesModel(QAbstractTableModel):
+    """ Games that reached the current position. """
+
+    headers = ("White", "Black", "Result", "Date", "Event")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.games = []
+
+    def set_games(self, games: list) -> None:
+        self.beginResetModel()
+        self.games = games
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.games)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        game = self.games[index.row()]
+        return (game.white, game.black, game.result, game.date, game.event)[index.column()]
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or orientation != Qt.Horizontal:
+            return None
+        return self.headers[section]
+
+class DatabaseGUI(QDockWidget):
+    """ Statistics and games of the game database for the board position.
+
+    Queries run in a worker thread whenever the position changes. Each
+    query carries a request id, queries and results for positions that
+    were left in the meantime are dropped. Imports and pattern searches
+    run in a second thread, so they never hold up the position queries.
+    """
+
+    templates = { "Same material": dict(material=True),
+                  "Same pawns": dict(material=False, pawns=True),
+                  "Same material and pawns": dict(material=True, pawns=True),
+                  "Contains these pieces": dict(material=False, pieces=True) }
+
+    resultsReady = pyqtSignal(int, object, object, object, float)
+    statusMessage = pyqtSignal(str)
+    importDone = pyqtSignal(str)
+    searchReady = pyqtSignal(object, str)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setAllowedAreas(Qt.LeftDockWidgetArea | Qt.RightDockWidgetArea)
+        self.setMinimumSize(300, 300)
+        self.setWindowTitle("Database")
+        self.database = gameDatabase
+        self.positions = position_file(gameDatabase)
+        self.board = None
+        self.request_id = 0
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="GameDatabase")
+        self.jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix="GameDatabaseJobs")
+
+        self.resultsReady.connect(self.results_ready)
+        self.statusMessage.connect(self.status_message)
+        self.importDone.connect(self.import_done)
+        self.searchReady.connect(self.search_ready)
+        eventManager.onMove += self.position_changed
+        eventManager.onJump += self.position_changed
+        eventManager.onGameLoaded += self.position_changed
+        eventManager.newGame += self.position_changed
+
+        self.statsModel = MoveStatsModel()
+        self.statsTable = self.init_table(self.statsModel)
+        self.statsTable.clicked.connect(self.move_clicked)
+        self.gamesModel = GamesModel()
+        self.gamesTable = self.init_table(self.gamesModel)
+        self.gamesTable.doubleClicked.connect(self.game_selected)
+
+        searchRow = QWidget()
+        searchRow.setLayout(QHBoxLayout())
+        searchRow.layout().setContentsMargins(0, 0, 0, 0)
+        self.templateComboBox = QComboBox()
+        self.templateComboBox.addItems(self.templates)
+        searchRow.layout().addWidget(self.templateComboBox)
+        self.searchButton = QPushButton("Find")
+        self.searchButton.clicked.connect(self.search)
+        searchRow.layout().addWidget(self.searchButton)
+
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(self.statsTable)
+        splitter.addWidget(self.gamesTable)
+        self.status = QLabel()
+        self.mainWidget = QWidget()
+        self.mainWidget.setLayout(QVBoxLayout())
+        self.mainWidget.layout().addWidget(searchRow)
+        self.mainWidget.layout().addWidget(splitter)
+        self.mainWidget.layout().addWidget(self.status)
+        self.setWidget(self.mainWidget)
+
+    def init_table(self, model: QAbstractTableModel) -> QTableView:
+        table = QTableView()
+        table.setModel(model)
+        table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        table.setSelectionMode(QAbstractItemView.SingleSelection)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.setShowGrid(False)
+        table.verticalHeader().hide()
+        table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        return table
+
+    def set_board(self, board: chess.Board) -> None:
+        self.board = board
+
+    def status_message(self, message: str) -> None:
+        self.status.setText(message)
+
+    # ---- Queries
+
+    def position_changed(self, *args) -> None:
+        if self.board is None:
+            return
+        self.request_id += 1
+        self.worker.submit(self.query, self.request_id, self.board.copy(stack=False))
+
+    def query(self, request_id: int, board: chess.Board) -> None:
+        # Runs in the worker thread
+        if request_id != self.request_id:
+            return
+        start = time.perf_counter()
+        try:
+            stats = self.database.move_stats(board)
+            games = self.database.games_reaching(board)
+        except sqlite3.Error as error:
+            self.statusMessage.emit(f"Database error: {error}")
+            return
+        self.resultsReady.emit(request_id, board, stats, games, time.perf_counter()-start)
+
+    def results_ready(self, request_id: int, board: chess.Board, stats: list, games: list, elapsed: float) -> None:
+        if request_id != self.request_id:
+            return
+        self.statsModel.set_stats(board, stats)
+        self.gamesModel.set_games(games)
+        total = sum(stat.games for stat in stats) or len(games)
+        self.status.setText(f"{total} games, {elapsed*1000:.1f} ms")
+
+    def move_clicked(self, index: QModelIndex) -> None:
+        if not index.isValid():
+            return
+        eventManager.onMoveTry(self.statsModel.stats[index.row()].move)
+
+    def game_selected(self, index: QModelIndex) -> None:
+        if not index.isValid():
+            return
+        game = self.database.game(self.gamesModel.games[index.row()].id)
+        if game is not None:
+            eventManager.onGameLoadTry(game)
+
+    # ---- Import
+
+    def import_file(self, filepath: str) -> None:
+        self.status.setText(f"Importing {filepath}...")
+        self.jobs.submit(self.import_games, filepath)
+
+    def import_games(self, filepath: str) -> None:
+        # Runs in the import thread
+        try:
+            start = time.perf_counter()
+            imported = self.database.import_pgn(filepath,
+                progress=lambda imported: self.statusMessage.emit(f"Importing {filepath}: {imported} games"))
+            self.positions.update(self.database,
+                progress=lambda added: self.statusMessage.emit(f"Indexing {added} positions"))
+            elapsed = time.perf_counter()-start
+            self.importDone.emit(f"Imported {imported} games, {imported/max(elapsed, 1e-9):.0f} games/s")
+        except OSError as error:
+            self.statusMessage.emit(f"Can't import {filepath}: {error.strerror}")
+        except sqlite3.Error as error:
+            self.statusMessage.emit(f"Database error: {error}")
+
+    def import_done(self, message: str) -> None:
+        self.status.setText(message)
+        self.position_changed()
+
+    # ---- Pattern search
+
+    def search(self) -> None:
+        """ Finds the games with positions like the board's, by the chosen template. """
+        if self.board is None:
+            return
+        template = self.templateComboBox.currentText()
+        query = Query.from_board(self.board, **self.templates[template])
+        self.status.setText(f"Searching: {template}...")
+        self.jobs.submit(self.search_games, query)
+
+    def search_games(self, query: Query) -> None:
+        # Runs in the jobs thread
+        try:
+            start = time.perf_counter()
+            self.positions.update(self.database)
+            indices = self.positions.search(query)
+            game_ids = self.positions.games(indices)
+            games = self.database.game_rows([ int(game_id) for game_id in game_ids[-100:][::-1] ])
+            elapsed = time.perf_counter()-start
+        except (OSError, sqlite3.Error) as error:
+            self.statusMessage.emit(f"Search failed: {error}")
+            return
+        self.searchReady.emit(games, f"{len(indices)} positions in {len(game_ids)} games, {elapsed*1000:.0f} ms")
+
+    def search_ready(self, games: list, message: str) -> None:
+        self.gamesModel.set_games(games)
+        self.status.setText(message)
+
+    def shutdown(self) -> None:
+        self.request_id += 1
+        self.worker.shutdown(wait=False)
+        self.jobs.shutdown(wait=False)
+        self.positions.close()
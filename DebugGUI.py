@@ -0,0 +1,129 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer
+from PyQt5.QtWidgets import QDockWidget, QWidget, QVBoxLayout, QHBoxLayout, QTableView, QHeaderView, \
+                            QAbstractItemView, QLabel, QCheckBox, QPushButton, QFileDialog
+from Instrumentation import instrumentation
+
+def format_ms(seconds: float) -> str:
+    return f"{seconds*1000:.2f}"
+
+class LatencyModel(QAbstractTableModel):
+    """ One row per instrumented span name, from Instrumentation.summary(). """
+
+    headers = ("Span", "Count", "Per s", "p50 ms", "p99 ms", "Max ms")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rows = []
+
+    def set_rows(self, rows: list) -> None:
+        self.beginResetModel()
+        self.rows = [ (name, str(count), f"{rate:.1f}", format_ms(p50), format_ms(p99), format_ms(longest))
+                      for name, category, count, rate, p50, p99, longest in rows ]
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if role == Qt.TextAlignmentRole and index.column() > 0:
+            return Qt.AlignRight | Qt.AlignVCenter
+        if role != Qt.DisplayRole:
+            return None
+        return self.rows[index.row()][index.column()]
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or orientation != Qt.Horizontal:
+            return None
+        return self.headers[section]
+
+class DebugGUI(QDockWidget):
+    """ Live latencies of the instrumented hot paths.
+
+    Recording is switched on here and costs nothing while it is off.
+    The table refreshes twice a second while the dock is visible, the
+    trace of everything recorded so far can be saved for chrome://tracing.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setAllowedAreas(Qt.LeftDockWidgetArea | Qt.RightDockWidgetArea | Qt.BottomDockWidgetArea)
+        self.setMinimumSize(400, 200)
+        self.setWindowTitle("Performance")
+        self.timer = QTimer(self)
+        self.timer.setInterval(500)
+        self.timer.timeout.connect(self.refresh)
+
+        controls = QWidget()
+        controls.setLayout(QHBoxLayout())
+        controls.layout().setContentsMargins(0, 0, 0, 0)
+        self.recordCheckBox = QCheckBox("Record")
+        self.recordCheckBox.setChecked(instrumentation.enabled)
+        self.recordCheckBox.toggled.connect(self.record_toggled)
+        controls.layout().addWidget(self.recordCheckBox)
+        controls.layout().addStretch(1)
+        self.resetButton = QPushButton("Reset")
+        self.resetButton.clicked.connect(self.reset)
+        controls.layout().addWidget(self.resetButton)
+        self.exportButton = QPushButton("Export Trace...")
+        self.exportButton.clicked.connect(self.export_trace)
+        controls.layout().addWidget(self.exportButton)
+
+        self.model = LatencyModel()
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionMode(QAbstractItemView.NoSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setShowGrid(False)
+        self.table.verticalHeader().hide()
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.counters = QLabel()
+        self.counters.setWordWrap(True)
+        self.counters.setTextInteractionFlags(Qt.TextSelectableByMouse)
+
+        self.mainWidget = QWidget()
+        self.mainWidget.setLayout(QVBoxLayout())
+        self.mainWidget.layout().addWidget(controls)
+        self.mainWidget.layout().addWidget(self.table)
+        self.mainWidget.layout().addWidget(self.counters)
+        self.setWidget(self.mainWidget)
+
+    def record_toggled(self, checked: bool) -> None:
+        instrumentation.enable(checked)
+        self.refresh()
+
+    def reset(self) -> None:
+        instrumentation.reset()
+        self.refresh()
+
+    def refresh(self) -> None:
+        self.model.set_rows(instrumentation.summary())
+        self.counters.setText(", ".join(f"{name}: {value}" for name, value in
+                                        sorted(instrumentation.read_counters().items())))
+
+    def export_trace(self) -> None:
+        filepath, _ = QFileDialog.getSaveFileName(self, "Export Trace", "chessboy-trace.json",
+                                                  "Chrome trace (*.json);;All files (*)")
+        if filepath:
+            self.save_trace(filepath)
+
+    def save_trace(self, filepath: str) -> None:
+        try:
+            spans = instrumentation.export_trace(filepath)
+        except OSError as error:
+            self.counters.setText(f"Export failed: {error}")
+            return
+        self.counters.setText(f"{spans} spans written to {filepath}")
+
+    def showEvent(self, event) -> None:
+        super().showEvent(event)
+        self.refresh()
+        self.timer.start()
+
+    def hideEvent(self, event) -> None:
+        super().hideEvent(event)
+        self.timer.stop()
@@ -0,0 +1,173 @@
+# -------------------------------
+# EngineInfo
+# -------------------------------
+
+import asyncio, json, os, threading
+from dataclasses import dataclass, field, asdict
+import chess.engine
+
+@dataclass
+class EngineInfo:
+    """ What an engine told about itself in its UCI handshake.
+
+    `size` and `mtime_ns` fingerprint the binary it came from, the
+    entry is only used while they still match the file.
+    """
+    size: int
+    mtime_ns: int
+    id: dict = field(default_factory=dict)      # "name", "author"
+    options: list = field(default_factory=list) # dicts with the fields of chess.engine.Option
+    variants: list = field(default_factory=list)
+    error: str = None # the handshake failed, probed again once the binary changes
+
+    def name(self) -> str:
+        return self.id.get("name", "")
+
+    def author(self) -> str:
+        return self.id.get("author", "")
+
+    def summary(self) -> str:
+        """ Like "Stockfish 15 by T. Romstad, M. Costalba, J. Kiiski, G. Linscott". """
+        if self.error is not None:
+            return f"Not a working UCI engine: {self.error}"
+        text = self.name() or "Unnamed engine"
+        return f"{text} by {self.author()}" if self.author() else text
+
+    def option(self, name: str):
+        """ The option dict of `name`, case insensitive like UCI, or None. """
+        for option in self.options:
+            if option["name"].lower() == name.lower():
+                return option
+        return None
+
+def fingerprint(filepath: str):
+    """ (size, mtime in ns) of an engine binary, None if there is no such file. """
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+def option_dict(option: chess.engine.Option) -> dict:
+    return { "name": option.name, "type": option.type, "default": option.default,
+             "min": option.min, "max": option.max, "var": list(option.var or []) }
+
+def supported_variants(options: dict) -> list:
+    variants = [ "chess" ]
+    variant_option = options.get("UCI_Variant")
+    if variant_option is not None:
+        variants += [ variant for variant in variant_option.var if variant not in variants ]
+    if "UCI_Chess960" in options and "chess960" not in variants:
+        variants.append("chess960")
+    return variants
+
+class EngineInfoCache:
+    """ The UCI id, options and variants of every engine binary, kept on disk.
+
+    Starting an engine with a large net for its handshake takes
+    seconds, so the result is stored per executable path and only
+    probed again when the size or modification time of the binary
+    changes. refresh() probes all new or changed engines in parallel;
+    it has to run on an event loop, like engineThread's. Everything
+    else is safe to call from the GUI thread and never starts an engine.
+    """
+
+    def __init__(self, path: str = None, workers: int = 4, timeout: float = 30.0) -> None:
+        self.path = path
+        self.workers = workers
+        self.timeout = timeout
+        self.entries = None # absolute path -> EngineInfo, read on first use
+        self.lock = threading.Lock()
+        self.probes = 0
+        self.probing = set() # keys of the engines a refresh is probing right now
+
+    def key(self, engine_def) -> str:
+        return os.path.abspath(engine_def.filepath)
+
+    def load(self) -> dict:
+        if self.entries is None:
+            self.entries = dict()
+            if self.path is not None and os.path.exists(self.path):
+                try:
+                    with open(self.path) as cachefile:
+                        for filepath, data in json.load(cachefile).items():
+                            self.entries[filepath] = EngineInfo(**data)
+                except (OSError, ValueError, TypeError) as error:
+                    print(f"Ignoring the engine info cache {self.path}: {error}")
+        return self.entries
+
+    def get(self, engine_def):
+        """ The cached EngineInfo of `engine_def`, None if its binary is new or changed. """
+        current = fingerprint(engine_def.filepath)
+        with self.lock:
+            info = self.load().get(self.key(engine_def))
+        if info is None or current != (info.size, info.mtime_ns):
+            return None
+        return info
+
+    def stale(self, engine_defs: list) -> list:
+        """ The engines to probe: binaries that exist but aren't cached as they are now. """
+        return [ engine_def for engine_def in engine_defs
+                 if fingerprint(engine_def.filepath) is not None and self.get(engine_def) is None
+                 and self.key(engine_def) not in self.probing ]
+
+    async def probe(self, engine_def) -> EngineInfo:
+        """ Starts the engine, reads its handshake and quits it. """
+        size, mtime_ns = fingerprint(engine_def.filepath) or (0, 0)
+        self.probes += 1
+        transport = None
+        try:
+            transport, protocol = await asyncio.wait_for(chess.engine.popen_uci(engine_def.filepath), self.timeout)
+            options = dict(protocol.options)
+            info = EngineInfo(size, mtime_ns, dict(protocol.id),
+                              [ option_dict(option) for option in options.values() ],
+                              supported_variants(options))
+            try:
+                await asyncio.wait_for(protocol.quit(), 2)
+            except (asyncio.TimeoutError, chess.engine.EngineError):
+                transport.kill()
+            return info
+        except (OSError, asyncio.TimeoutError, chess.engine.EngineError) as error:
+            if transport is not None:
+                transport.kill()
+            return EngineInfo(size, mtime_ns, error=str(error) or type(error).__name__)
+
+    async def refresh(self, engine_defs: list, probed=None) -> dict:
+        """ Probes the stale engines, at most `workers` at a time.
+
+        Runs again whenever the engine list may have changed; engines an
+        earlier refresh is still probing are left to it.
+        `probed(engine_def, info)` is called for every finished probe.
+        Returns the new infos by engine name and saves the cache.
+        """
+        semaphore = asyncio.Semaphore(self.workers)
+        async def probe_one(engine_def):
+            async with semaphore:
+                try:
+                    info = await self.probe(engine_def)
+                finally:
+                    self.probing.discard(self.key(engine_def))
+            with self.lock:
+                self.load()[self.key(engine_def)] = info
+            if probed is not None:
+                probed(engine_def, info)
+            return engine_def.name, info
+        stale = self.stale(engine_defs)
+        self.probing.update(self.key(engine_def) for engine_def in stale)
+        results = dict(await asyncio.gather(*[ probe_one(engine_def) for engine_def in stale ]))
+        if results:
+            self.save()
+        return results
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self.lock:
+            data = { filepath: asdict(info) for filepath, info in self.load().items() }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "w") as cachefile:
+            json.dump(data, cachefile, indent=2)
+
+engineInfoCache = EngineInfoCache("settings/engineinfo.json")
@@ -0,0 +1,154 @@
+# -------------------------------
+# EnginePlayer
+# -------------------------------
+
+import asyncio, concurrent.futures, threading
+import chess
+import chess.engine
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from ChessEventManager import eventManager
+from EnginePool import enginePool
+
+class EngineThread:
+    """ Runs one asyncio event loop for all engine I/O in a daemon thread.
+
+    Coroutines are handed over with submit(), which returns a
+    concurrent.futures.Future. The GUI thread never waits on it,
+    results come back through Qt signals.
+    """
+
+    def __init__(self) -> None:
+        self.loop = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.run, name="EngineThread", daemon=True)
+                self.thread.start()
+        return self.loop
+
+    def run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.start())
+
+    def loop_call(self, callback, *args) -> None:
+        """ Calls a plain function on the engine loop. """
+        self.start().call_soon_threadsafe(callback, *args)
+
+    def stop(self) -> None:
+        with self.lock:
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                self.thread.join(timeout=5)
+                self.loop = None
+                self.thread = None
+
+engineThread = EngineThread()
+
+class EnginePlayers(QObject):
+    """ Lets engines play the sides chosen in the player settings.
+
+    Whenever the turn passes to an engine side, the position is sent to
+    the engine thread. The answer is posted back through onMoveTry,
+    unless the position changed in the meantime. While the position is
+    in the opening books, a book move is played instead, and once the
+    tablebases cover it the best tablebase move.
+    """
+
+    moveFound = pyqtSignal(object, int)
+    engineError = pyqtSignal(str)
+
+    def __init__(self, board: chess.Board, engine_defs: list, books=None, tablebases=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.board = board
+        self.engine_defs = engine_defs
+        self.books = books
+        self.tablebases = tablebases
+        self.players = { chess.WHITE: "Player", chess.BLACK: "Player" }
+        self.limit = chess.engine.Limit(time=1.0)
+        self.request_id = 0     # bumped on every position change, stale answers are dropped
+
+        self.moveFound.connect(self.move_found)
+        self.engineError.connect(self.engine_error)
+        eventManager.onMove += self.position_changed
+        eventManager.onJump += self.position_changed
+        eventManager.newGame += self.new_game
+        eventManager.onGameLoaded += self.new_game
+
+    def set_player(self, color: chess.Color, name: str) -> None:
+        self.players[color] = name
+        self.position_changed()
+
+    def engine_def(self, name: str):
+        for engine_def in self.engine_defs:
+            if engine_def.name == name:
+                return engine_def
+        return None
+
+    def new_game(self, *args) -> None:
+        engineThread.loop_call(enginePool.new_game)
+        self.position_changed()
+
+    def position_changed(self, *args) -> None:
+        self.request_id += 1
+        if self.board.is_game_over():
+            return
+        name = self.players[self.board.turn]
+        if name == "Player":
+            return
+        engine_def = self.engine_def(name)
+        if engine_def is None:
+            self.engine_error(f"Engine {name} is not configured")
+            return
+        if self.books is not None:
+            move = self.books.choose(self.board)
+            if move is not None:
+                # posted, so the onMove handlers of this move all run first
+                request_id = self.request_id
+                QTimer.singleShot(0, lambda: self.move_found(move, request_id))
+                return
+        if self.tablebases is not None and self.tablebases.covers(self.board):
+            future = self.tablebases.submit(self.tablebases.best_move, self.board.copy())
+        else:
+            future = engineThread.submit(
+                self.play(engine_def, self.board.copy(), self.limit))
+        request_id = self.request_id
+        future.add_done_callback(lambda future: self.play_done(future, request_id))
+
+    async def play(self, engine_def, board: chess.Board, limit: chess.engine.Limit):
+        result = await enginePool.play(engine_def, board, limit, engine_def.options)
+        return result.move
+
+    def play_done(self, future, request_id: int) -> None:
+        # Runs in the engine or tablebase thread, signals are queued to the GUI thread
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            self.engineError.emit(f"{type(error).__name__}: {error}")
+        elif future.result() is None:
+            self.engineError.emit("No move found")
+        else:
+            self.moveFound.emit(future.result(), request_id)
+
+    def move_found(self, move: chess.Move, request_id: int) -> None:
+        if request_id == self.request_id:
+            eventManager.onMoveTry(move)
+
+    def engine_error(self, message: str) -> None:
+        print(f"EnginePlayers: {message}")
+
+    def shutdown(self) -> None:
+        self.request_id += 1
+        if engineThread.loop is not None:
+            try:
+                engineThread.submit(enginePool.close()).result(timeout=5)
+            except concurrent.futures.TimeoutError:
+                pass
@@ -0,0 +1,220 @@
+# -------------------------------
+# EnginePool
+# -------------------------------
+
+import asyncio, os, time
+from contextlib import asynccontextmanager
+import chess
+import chess.engine
+
+from EvalCache import evalCache, engine_id
+
+class PooledEngine:
+    """ One running engine process and what it was configured with. """
+
+    def __init__(self, key: tuple, engine_def, options: dict) -> None:
+        self.key = key
+        self.engine_def = engine_def
+        self.options = options
+        self.transport = None
+        self.protocol = None
+        self.busy = False
+        self.last_used = time.monotonic()
+
+    def alive(self) -> bool:
+        return self.protocol is not None and not self.protocol.returncode.done()
+
+    async def start(self) -> None:
+        self.transport, self.protocol = await chess.engine.popen_uci(self.engine_def.filepath)
+        if self.options:
+            await self.protocol.configure(self.options)
+
+    async def close(self) -> None:
+        if not self.alive():
+            return
+        try:
+            await asyncio.wait_for(self.protocol.quit(), 2)
+        except (asyncio.TimeoutError, chess.engine.EngineError):
+            self.transport.kill()
+
+def max_engine_instances(hash_mb: int = 16, overhead_mb: int = 64) -> int:
+    """ One engine per core, fewer if the free memory can't hold their hash tables. """
+    limit = os.cpu_count() or 1
+    try:
+        available = os.sysconf("SC_PAGE_SIZE")*os.sysconf("SC_AVPHYS_PAGES")
+        limit = min(limit, available // ((hash_mb+overhead_mb)*1024*1024))
+    except (AttributeError, ValueError, OSError):
+        pass # no sysconf on Windows, the core count has to do
+    return max(1, limit)
+
+class EnginePool:
+    """ Keeps engine processes warm between moves, games and analysis.
+
+    Engines are keyed by their EngineDef and option set. Use
+
+        async with enginePool.engine(engine_def) as engine:
+            await engine.play(...)
+
+    or the play()/analyse() shortcuts, which also restart a crashed engine
+    and retry once. analyse() answers from the evaluation cache when it
+    already holds a deep enough result: as deep as a depth limit asks
+    for, or for a time or node limit as deep as the last search with the
+    same limit got. MultiPV calls and the open ended searches of
+    LiveAnalysis aren't cached. All methods must run on the loop of the
+    engine thread.
+    """
+
+    def __init__(self, max_instances: int = None, idle_timeout: float = 300.0, eval_cache=None) -> None:
+        self.max_instances = max_instances or max_engine_instances()
+        self.idle_timeout = idle_timeout
+        self.eval_cache = eval_cache
+        self.reached_depth = dict() # (engine id, time, nodes) -> depth the last analyse() with that limit reached
+        self.engines = [] # all PooledEngines, busy or idle
+        self.game = object() # engines see a new object as a new game
+        self.changed = None
+        self.reaper = None
+        self.spawned = 0
+
+    def key(self, engine_def, options: dict) -> tuple:
+        return (engine_def.name, engine_def.filepath, frozenset((options or dict()).items()))
+
+    def condition(self) -> asyncio.Condition:
+        if self.changed is None:
+            self.changed = asyncio.Condition()
+            self.reaper = asyncio.ensure_future(self.reap_idle())
+        return self.changed
+
+    async def acquire(self, engine_def, options: dict = None) -> PooledEngine:
+        options = dict(options or dict())
+        key = self.key(engine_def, options)
+        changed = self.condition()
+        async with changed:
+            while True:
+                pooled = self.find_idle(key)
+                if pooled is None and len(self.engines) >= self.max_instances:
+                    # make room by retiring an idle engine of another kind
+                    pooled = self.find_idle(None)
+                    if pooled is not None:
+                        self.engines.remove(pooled)
+                        await pooled.close()
+                        pooled = None
+                if pooled is not None or len(self.engines) < self.max_instances:
+                    break
+                await changed.wait()
+            if pooled is None:
+                pooled = PooledEngine(key, engine_def, options)
+                self.engines.append(pooled)
+            pooled.busy = True
+        if not pooled.alive():
+            try:
+                await pooled.start()
+                self.spawned += 1
+            except BaseException:
+                await self.discard(pooled)
+                raise
+        return pooled
+
+    def find_idle(self, key):
+        for pooled in self.engines:
+            if not pooled.busy and (key is None or pooled.key == key):
+                return pooled
+        return None
+
+    async def release(self, pooled: PooledEngine) -> None:
+        async with self.condition():
+            pooled.busy = False
+            pooled.last_used = time.monotonic()
+            self.changed.notify_all()
+
+    async def discard(self, pooled: PooledEngine) -> None:
+        async with self.condition():
+            if pooled in self.engines:
+                self.engines.remove(pooled)
+            self.changed.notify_all()
+        await pooled.close()
+
+    @asynccontextmanager
+    async def engine(self, engine_def, options: dict = None):
+        pooled = await self.acquire(engine_def, options)
+        try:
+            yield pooled.protocol
+        except chess.engine.EngineTerminatedError:
+            await self.discard(pooled)
+            raise
+        except BaseException:
+            await self.release(pooled)
+            raise
+        else:
+            await self.release(pooled)
+
+    async def run(self, engine_def, options: dict, command):
+        """ Runs `command(protocol)`, on a fresh engine again if the first one crashed. """
+        for attempt in range(2):
+            try:
+                async with self.engine(engine_def, options) as engine:
+                    return await command(engine)
+            except chess.engine.EngineTerminatedError:
+                if attempt:
+                    raise
+
+    async def play(self, engine_def, board: chess.Board, limit: chess.engine.Limit, options: dict = None):
+        return await self.run(engine_def, options,
+            lambda engine: engine.play(board, limit, game=self.game))
+
+    def cached_depth(self, engine_def, limit: chess.engine.Limit):
+        """ How deep a cached result has to be to stand in for a search with `limit`, None if it can't. """
+        if limit.depth is not None:
+            return limit.depth
+        if limit.mate is not None or limit.white_clock is not None or limit.black_clock is not None:
+            return None
+        if limit.time is None and limit.nodes is None:
+            return None
+        return self.reached_depth.get((engine_id(engine_def), limit.time, limit.nodes))
+
+    async def analyse(self, engine_def, board: chess.Board, limit: chess.engine.Limit, options: dict = None, **kwargs):
+        # MultiPV results are lists, only single lines are cached
+        cacheable = self.eval_cache is not None and kwargs.get("multipv") is None
+        depth = self.cached_depth(engine_def, limit) if cacheable else None
+        if depth is not None:
+            cached = self.eval_cache.get(board, engine_id(engine_def), depth)
+            if cached is not None:
+                return cached.info()
+        info = await self.run(engine_def, options,
+            lambda engine: engine.analyse(board, limit, game=self.game, **kwargs))
+        if cacheable:
+            if limit.depth is None and "depth" in info:
+                self.reached_depth[(engine_id(engine_def), limit.time, limit.nodes)] = info["depth"]
+            self.eval_cache.put(board, engine_id(engine_def), info)
+        return info
+
+    def new_game(self) -> None:
+        """ Engines get ucinewgame with their next command instead of a restart. """
+        self.game = object()
+
+    async def reap_idle(self) -> None:
+        while True:
+            await asyncio.sleep(min(30.0, self.idle_timeout))
+            now = time.monotonic()
+            idle = [ pooled for pooled in self.engines
+                     if not pooled.busy and now-pooled.last_used > self.idle_timeout ]
+            for pooled in idle:
+                await self.discard(pooled)
+
+    def stats(self) -> dict:
+        return { "engines": len(self.engines),
+                 "busy": sum(pooled.busy for pooled in self.engines),
+                 "max_instances": self.max_instances,
+                 "spawned": self.spawned }
+
+    async def close(self) -> None:
+        if self.reaper is not None:
+            self.reaper.cancel()
+            self.reaper = None
+        engines, self.engines = self.engines, []
+        for pooled in engines:
+            await pooled.close()
+        self.changed = None
+        if self.eval_cache is not None:
+            self.eval_cache.flush()
+
+enginePool = EnginePool(eval_cache=evalCache)
@@ -0,0 +1,157 @@
+# -------------------------------
+# EvalCache
+# -------------------------------
+
+import os, sqlite3, threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import chess
+import chess.engine
+import chess.polyglot
+
+@dataclass
+class CachedEval:
+    """ One engine evaluation, the score is from white's point of view. """
+    depth: int
+    cp: int = None
+    mate: int = None
+    pv: list = field(default_factory=list) # uci strings
+
+    @classmethod
+    def from_info(cls, info: dict):
+        score = info["score"].white()
+        return cls(info.get("depth", 0), score.score(), score.mate(),
+                   [ move.uci() for move in info.get("pv", []) ])
+
+    def score(self) -> chess.engine.PovScore:
+        if self.mate is not None:
+            return chess.engine.PovScore(chess.engine.Mate(self.mate), chess.WHITE)
+        return chess.engine.PovScore(chess.engine.Cp(self.cp), chess.WHITE)
+
+    def best_move(self):
+        return chess.Move.from_uci(self.pv[0]) if self.pv else None
+
+    def info(self) -> dict:
+        """ The entry in the shape of a chess.engine analysis result. """
+        return { "depth": self.depth, "score": self.score(),
+                 "pv": [ chess.Move.from_uci(uci) for uci in self.pv ], "cached": True }
+
+def engine_id(engine_def) -> str:
+    return f"{engine_def.name}|{engine_def.filepath}"
+
+class EvalCache:
+    """ Engine evaluations keyed by Zobrist hash and engine.
+
+    Keeps up to `capacity` entries in memory in least recently used
+    order. With a `path`, entries are also written to an SQLite file,
+    which is only opened on the first lookup that misses memory.
+    A result never replaces a deeper one for the same position.
+    """
+
+    def __init__(self, path: str = None, capacity: int = 100000, batch_size: int = 64) -> None:
+        self.path = path
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.entries = OrderedDict() # (zobrist, engine) -> CachedEval
+        self.pending = dict()        # entries not yet written to disk
+        self.db = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, board: chess.Board, engine: str) -> tuple:
+        return (chess.polyglot.zobrist_hash(board), engine)
+
+    def get(self, board: chess.Board, engine: str, depth: int = 0):
+        """ The cached evaluation if it is at least `depth` deep, else None. """
+        key = self.key(board, engine)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.load(key)
+            else:
+                self.entries.move_to_end(key)
+            if entry is None or entry.depth < depth:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry
+
+    def put(self, board: chess.Board, engine: str, info: dict) -> None:
+        if "score" not in info:
+            return
+        entry = CachedEval.from_info(info)
+        key = self.key(board, engine)
+        with self.lock:
+            old = self.entries.get(key) or self.load(key)
+            if old is not None and old.depth > entry.depth:
+                return
+            self.remember(key, entry)
+            if self.path is not None:
+                self.pending[key] = entry
+                if len(self.pending) >= self.batch_size:
+                    self.flush_pending()
+
+    def remember(self, key: tuple, entry: CachedEval) -> None:
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    # ---- Disk store
+
+    def open(self):
+        if self.db is None and self.path is not None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute("""CREATE TABLE IF NOT EXISTS evals (
+                hash INTEGER, engine TEXT, depth INTEGER, cp INTEGER, mate INTEGER, pv TEXT,
+                PRIMARY KEY (hash, engine))""")
+        return self.db
+
+    def load(self, key: tuple):
+        db = self.open()
+        if db is None:
+            return None
+        row = db.execute("SELECT depth, cp, mate, pv FROM evals WHERE hash=? AND engine=?",
+                         (to_signed(key[0]), key[1])).fetchone()
+        if row is None:
+            return None
+        entry = CachedEval(row[0], row[1], row[2], row[3].split())
+        self.remember(key, entry)
+        return entry
+
+    def flush_pending(self) -> None:
+        db = self.open()
+        if db is None or not self.pending:
+            return
+        with db:
+            db.executemany("""INSERT INTO evals VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (hash, engine) DO UPDATE SET
+                depth=excluded.depth, cp=excluded.cp, mate=excluded.mate, pv=excluded.pv
+                WHERE excluded.depth >= evals.depth""",
+                [ (to_signed(key[0]), key[1], entry.depth, entry.cp, entry.mate, " ".join(entry.pv))
+                  for key, entry in self.pending.items() ])
+        self.pending.clear()
+
+    def flush(self) -> None:
+        with self.lock:
+            self.flush_pending()
+
+    def close(self) -> None:
+        with self.lock:
+            self.flush_pending()
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+    def stats(self) -> dict:
+        return { "entries": len(self.entries), "hits": self.hits, "misses": self.misses }
+
+def to_signed(value: int) -> int:
+    """ SQLite integers are signed 64 bit, Zobrist hashes unsigned. """
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+evalCache = EvalCache("settings/evalcache.sqlite")
@@ -0,0 +1,195 @@
+# -------------------------------
+# GameAnalysis
+# -------------------------------
+
+import time
+from dataclasses import dataclass
+import chess
+import chess.engine
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from ChessEventManager import eventManager
+from EnginePlayer import engineThread
+from EnginePool import enginePool
+from EvalCache import engine_id
+
+@dataclass
+class PlyEval:
+    """ The evaluation of the position after `ply` moves of the game. """
+    ply: int
+    turn: chess.Color
+    score: chess.engine.Score # from white's point of view
+    depth: int
+    best: chess.Move = None
+    final: bool = False       # False for the quick first pass
+
+# Drops of the mover's expected score, worst first
+JUDGEMENTS = ((0.3, "??"), (0.2, "?"), (0.1, "?!"))
+
+def judge(before: chess.engine.Score, after: chess.engine.Score, mover: chess.Color) -> str:
+    """ "??", "?", "?!" or "" for a move between positions scored `before` and `after`. """
+    drop = before.wdl().expectation() - after.wdl().expectation()
+    if mover == chess.BLACK:
+        drop = -drop
+    for threshold, marker in JUDGEMENTS:
+        if drop >= threshold:
+            return marker
+    return ""
+
+def format_score(score) -> str:
+    """ Like "+0.35" or "#-3", from white's point of view. """
+    if score is None:
+        return ""
+    if score.is_mate():
+        return f"#{score.mate()}"
+    return f"{score.score()/100:+.2f}"
+
+def split(items: list, parts: int) -> list:
+    """ `items` in `parts` contiguous chunks of nearly equal size. """
+    size, rest = divmod(len(items), parts)
+    chunks, start = [], 0
+    for part in range(parts):
+        end = start + size + (part < rest)
+        chunks.append(items[start:end])
+        start = end
+    return [ chunk for chunk in chunks if chunk ]
+
+class GameAnalysis(QObject):
+    """ Evaluates every position of a game on several engines at once.
+
+    The positions are split into contiguous stretches, one per engine
+    the pool may run. Each engine first sweeps its stretch forward at
+    `quick_depth`, which gives a rough result for every ply early and
+    fills its hash with the lines of the game. It then goes back over
+    the stretch from the end at full depth, so every search finds the
+    positions that follow it in the hash. Results stream out through
+    plyAnalysed as each ply finishes. Full depth results go into the
+    evaluation cache and are taken from there on the next run.
+    """
+
+    plyAnalysed = pyqtSignal(object)
+    analysisProgress = pyqtSignal(int, int)
+    analysisDone = pyqtSignal(str)
+    analysisError = pyqtSignal(str)
+    resultReady = pyqtSignal(int, object)
+
+    def __init__(self, board: chess.Board, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.board = board
+        self.generation = 0     # bumped when an analysis starts or is cancelled
+        self.futures = []
+        self.moves = []
+        self.finished = 0
+        self.total = 0
+        self.started = 0.0
+        self.resultReady.connect(self.result_ready)
+
+        eventManager.onMove += self.move_made
+        eventManager.onTakeback += self.taken_back
+        eventManager.onGameLoaded += self.cancel
+        eventManager.newGame += self.cancel
+
+    def running(self) -> bool:
+        return any(not future.done() for future in self.futures)
+
+    def analyse(self, engine_def, start_fen: str, moves: list, depth: int = 18,
+                quick_depth: int = 8, workers: int = None) -> None:
+        self.cancel()
+        boards = [ chess.Board(start_fen) ]
+        for move in moves:
+            board = boards[-1].copy(stack=False)
+            board.push(move)
+            boards.append(board)
+        self.moves = list(moves)
+        self.finished = 0
+        self.total = len(boards)
+        self.started = time.perf_counter()
+        generation = self.generation
+        # one ucinewgame per analysis, the hash lives on between plies
+        game = object()
+        chunks = split(list(enumerate(boards)), min(workers or enginePool.max_instances, len(boards)))
+        for chunk in chunks:
+            future = engineThread.submit(self.run(generation, engine_def, chunk, depth, quick_depth, game))
+            future.add_done_callback(lambda future: self.run_done(future, generation))
+            self.futures.append(future)
+        self.analysisProgress.emit(0, self.total)
+
+    def cancel(self, *args) -> None:
+        self.generation += 1
+        futures, self.futures = self.futures, []
+        for future in futures:
+            future.cancel()
+
+    def move_made(self, move: chess.Move, *args) -> None:
+        # a move that leaves the analysed line makes the results obsolete
+        ply = len(self.board.move_stack)-1
+        if self.running() and ply < len(self.moves) and self.moves[ply] != move:
+            self.cancel()
+            self.analysisDone.emit("Analysis cancelled, the game changed")
+
+    def taken_back(self, ply: int) -> None:
+        if self.running() and ply < len(self.moves):
+            self.cancel()
+            self.analysisDone.emit("Analysis cancelled, moves were taken back")
+
+    async def run(self, generation: int, engine_def, chunk: list, depth: int, quick_depth: int, game) -> None:
+        cache = enginePool.eval_cache
+        engine_key = engine_id(engine_def)
+        cached = dict()
+        if cache is not None:
+            for ply, board in chunk:
+                entry = cache.get(board, engine_key, depth)
+                if entry is not None:
+                    cached[ply] = entry
+                    self.emit(generation, ply, board, entry.info(), final=True)
+        remaining = [ (ply, board) for ply, board in chunk if ply not in cached ]
+        if not remaining:
+            return
+        async with enginePool.engine(engine_def, engine_def.options) as engine:
+            for ply, board in remaining:
+                if generation != self.generation:
+                    return
+                info = await self.evaluate(engine, board, quick_depth, game)
+                self.emit(generation, ply, board, info, final=False)
+            for ply, board in reversed(remaining):
+                if generation != self.generation:
+                    return
+                info = await self.evaluate(engine, board, depth, game)
+                if cache is not None and "score" in info:
+                    cache.put(board, engine_key, info)
+                self.emit(generation, ply, board, info, final=True)
+
+    async def evaluate(self, engine, board: chess.Board, depth: int, game) -> dict:
+        if board.is_game_over():
+            return dict()
+        return await engine.analyse(board, chess.engine.Limit(depth=depth), game=game)
+
+    def emit(self, generation: int, ply: int, board: chess.Board, info: dict, final: bool) -> None:
+        # Runs in the engine thread
+        if "score" in info:
+            score = info["score"].white()
+        elif board.is_checkmate():
+            score = chess.engine.MateGiven if board.turn == chess.BLACK else chess.engine.Mate(0)
+        else:
+            score = chess.engine.Cp(0)
+        best = info["pv"][0] if info.get("pv") else None
+        self.resultReady.emit(generation, PlyEval(ply, board.turn, score, info.get("depth", 0), best, final))
+
+    def result_ready(self, generation: int, ply_eval: PlyEval) -> None:
+        if generation != self.generation:
+            return
+        if ply_eval.final:
+            self.finished += 1
+            self.analysisProgress.emit(self.finished, self.total)
+        self.plyAnalysed.emit(ply_eval)
+        if self.finished == self.total:
+            elapsed = time.perf_counter()-self.started
+            self.analysisDone.emit(f"Analysed {self.total} positions in {elapsed:.1f} s")
+
+    def run_done(self, future, generation: int) -> None:
+        # Runs in the engine thread
+        if generation != self.generation or future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            self.analysisError.emit(f"{type(error).__name__}: {error}")
@@ -0,0 +1,318 @@
+# -------------------------------
+# GameDatabase
+# -------------------------------
+# A local store of games in SQLite. Every position of every game is
+# indexed by its Zobrist hash, so the games reaching a position and
+# the moves played from it are a single index range lookup.
+#
+#   python GameDatabase.py games.pgn [more.pgn ...] --db settings/games.sqlite
+
+import argparse, io, multiprocessing, os, sqlite3, sys, threading, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import chess
+import chess.pgn
+import chess.polyglot
+
+from EvalCache import to_signed
+from PgnIndex import PgnIndex
+
+RESULTS = { "1-0": 1, "1/2-1/2": 0, "0-1": -1 }
+
+def move_code(move: chess.Move) -> int:
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+def code_move(code: int) -> chess.Move:
+    return chess.Move(code & 63, code >> 6 & 63, (code >> 12) or None)
+
+HASHER = chess.polyglot.ZobristHasher(chess.polyglot.POLYGLOT_RANDOM_ARRAY)
+
+def piece_key(board: chess.Board, square: chess.Square) -> int:
+    """ The Zobrist key of the piece on `square`, 0 for an empty square. """
+    piece_type = board.piece_type_at(square)
+    if not piece_type:
+        return 0
+    color = 1 if board.occupied_co[chess.WHITE] & chess.BB_SQUARES[square] else 0
+    return HASHER.array[64*((piece_type-1)*2 + color) + square]
+
+castling_keys = dict() # (castling rights, kings) -> Zobrist key
+
+def castling_key(board: chess.Board) -> int:
+    # in Chess960 the side of a rook depends on where the king stands
+    rights = (board.castling_rights, board.kings if board.castling_rights else 0)
+    key = castling_keys.get(rights)
+    if key is None:
+        key = castling_keys[rights] = HASHER.hash_castling(board)
+    return key
+
+def changed_squares(board: chess.Board, move: chess.Move):
+    """ The squares whose piece changes when `move` is pushed on `board`. """
+    if board.is_castling(move):
+        return chess.SquareSet(chess.BB_RANK_1 if board.turn == chess.WHITE else chess.BB_RANK_8)
+    if board.is_en_passant(move):
+        return (move.from_square, move.to_square,
+                chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square)))
+    return (move.from_square, move.to_square)
+
+@dataclass
+class MoveStat:
+    """ How often a move was played from a position and how it ended. """
+    move: chess.Move
+    games: int
+    white: int
+    draws: int
+    black: int
+
+@dataclass
+class GameRow:
+    id: int
+    white: str
+    black: str
+    result: str
+    date: str
+    event: str
+    eco: str
+
+class GameRecord(chess.pgn.BaseVisitor):
+    """ Collects the headers, mainline and position hashes of one game.
+
+    Used instead of the chess.pgn game builder while importing, no
+    game tree is built and variations are skipped. The hash is updated
+    from the squares a move changes instead of hashing every piece of
+    every position.
+    """
+
+    def begin_game(self) -> None:
+        self.headers = dict()
+        self.moves = []
+        self.positions = []   # (hash, ply, move code) of the first visit of each position
+        self.seen = set()
+        self.fen = None
+        self.broken = False
+        self.pieces_hash = None # Zobrist hash of the pieces only, updated per move
+        self.changed = None
+
+    def visit_header(self, tagname: str, tagvalue: str) -> None:
+        self.headers[tagname] = tagvalue
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def visit_board(self, board: chess.Board) -> None:
+        if self.broken:
+            return
+        if self.pieces_hash is None:
+            if board.fen() != chess.STARTING_FEN:
+                self.fen = board.fen()
+            self.pieces_hash = HASHER.hash_board(board)
+        else:
+            for square, old_key in self.changed:
+                self.pieces_hash ^= old_key ^ piece_key(board, square)
+        zobrist = self.pieces_hash ^ castling_key(board) ^ HASHER.hash_turn(board)
+        if board.ep_square is not None:
+            zobrist ^= HASHER.hash_ep_square(board)
+        if zobrist not in self.seen:
+            self.seen.add(zobrist)
+            self.positions.append([to_signed(zobrist), len(self.moves), None])
+
+    def visit_move(self, board: chess.Board, move: chess.Move) -> None:
+        if self.broken:
+            return
+        self.changed = [ (square, piece_key(board, square)) for square in changed_squares(board, move) ]
+        self.moves.append(move)
+        if self.positions[-1][1] == len(self.moves)-1:
+            self.positions[-1][2] = move_code(move)
+
+    def handle_error(self, error: Exception) -> None:
+        # keep the moves up to the error
+        self.broken = True
+
+    def result(self) -> tuple:
+        """ The game as (headers, start fen, uci moves, positions). """
+        return (self.headers, self.fen, " ".join(move.uci() for move in self.moves), self.positions)
+
+def parse_games(texts: list) -> list:
+    """ Runs in the import worker processes. """
+    return [ chess.pgn.read_game(io.StringIO(text), Visitor=GameRecord) for text in texts ]
+
+class GameDatabase:
+    """ Games and their positions in an SQLite file.
+
+    Connections are opened per thread on first use, so the database can
+    be queried from a worker thread while another one imports. The
+    position table is clustered by hash and carries the game result,
+    move statistics never touch the games table.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        db = getattr(self.local, "db", None)
+        if db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = self.local.db = sqlite3.connect(self.path)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("PRAGMA cache_size=-65536")
+            with db:
+                db.execute("""CREATE TABLE IF NOT EXISTS games (
+                    id INTEGER PRIMARY KEY, white TEXT, black TEXT, result TEXT,
+                    date TEXT, event TEXT, eco TEXT, fen TEXT, moves TEXT)""")
+                db.execute("""CREATE TABLE IF NOT EXISTS positions (
+                    hash INTEGER NOT NULL, game INTEGER NOT NULL, ply INTEGER NOT NULL,
+                    move INTEGER, result INTEGER,
+                    PRIMARY KEY (hash, game)) WITHOUT ROWID""")
+        return db
+
+    def close(self) -> None:
+        db = getattr(self.local, "db", None)
+        if db is not None:
+            db.close()
+            self.local.db = None
+
+    # ---- Import
+
+    def import_pgn(self, filepath: str, batch_size: int = 1000, workers: int = None, progress=None) -> int:
+        """ Imports the games of a PGN file.
+
+        Games are parsed in batches of `batch_size` by `workers`
+        processes, one per core by default, and written in one
+        transaction per batch in file order. `progress` is called with
+        the number of games imported so far after every batch. Returns
+        the number of games imported.
+        """
+        db = self.connection()
+        workers = workers or os.cpu_count() or 1
+        imported = 0
+
+        def write(games: list) -> None:
+            nonlocal imported
+            imported += self.write_batch(db, [ game for game in games if game is not None ])
+            if progress is not None:
+                progress(imported)
+
+        pgn_index = PgnIndex(filepath).open()
+        try:
+            batches = ( [ pgn_index.text(game) for game in range(start, min(start+batch_size, len(pgn_index))) ]
+                        for start in range(0, len(pgn_index), batch_size) )
+            if workers == 1 or len(pgn_index) <= batch_size:
+                for texts in batches:
+                    write(parse_games(texts))
+            else:
+                # spawned, forking the GUI's threads and Qt state is unsafe
+                with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                    pending = deque()
+                    for texts in batches:
+                        pending.append(executor.submit(parse_games, texts))
+                        if len(pending) >= workers*2:
+                            write(pending.popleft().result())
+                    while pending:
+                        write(pending.popleft().result())
+        finally:
+            pgn_index.close()
+        return imported
+
+    def write_batch(self, db: sqlite3.Connection, records: list) -> int:
+        with db:
+            next_id = db.execute("SELECT COALESCE(MAX(id), 0)+1 FROM games").fetchone()[0]
+            games = []
+            positions = []
+            for game_id, (headers, fen, moves, game_positions) in enumerate(records, next_id):
+                result = headers.get("Result", "*")
+                games.append((game_id, headers.get("White", "?"), headers.get("Black", "?"), result,
+                              headers.get("Date", "????.??.??"), headers.get("Event", "?"),
+                              headers.get("ECO"), fen, moves))
+                score = RESULTS.get(result)
+                positions.extend((zobrist, game_id, ply, move, score)
+                                 for zobrist, ply, move in game_positions)
+            db.executemany("INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", games)
+            db.executemany("INSERT OR IGNORE INTO positions VALUES (?, ?, ?, ?, ?)", positions)
+        return len(records)
+
+    # ---- Queries
+
+    def count(self) -> int:
+        return self.connection().execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+    def move_stats(self, board: chess.Board) -> list:
+        """ The moves played from the position of `board`, most played first. """
+        rows = self.connection().execute("""
+            SELECT move, COUNT(*), SUM(result IS 1), SUM(result IS 0), SUM(result IS -1)
+            FROM positions WHERE hash = ? AND move IS NOT NULL
+            GROUP BY move ORDER BY COUNT(*) DESC""",
+            (to_signed(chess.polyglot.zobrist_hash(board)),)).fetchall()
+        return [ MoveStat(code_move(code), games, white, draws, black)
+                 for code, games, white, draws, black in rows ]
+
+    def games_reaching(self, board: chess.Board, limit: int = 100) -> list:
+        """ Up to `limit` games that reached the position of `board`, last imported first. """
+        rows = self.connection().execute("""
+            SELECT games.id, white, black, games.result, date, event, eco
+            FROM positions JOIN games ON games.id = positions.game
+            WHERE hash = ? ORDER BY positions.game DESC LIMIT ?""",
+            (to_signed(chess.polyglot.zobrist_hash(board)), limit)).fetchall()
+        return [ GameRow(*row) for row in rows ]
+
+    def game_rows(self, game_ids: list) -> list:
+        """ The header rows of `game_ids`, in the given order. """
+        rows = dict()
+        db = self.connection()
+        for start in range(0, len(game_ids), 500):
+            chunk = list(game_ids[start:start+500])
+            for row in db.execute(f"""SELECT id, white, black, result, date, event, eco
+                    FROM games WHERE id IN ({",".join("?"*len(chunk))})""", chunk):
+                rows[row[0]] = GameRow(*row)
+        return [ rows[game_id] for game_id in game_ids if game_id in rows ]
+
+    def game_moves(self, after: int = 0, batch_size: int = 1000):
+        """ Yields lists of (id, start fen, uci moves) of the games after id `after`. """
+        db = self.connection()
+        while True:
+            rows = db.execute("SELECT id, fen, moves FROM games WHERE id > ? ORDER BY id LIMIT ?",
+                              (after, batch_size)).fetchall()
+            if not rows:
+                return
+            yield rows
+            after = rows[-1][0]
+
+    def game(self, game_id: int):
+        """ The game as a chess.pgn.Game, or None if there is no such game. """
+        row = self.connection().execute(
+            "SELECT white, black, result, date, event, eco, fen, moves FROM games WHERE id = ?",
+            (game_id,)).fetchone()
+        if row is None:
+            return None
+        white, black, result, date, event, eco, fen, moves = row
+        game = chess.pgn.Game()
+        for tag, value in (("Event", event), ("Date", date), ("White", white),
+                           ("Black", black), ("Result", result), ("ECO", eco)):
+            if value is not None:
+                game.headers[tag] = value
+        if fen is not None:
+            game.setup(fen)
+        node = game
+        for uci in moves.split():
+            node = node.add_variation(chess.Move.from_uci(uci))
+        return game
+
+gameDatabase = GameDatabase("settings/games.sqlite")
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Import PGN files into the game database.")
+    parser.add_argument("pgn", nargs="+")
+    parser.add_argument("--db", default=gameDatabase.path)
+    args = parser.parse_args()
+    database = GameDatabase(args.db)
+    for filepath in args.pgn:
+        start = time.perf_counter()
+        imported = database.import_pgn(filepath,
+            progress=lambda imported: print(f"\r{filepath}: {imported} games", end="", file=sys.stderr))
+        elapsed = time.perf_counter()-start
+        print(f"\r{filepath}: {imported} games in {elapsed:.1f}s, {imported/max(elapsed, 1e-9):.0f} games/s",
+              file=sys.stderr)
+    database.close()
@@ -0,0 +1,82 @@
+# -------------------------------
+# GameHistory
+# -------------------------------
+
+import chess
+
+# Board states use python-chess internals that aren't public API: what
+# Board.push() stores on Board._stack and how it is put back. They are
+# the same in the chess==1.9.4 of requirements.txt, check these two
+# functions when that pin changes.
+
+def board_state(board: chess.Board):
+    """ The state of `board` as python-chess keeps it on its move stack. """
+    return board._board_state()
+
+def restore_board(board: chess.Board, state, moves: list, states: list) -> None:
+    """ Puts `state` into `board`, with `moves` and the `states` before each as its move stack. """
+    state.restore(board)
+    board.move_stack = moves
+    board._stack = states
+
+class GameHistory:
+    """ The mainline of the game with the board state after every ply.
+
+    The states are the ones python-chess keeps on its own move stack,
+    a handful of integers per ply, about 200 bytes. Going to a ply puts
+    its state into the board and hands it the moves and states before
+    it, which is exactly what a board that played those moves holds. So
+    jumps, takebacks and new lines from any ply replay no moves, and the
+    board still knows its move stack for repetitions and pop().
+
+    There are no variations: a different move in the middle of the game
+    replaces the rest of the mainline, as it did on the board alone.
+    """
+
+    def __init__(self, start_fen: str = chess.STARTING_FEN) -> None:
+        self.reset(start_fen)
+
+    def reset(self, start_fen: str = chess.STARTING_FEN) -> None:
+        board = chess.Board(start_fen)
+        self.start_fen = start_fen
+        self.moves = []
+        self.states = [ board_state(board) ] # states[ply] is the position after `ply` moves
+
+    def load(self, start_fen: str, moves: list) -> None:
+        """ Takes a whole mainline, playing it through once. """
+        self.reset(start_fen)
+        board = chess.Board(start_fen)
+        for move in moves:
+            board.push(move)
+            self.moves.append(move)
+            self.states.append(board_state(board))
+
+    def __len__(self) -> int:
+        return len(self.moves)
+
+    def push(self, board: chess.Board) -> bool:
+        """ Records the move just pushed onto `board`.
+
+        The same move as the mainline keeps the rest of the game, any
+        other move starts a new line from there. Returns whether moves
+        after it were dropped.
+        """
+        ply = len(board.move_stack)-1
+        move = board.move_stack[-1]
+        if ply < len(self.moves) and self.moves[ply] == move:
+            return False
+        dropped = ply < len(self.moves)
+        del self.moves[ply:]
+        del self.states[ply+1:]
+        self.moves.append(move)
+        self.states.append(board_state(board))
+        return dropped
+
+    def goto(self, board: chess.Board, ply: int) -> None:
+        """ Sets `board` to the position after `ply` moves, with its move stack. """
+        restore_board(board, self.states[ply], self.moves[:ply], self.states[:ply])
+
+    def truncate(self, ply: int) -> None:
+        """ Drops all moves after `ply`. """
+        del self.moves[ply:]
+        del self.states[ply+1:]
@@ -10,6 +10,7 @@ class GameSettings(QDockWidget):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.init_gui()
+        eventManager.onEngineInfo += self.engine_probed
 
 
     def init_gui(self):
@@ -28,7 +29,7 @@ class GameSettings(QDockWidget):
         whiteLabel.setAlignment(Qt.AlignHCenter)
         self.mainLayout.addWidget(whiteLabel, 0, 0)
         self.whiteComboBox = QComboBox()
-        self.whiteComboBox.addItems(["Player", "Stockfish", "LeelaZero"])
+        self.whiteComboBox.addItems(["Player"])
         self.mainLayout.addWidget(self.whiteComboBox, 1, 0)
 
         vsLabel = QLabel("vs.")
@@ -39,8 +40,35 @@ class GameSettings(QDockWidget):
         blackLabel.setAlignment(Qt.AlignHCenter)
         self.mainLayout.addWidget(blackLabel, 0, 2)
         self.blackComboBox = QComboBox()
-        self.blackComboBox.addItems(["Player", "Stockfish", "LeelaZero"])
+        self.blackComboBox.addItems(["Player"])
         self.mainLayout.addWidget(self.blackComboBox, 1, 2)
 
         self.setWidget(self.mainWidget)
 
+    def set_engines(self, names: list, infos: dict = None) -> None:
+        """ Offers "Player" plus the given engines for both sides.
+
+        `infos` maps engine names to their cached EngineInfo, shown as tooltips.
+        """
+        for comboBox in (self.whiteComboBox, self.blackComboBox):
+            current = comboBox.currentText()
+            comboBox.blockSignals(True)
+            comboBox.clear()
+            comboBox.addItems(["Player"] + names)
+            comboBox.setCurrentIndex(max(0, comboBox.findText(current)))
+            comboBox.blockSignals(False)
+        for name, info in (infos or dict()).items():
+            self.set_engine_info(name, info)
+
+    def set_engine_info(self, name: str, info) -> None:
+        for comboBox in (self.whiteComboBox, self.blackComboBox):
+            index = comboBox.findText(name)
+            if index > 0:
+                comboBox.setItemData(index, info.summary(), Qt.ToolTipRole)
+
+    def engine_probed(self, engine_def, info) -> None:
+        self.set_engine_info(engine_def.name, info)
+
+    def player(self, color: chess.Color) -> str:
+        comboBox = self.whiteComboBox if color == chess.WHITE else self.blackComboBox
+        return comboBox.currentText()
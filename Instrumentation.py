@@ -0,0 +1,193 @@
+# -------------------------------
+# Instrumentation
+# -------------------------------
+
+import functools, json, os, threading, time
+from collections import deque
+from contextlib import contextmanager
+
+class Timings:
+    """ The latest durations of one span name, for percentiles and rates. """
+
+    def __init__(self, size: int = 1024) -> None:
+        self.samples = deque(maxlen=size) # (end, duration) in seconds
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, end: float, duration: float) -> None:
+        self.samples.append((end, duration))
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def percentile(self, fraction: float) -> float:
+        durations = sorted(duration for end, duration in list(self.samples))
+        if not durations:
+            return 0.0
+        return durations[min(len(durations)-1, int(fraction*len(durations)))]
+
+    def rate(self, now: float, window: float = 1.0) -> float:
+        """ Spans per second that ended during the last `window` seconds. """
+        return sum(1 for end, duration in list(self.samples) if now-end <= window)/window
+
+class Instrumentation:
+    """ Times hot paths of the GUI and exports them as a Chrome trace.
+
+    Off by default: every hook checks `enabled` first and does nothing
+    else, so instrumented code pays one attribute lookup. Once enabled,
+    every span is kept per name for p50/p99 latencies and in a bounded
+    trace buffer, which export_trace() writes in the trace_event format
+    chrome://tracing and Perfetto open. Set the CHESSBOY_DEBUG
+    environment variable to record from the start.
+    """
+
+    def __init__(self, enabled: bool = False, trace_size: int = 200000) -> None:
+        self.enabled = enabled
+        self.epoch = time.perf_counter()
+        self.timings = dict()    # name -> Timings
+        self.categories = dict() # name -> category
+        self.counters = dict()   # name -> int
+        self.gauges = dict()     # name -> callable returning a number
+        self.trace = deque(maxlen=trace_size) # (name, category, start, duration, thread id)
+        self.thread_names = dict()
+        self.lock = threading.Lock()
+
+    def enable(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+
+    def reset(self) -> None:
+        with self.lock:
+            self.timings.clear()
+            self.counters.clear()
+            self.trace.clear()
+
+    def record(self, name: str, category: str, start: float, end: float) -> None:
+        """ Adds a span from perf_counter() values. """
+        thread = threading.current_thread()
+        with self.lock:
+            timings = self.timings.get(name)
+            if timings is None:
+                timings = self.timings[name] = Timings()
+                self.categories[name] = category
+            timings.add(end, end-start)
+            self.trace.append((name, category, start, end-start, thread.ident))
+            self.thread_names[thread.ident] = thread.name
+
+    def count(self, name: str, amount: int = 1) -> None:
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_gauge(self, name: str, gauge) -> None:
+        """ A value read whenever read_counters() is, like a pool or cache size. """
+        self.gauges[name] = gauge
+
+    @contextmanager
+    def span(self, name: str, category: str = "app"):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, category, start, time.perf_counter())
+
+    def timed(self, category: str = "app", name: str = None):
+        """ Decorator timing every call of a function under its qualified name. """
+        def decorator(func):
+            span_name = name or func.__qualname__
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(span_name, category, start, time.perf_counter())
+            return wrapper
+        return decorator
+
+    def summary(self) -> list:
+        """ (name, category, count, per second, p50, p99, max) per span name, slowest p99 first.
+
+        Durations are in seconds.
+        """
+        now = time.perf_counter()
+        with self.lock:
+            timings = list(self.timings.items())
+        rows = [ (name, self.categories[name], entry.count, entry.rate(now),
+                  entry.percentile(0.5), entry.percentile(0.99), entry.max)
+                 for name, entry in timings ]
+        rows.sort(key=lambda row: -row[5])
+        return rows
+
+    def rate(self, category: str, window: float = 1.0) -> float:
+        """ Spans per second of a whole category, like "event". """
+        now = time.perf_counter()
+        with self.lock:
+            timings = [ entry for name, entry in self.timings.items() if self.categories[name] == category ]
+        return sum(entry.rate(now, window) for entry in timings)
+
+    def read_counters(self) -> dict:
+        """ The counters and the current value of every gauge. """
+        with self.lock:
+            values = dict(self.counters)
+        for name, gauge in list(self.gauges.items()):
+            try:
+                values[name] = gauge()
+            except Exception as error:
+                values[name] = f"error: {error}"
+        return values
+
+    def trace_events(self) -> list:
+        with self.lock:
+            spans = list(self.trace)
+            thread_names = dict(self.thread_names)
+        pid = os.getpid()
+        events = [ { "name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": { "name": name } }
+                   for tid, name in thread_names.items() ]
+        for name, category, start, duration, tid in spans:
+            events.append({ "name": name, "cat": category, "ph": "X", "pid": pid, "tid": tid,
+                            "ts": (start-self.epoch)*1e6, "dur": duration*1e6 })
+        now = (time.perf_counter()-self.epoch)*1e6
+        for name, value in self.read_counters().items():
+            if isinstance(value, (int, float)):
+                events.append({ "name": name, "ph": "C", "pid": pid, "ts": now, "args": { "value": value } })
+        return events
+
+    def export_trace(self, filepath: str) -> int:
+        """ Writes a Chrome trace_event JSON file, returns the number of spans. """
+        events = self.trace_events()
+        with open(filepath, "w") as file:
+            json.dump({ "traceEvents": events, "displayTimeUnit": "ms" }, file)
+        return sum(1 for event in events if event["ph"] == "X")
+
+class StartupTimer:
+    """ Milestones of the application start, in seconds since this module was imported. """
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.marks = [] # (phase, seconds since start)
+
+    def mark(self, phase: str) -> None:
+        now = time.perf_counter()
+        previous = self.start + (self.marks[-1][1] if self.marks else 0.0)
+        self.marks.append((phase, now-self.start))
+        if instrumentation.enabled:
+            instrumentation.record(f"startup: {phase}", "startup", previous, now)
+
+    def elapsed(self, phase: str):
+        """ Seconds until `phase`, None if it wasn't reached yet. """
+        for name, seconds in self.marks:
+            if name == phase:
+                return seconds
+        return None
+
+    def report(self) -> str:
+        return "Startup: " + ", ".join(f"{phase} {seconds*1000:.0f} ms" for phase, seconds in self.marks)
+
+instrumentation = Instrumentation(enabled=bool(os.environ.get("CHESSBOY_DEBUG")))
+startup = StartupTimer()
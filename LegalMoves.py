@@ -0,0 +1,63 @@
+# -------------------------------
+# LegalMoves
+# -------------------------------
+
+import chess
+from ChessEventManager import eventManager
+
+class LegalMoveIndex:
+    """ Legal moves of the current position, keyed by from-square.
+
+    Built once per position: position changes like onMove, onJump or
+    newGame only mark the index as stale and the next query rebuilds it.
+    Validating a move is a dict lookup. SAN is only worked out for the
+    move that is asked for, it needs a legality check of its own.
+    """
+
+    def __init__(self, board: chess.Board) -> None:
+        self.board = board
+        self.moves = dict() # from -> { to -> { promotion -> move } }
+        self.valid = False
+        eventManager.onMove += self.invalidate
+        eventManager.onJump += self.invalidate
+        eventManager.onGameLoaded += self.invalidate
+        eventManager.newGame += self.invalidate
+
+    def set_board(self, board: chess.Board) -> None:
+        self.board = board
+        self.invalidate()
+
+    def invalidate(self, *args) -> None:
+        self.valid = False
+
+    def rebuild(self) -> None:
+        self.moves.clear()
+        for move in self.board.legal_moves:
+            targets = self.moves.setdefault(move.from_square, dict())
+            targets.setdefault(move.to_square, dict())[move.promotion] = move
+        self.valid = True
+
+    def index(self) -> dict:
+        if not self.valid:
+            self.rebuild()
+        return self.moves
+
+    def legal_move(self, move: chess.Move):
+        """ The legal move matching `move`, None if it is illegal. """
+        return self.index().get(move.from_square, dict()).get(move.to_square, dict()).get(move.promotion)
+
+    def san(self, move: chess.Move):
+        """ SAN of a legal move, None if the move is illegal. """
+        legal_move = self.legal_move(move)
+        return self.board.san(legal_move) if legal_move is not None else None
+
+    def is_legal(self, move: chess.Move) -> bool:
+        return self.legal_move(move) is not None
+
+    def targets(self, from_square: int) -> list:
+        return list(self.index().get(from_square, dict()))
+
+    def promotions(self, from_square: int, to_square: int) -> list:
+        """ Piece types a pawn can promote to on this move, empty if none. """
+        choices = self.index().get(from_square, dict()).get(to_square, dict())
+        return [ promotion for promotion in choices if promotion is not None ]
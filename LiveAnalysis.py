@@ -0,0 +1,168 @@
+# -------------------------------
+# LiveAnalysis
+# -------------------------------
+
+import asyncio
+from dataclasses import dataclass
+import chess
+import chess.engine
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from ChessEventManager import eventManager
+from EnginePlayer import engineThread
+from EnginePool import enginePool
+
+@dataclass
+class AnalysisSnapshot:
+    """ The state of an analysis at one moment, never changed once made. """
+    session: int
+    board: chess.Board
+    lines: tuple = ()    # info dicts by MultiPV rank
+    depth: int = 0
+    seldepth: int = 0
+    nodes: int = 0
+    nps: int = 0
+    time: float = 0.0
+
+    def score(self):
+        """ The score of the best line from white's point of view, None before the first. """
+        if not self.lines or "score" not in self.lines[0]:
+            return None
+        return self.lines[0]["score"].white()
+
+class AnalysisRunner:
+    """ The engine thread side of one live analysis session.
+
+    Runs on the engine loop only. run() holds the engine and analyses
+    each position handed over with set_position() until it gets None.
+    """
+
+    def __init__(self, engine_def, multipv: int) -> None:
+        self.engine_def = engine_def
+        self.multipv = multipv
+        self.latest = None      # newest snapshot, read by the GUI thread
+        self.next_position = None
+        self.wakeup = asyncio.Event()
+        self.analysis = None
+
+    def set_position(self, position) -> None:
+        """ Hands the next (session, board) to run(), None ends it. """
+        self.next_position = position
+        if self.analysis is not None:
+            self.analysis.stop()
+        self.wakeup.set()
+
+    async def run(self) -> None:
+        async with enginePool.engine(self.engine_def, self.engine_def.options) as engine:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                position, self.next_position = self.next_position, None
+                if position is None:
+                    return
+                session, board = position
+                if board.is_game_over():
+                    self.latest = AnalysisSnapshot(session, board)
+                    continue
+                self.analysis = await engine.analysis(board, multipv=self.multipv, game=enginePool.game)
+                if self.wakeup.is_set():
+                    # the position changed while the search was starting, set_position() couldn't stop it
+                    self.analysis.stop()
+                    self.analysis = None
+                    continue
+                try:
+                    await self.follow(session, board, self.analysis)
+                finally:
+                    self.analysis.stop()
+                    self.analysis = None
+
+    async def follow(self, session: int, board: chess.Board, analysis) -> None:
+        lines = dict()
+        snapshot = AnalysisSnapshot(session, board)
+        async for info in analysis:
+            if "pv" in info and "score" in info:
+                lines[info.get("multipv", 1)] = info
+            snapshot = AnalysisSnapshot(session, board, tuple(lines[rank] for rank in sorted(lines)),
+                                        info.get("depth", snapshot.depth), info.get("seldepth", snapshot.seldepth),
+                                        info.get("nodes", snapshot.nodes), info.get("nps", snapshot.nps),
+                                        info.get("time", snapshot.time))
+            self.latest = snapshot
+
+class LiveAnalysis(QObject):
+    """ Analyses the board position with one engine until stopped.
+
+    The engine stays acquired from the pool for the whole session. A
+    position change stops the running search and starts the next one on
+    the same process. The engine thread only replaces the runner's
+    latest snapshot per info line. A timer in the GUI thread publishes
+    the newest one as eventManager.onAnalysis, at most `refresh_rate`
+    times a second. Snapshots of left positions are dropped by session
+    number.
+    """
+
+    analysisError = pyqtSignal(str)
+    runnerFailed = pyqtSignal(object, str) # from the engine thread
+
+    def __init__(self, board: chess.Board, refresh_rate: int = 30, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.board = board
+        self.multipv = 3
+        self.session = 0        # bumped on every position change
+        self.runner = None
+        self.published = None
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000 // refresh_rate)
+        self.timer.timeout.connect(self.publish)
+        self.runnerFailed.connect(self.runner_failed)
+
+        eventManager.onMove += self.position_changed
+        eventManager.onJump += self.position_changed
+        eventManager.onGameLoaded += self.position_changed
+        eventManager.newGame += self.position_changed
+
+    def running(self) -> bool:
+        return self.runner is not None
+
+    def start(self, engine_def, multipv: int = None) -> None:
+        self.stop()
+        self.multipv = multipv or self.multipv
+        runner = self.runner = AnalysisRunner(engine_def, self.multipv)
+        future = engineThread.submit(runner.run())
+        future.add_done_callback(lambda future: self.run_done(future, runner))
+        self.position_changed()
+        self.timer.start()
+
+    def stop(self) -> None:
+        if not self.running():
+            return
+        self.session += 1
+        self.timer.stop()
+        engineThread.loop_call(self.runner.set_position, None)
+        self.runner = None
+
+    def position_changed(self, *args) -> None:
+        if not self.running():
+            return
+        self.session += 1
+        engineThread.loop_call(self.runner.set_position, (self.session, self.board.copy()))
+
+    def publish(self) -> None:
+        snapshot = self.runner.latest if self.runner is not None else None
+        if snapshot is None or snapshot is self.published or snapshot.session != self.session:
+            return
+        self.published = snapshot
+        eventManager.onAnalysis(snapshot)
+
+    def run_done(self, future, runner: AnalysisRunner) -> None:
+        # Runs in the engine thread
+        if not future.cancelled() and future.exception() is not None:
+            error = future.exception()
+            self.runnerFailed.emit(runner, f"{type(error).__name__}: {error}")
+
+    def runner_failed(self, runner: AnalysisRunner, message: str) -> None:
+        print(f"LiveAnalysis: {message}")
+        if runner is not self.runner:
+            return # a stopped session, a newer one may be running already
+        self.timer.stop()
+        self.runner = None
+        self.analysisError.emit(message)
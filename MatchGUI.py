@@ -0,0 +1,226 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QDockWidget, QWidget, QVBoxLayout, QHBoxLayout, QFormLayout, QTableView, \
+                            QHeaderView, QAbstractItemView, QLabel, QComboBox, QSpinBox, QLineEdit, \
+                            QPushButton, QSplitter, QPlainTextEdit
+import chess
+from BoardGUI import BoardGUI, BoardView
+from EnginePlayer import EngineThread
+from MatchRunner import Match, TimeControl, Adjudication
+
+def format_clock(seconds: float) -> str:
+    seconds = max(0.0, seconds)
+    return f"{int(seconds//60)}:{seconds%60:04.1f}"
+
+class MatchGamesModel(QAbstractTableModel):
+    """ The running games of a match, from their latest snapshots. """
+
+    headers = ("Game", "White", "Black", "Move", "Clocks")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.snapshots = []
+
+    def set_snapshots(self, snapshots: list) -> None:
+        if [ snapshot.number for snapshot in snapshots ] != [ snapshot.number for snapshot in self.snapshots ]:
+            self.beginResetModel()
+            self.snapshots = snapshots
+            self.endResetModel()
+            return
+        self.snapshots = snapshots
+        if snapshots:
+            self.dataChanged.emit(self.index(0, 3), self.index(len(snapshots)-1, 4))
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.snapshots)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        snapshot = self.snapshots[index.row()]
+        column = index.column()
+        if column == 0:
+            return str(snapshot.number)
+        if column == 1:
+            return snapshot.white
+        if column == 2:
+            return snapshot.black
+        if column == 3:
+            return str(snapshot.board.fullmove_number)
+        return f"{format_clock(snapshot.white_time)} / {format_clock(snapshot.black_time)}"
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or orientation != Qt.Horizontal:
+            return None
+        return self.headers[section]
+
+class MatchGUI(QDockWidget):
+    """ Starts an engine match and watches its games.
+
+    The match runs on an event loop of its own, so it neither waits for
+    the GUI nor competes with the engines of the main board. The view
+    reads the snapshots of the running games a few times a second; the
+    games never wait for it, watching one slows down none of them.
+    """
+
+    progressMessage = pyqtSignal(str)
+    matchDone = pyqtSignal(str)
+
+    def __init__(self, engine_defs: list, tablebases=None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setAllowedAreas(Qt.LeftDockWidgetArea | Qt.RightDockWidgetArea | Qt.BottomDockWidgetArea)
+        self.setMinimumSize(400, 300)
+        self.setWindowTitle("Engine Match")
+        self.engine_defs = engine_defs
+        self.tablebases = tablebases
+        self.match = None
+        self.match_thread = EngineThread()
+        self.watched = None # number of the game on the board
+        self.progressMessage.connect(self.progress_message)
+        self.matchDone.connect(self.match_done)
+        self.timer = QTimer(self)
+        self.timer.setInterval(100)
+        self.timer.timeout.connect(self.refresh)
+
+        settings = QWidget()
+        settings.setLayout(QFormLayout())
+        self.firstComboBox = QComboBox()
+        self.secondComboBox = QComboBox()
+        for comboBox in (self.firstComboBox, self.secondComboBox):
+            comboBox.addItems([ engine_def.name for engine_def in engine_defs ])
+        self.secondComboBox.setCurrentIndex(min(1, len(engine_defs)-1))
+        settings.layout().addRow("Engines:", self.engine_row())
+        self.timeControlEdit = QLineEdit("10+0.1")
+        settings.layout().addRow("Time control:", self.timeControlEdit)
+        self.roundsSpinBox = QSpinBox()
+        self.roundsSpinBox.setRange(1, 10000)
+        self.roundsSpinBox.setValue(10)
+        settings.layout().addRow("Game pairs:", self.roundsSpinBox)
+        self.outputEdit = QLineEdit("match.pgn")
+        settings.layout().addRow("PGN output:", self.outputEdit)
+        self.startButton = QPushButton("Start")
+        self.startButton.clicked.connect(self.start_stop)
+        settings.layout().addRow(self.startButton)
+
+        self.model = MatchGamesModel()
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setShowGrid(False)
+        self.table.verticalHeader().hide()
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.clicked.connect(self.game_clicked)
+
+        self.board_scene = BoardGUI()
+        self.board_view = BoardView(self.board_scene)
+        self.board_view.setInteractive(False)
+        self.board_view.setMinimumSize(200, 200)
+        self.board_label = QLabel()
+        watch = QWidget()
+        watch.setLayout(QVBoxLayout())
+        watch.layout().setContentsMargins(0, 0, 0, 0)
+        watch.layout().addWidget(self.board_view)
+        watch.layout().addWidget(self.board_label)
+
+        self.log = QPlainTextEdit()
+        self.log.setReadOnly(True)
+        self.log.setMaximumBlockCount(1000)
+
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(self.table)
+        splitter.addWidget(watch)
+        splitter.addWidget(self.log)
+        self.mainWidget = QWidget()
+        self.mainWidget.setLayout(QVBoxLayout())
+        self.mainWidget.layout().addWidget(settings)
+        self.mainWidget.layout().addWidget(splitter)
+        self.setWidget(self.mainWidget)
+
+    def engine_row(self) -> QWidget:
+        row = QWidget()
+        row.setLayout(QHBoxLayout())
+        row.layout().setContentsMargins(0, 0, 0, 0)
+        row.layout().addWidget(self.firstComboBox)
+        row.layout().addWidget(QLabel("vs."))
+        row.layout().addWidget(self.secondComboBox)
+        return row
+
+    def running(self) -> bool:
+        return self.match is not None
+
+    def start_stop(self) -> None:
+        if self.running():
+            self.stop()
+            return
+        first, second = self.firstComboBox.currentIndex(), self.secondComboBox.currentIndex()
+        if first < 0 or second < 0 or first == second:
+            self.progress_message("Choose two different engines")
+            return
+        try:
+            time_control = TimeControl.parse(self.timeControlEdit.text())
+        except ValueError:
+            self.progress_message(f"Invalid time control {self.timeControlEdit.text()}, use like 10+0.1")
+            return
+        self.start(Match([ self.engine_defs[first], self.engine_defs[second] ], time_control,
+                         rounds=self.roundsSpinBox.value(), adjudication=Adjudication(tablebases=self.tablebases),
+                         output=self.outputEdit.text() or None, progress=self.progressMessage.emit))
+
+    def start(self, match: Match) -> None:
+        self.match = match
+        self.log.clear()
+        future = self.match_thread.submit(match.run())
+        future.add_done_callback(lambda future: self.matchDone.emit(
+            "" if future.cancelled() or future.exception() is None else str(future.exception())))
+        self.startButton.setText("Stop")
+        self.timer.start()
+
+    def stop(self) -> None:
+        if self.running():
+            self.match_thread.loop_call(self.match.stop)
+
+    def match_done(self, error: str) -> None:
+        if error:
+            self.progress_message(f"Match failed: {error}")
+        if self.match is not None:
+            self.progress_message(self.match.summary())
+        self.match = None
+        self.timer.stop()
+        self.refresh()
+        self.startButton.setText("Start")
+
+    def progress_message(self, message: str) -> None:
+        self.log.appendPlainText(message)
+
+    def game_clicked(self, index: QModelIndex) -> None:
+        if index.isValid():
+            self.watched = self.model.snapshots[index.row()].number
+            self.refresh()
+
+    def refresh(self) -> None:
+        snapshots = self.match.snapshots() if self.match is not None else []
+        self.model.set_snapshots(snapshots)
+        watched = [ snapshot for snapshot in snapshots if snapshot.number == self.watched ]
+        if not watched and snapshots:
+            # the watched game ended, follow the oldest running one
+            watched = snapshots[:1]
+            self.watched = watched[0].number
+        if watched:
+            snapshot = watched[0]
+            self.board_scene.sync_board(snapshot.board)
+            self.board_label.setText(f"Game {snapshot.number}: {snapshot.white} {format_clock(snapshot.white_time)} - "
+                                     f"{snapshot.black} {format_clock(snapshot.black_time)}")
+
+    def resizeEvent(self, event) -> None:
+        super().resizeEvent(event)
+        scale = self.board_scene.fit_to_window_scale(self.board_view.size(), padding=10)
+        self.board_scene.set_view_scale(scale, self.board_view.devicePixelRatioF())
+        self.board_view.resetTransform()
+        self.board_view.scale(scale, scale)
+
+    def shutdown(self) -> None:
+        self.stop()
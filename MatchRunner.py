@@ -0,0 +1,607 @@
+# -------------------------------
+# MatchRunner
+# -------------------------------
+# Engine matches and round robin tournaments without the GUI.
+#
+#   python MatchRunner.py --engine Stockfish --engine-cmd ./other --tc 10+0.1 \
+#                         --rounds 50 --openings openings.epd -o match.pgn
+#
+# Games are played concurrently, one per core, each holding its two
+# engines for the whole game. Finished games are appended to the PGN
+# output as they come in, a score summary with Elo and SPRT follows
+# every game on stderr.
+
+import argparse, asyncio, itertools, math, os, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import chess
+import chess.engine
+import chess.pgn
+
+from EnginePool import EnginePool, max_engine_instances
+
+# ---- Time control and clocks
+
+@dataclass
+class TimeControl:
+    """ Base time and increment per move, both in seconds. """
+    base: float
+    increment: float = 0.0
+
+    @classmethod
+    def parse(cls, text: str) -> "TimeControl":
+        """ From "60" or "10+0.1", like the PGN TimeControl tag. """
+        base, _, increment = text.partition("+")
+        return cls(float(base), float(increment or 0))
+
+    def __str__(self) -> str:
+        return f"{self.base:g}+{self.increment:g}" if self.increment else f"{self.base:g}"
+
+class Clock:
+    """ The remaining time of both sides, measured with time.monotonic().
+
+    A move is timed from just before the position is sent to the engine
+    until its bestmove arrives, so protocol and process overhead count
+    against the side that thinks. The increment is added after the move.
+    """
+
+    def __init__(self, time_control: TimeControl, margin: float = 0.0) -> None:
+        self.time_control = time_control
+        self.margin = margin # grace period before a side loses on time
+        self.remaining = { chess.WHITE: time_control.base, chess.BLACK: time_control.base }
+        self.running = None
+        self.started = 0.0
+
+    def start(self, color: chess.Color) -> None:
+        self.running = color
+        self.started = time.monotonic()
+
+    def stop(self) -> float:
+        """ Stops the running side, returns the time it used. """
+        elapsed = time.monotonic() - self.started
+        color, self.running = self.running, None
+        self.remaining[color] -= elapsed
+        if not self.flagged(color):
+            self.remaining[color] += self.time_control.increment
+        return elapsed
+
+    def flagged(self, color: chess.Color) -> bool:
+        return self.remaining[color] < -self.margin
+
+    def time_left(self, color: chess.Color) -> float:
+        """ The remaining time, including the move in progress. """
+        if color == self.running:
+            return self.remaining[color] - (time.monotonic()-self.started)
+        return self.remaining[color]
+
+    def deadline(self, color: chess.Color) -> float:
+        """ Seconds until `color` has lost on time. """
+        return max(0.0, self.remaining[color] + self.margin)
+
+    def limit(self) -> chess.engine.Limit:
+        increment = self.time_control.increment
+        return chess.engine.Limit(white_clock=max(0.0, self.remaining[chess.WHITE]),
+                                  black_clock=max(0.0, self.remaining[chess.BLACK]),
+                                  white_inc=increment, black_inc=increment)
+
+# ---- Openings
+
+@dataclass
+class Opening:
+    """ A start position and the moves played from it before the engines take over. """
+    name: str
+    fen: str = chess.STARTING_FEN
+    moves: list = field(default_factory=list)
+
+def load_openings(filepath: str) -> list:
+    """ Openings from an EPD file, one position per line, or from the mainlines of a PGN file. """
+    openings = []
+    if filepath.lower().endswith(".epd"):
+        with open(filepath, encoding="utf-8-sig", errors="replace") as epdfile:
+            for number, line in enumerate(epdfile, 1):
+                if not line.strip():
+                    continue
+                board, operations = chess.Board.from_epd(line)
+                openings.append(Opening(str(operations.get("id", f"{os.path.basename(filepath)}:{number}")),
+                                        board.fen()))
+        return openings
+    with open(filepath, encoding="utf-8-sig", errors="replace") as pgn:
+        while True:
+            game = chess.pgn.read_game(pgn)
+            if game is None:
+                break
+            name = game.headers.get("Opening") or game.headers.get("ECO") or f"{os.path.basename(filepath)}:{len(openings)+1}"
+            openings.append(Opening(name, game.board().fen(), list(game.mainline_moves())))
+    return openings
+
+# ---- Adjudication
+
+MATE_SCORE = 100000
+
+@dataclass
+class Adjudication:
+    """ When to end games early.
+
+    A game is resigned once the last `resign_moves` moves of both
+    engines scored at least `resign_score` centipawns for the same side,
+    and drawn from move `draw_start` on once the last `draw_moves` moves
+    of both stayed within `draw_score`. Zero disables a rule. With
+    tablebases, positions they cover end with the tablebase result.
+    """
+    resign_score: int = 0
+    resign_moves: int = 3
+    draw_score: int = 0
+    draw_moves: int = 8
+    draw_start: int = 40
+    tablebases: object = None
+
+    def adjudicate(self, board: chess.Board, scores: list):
+        """ (result, reason) if the game can be ended, else None. `scores` are white's, per ply. """
+        if self.tablebases is not None and self.tablebases.covers(board):
+            result = self.tablebases.probe(board)
+            if result is not None:
+                if abs(result.wdl) < 2:
+                    return "1/2-1/2", "Tablebase draw"
+                white_wins = (result.wdl > 0) == (board.turn == chess.WHITE)
+                return ("1-0" if white_wins else "0-1"), "Tablebase win"
+        if self.resign_score:
+            recent = scores[-2*self.resign_moves:]
+            if len(recent) == 2*self.resign_moves and None not in recent:
+                if all(score >= self.resign_score for score in recent):
+                    return "1-0", "Black resigns"
+                if all(score <= -self.resign_score for score in recent):
+                    return "0-1", "White resigns"
+        if self.draw_score and board.fullmove_number >= self.draw_start:
+            recent = scores[-2*self.draw_moves:]
+            if len(recent) == 2*self.draw_moves and None not in recent \
+               and all(abs(score) <= self.draw_score for score in recent):
+                return "1/2-1/2", "Draw adjudication"
+        return None
+
+# ---- Scores
+
+@dataclass
+class Sprt:
+    """ Sequential probability ratio test of elo0 against elo1, with error rates alpha and beta. """
+    elo0: float
+    elo1: float
+    alpha: float = 0.05
+    beta: float = 0.05
+
+    def bounds(self) -> tuple:
+        return math.log(self.beta/(1-self.alpha)), math.log((1-self.beta)/self.alpha)
+
+    def llr(self, score: "MatchScore") -> float:
+        """ The log likelihood ratio, in the normal approximation to the trinomial. """
+        games = score.games()
+        variance = score.variance()
+        if not games or variance <= 0:
+            return 0.0
+        mean = score.score()
+        s0, s1 = expected_score(self.elo0), expected_score(self.elo1)
+        return (s1-s0)*(2*mean-s0-s1)*games/(2*variance)
+
+    def status(self, score: "MatchScore"):
+        """ "H1 accepted", "H0 accepted" or None while the test goes on. """
+        lower, upper = self.bounds()
+        llr = self.llr(score)
+        if llr >= upper:
+            return "H1 accepted"
+        if llr <= lower:
+            return "H0 accepted"
+        return None
+
+def expected_score(elo: float) -> float:
+    return 1/(1+10**(-elo/400))
+
+def elo_difference(score: float) -> float:
+    score = min(max(score, 1e-6), 1-1e-6)
+    return -400*math.log10(1/score-1) + 0.0 # no -0.0
+
+@dataclass
+class MatchScore:
+    """ Wins, draws and losses of the first engine against the second. """
+    first: str
+    second: str
+    wins: int = 0
+    draws: int = 0
+    losses: int = 0
+
+    def games(self) -> int:
+        return self.wins + self.draws + self.losses
+
+    def add(self, result: str, first_white: bool) -> None:
+        if result == "1/2-1/2":
+            self.draws += 1
+        elif (result == "1-0") == first_white:
+            self.wins += 1
+        else:
+            self.losses += 1
+
+    def score(self) -> float:
+        return (self.wins + self.draws/2)/self.games() if self.games() else 0.5
+
+    def variance(self) -> float:
+        """ Per game variance of the score. """
+        if not self.games():
+            return 0.0
+        mean = self.score()
+        return (self.wins*(1-mean)**2 + self.draws*(0.5-mean)**2 + self.losses*mean**2)/self.games()
+
+    def elo(self) -> tuple:
+        """ The Elo difference and the half width of its 95% interval. """
+        if not self.games():
+            return 0.0, 0.0
+        mean = self.score()
+        deviation = math.sqrt(self.variance()/self.games())
+        low, high = elo_difference(mean-1.96*deviation), elo_difference(mean+1.96*deviation)
+        return elo_difference(mean), (high-low)/2
+
+    def los(self) -> float:
+        """ The likelihood of superiority of the first engine. """
+        if not self.wins + self.losses:
+            return 0.5
+        return 0.5*(1+math.erf((self.wins-self.losses)/math.sqrt(2*(self.wins+self.losses))))
+
+    def summary(self, sprt: Sprt = None) -> str:
+        elo, error = self.elo()
+        text = (f"{self.first} vs {self.second}: +{self.wins} ={self.draws} -{self.losses} "
+                f"[{self.score():.3f}] Elo {elo:+.1f} +/- {error:.1f}, LOS {100*self.los():.1f}%")
+        if sprt is not None:
+            lower, upper = sprt.bounds()
+            text += f", LLR {sprt.llr(self):.2f} ({lower:.2f}, {upper:.2f}) [{sprt.elo0:g}, {sprt.elo1:g}]"
+        return text
+
+# ---- Games
+
+@dataclass
+class GameSnapshot:
+    """ A running game at one moment, for watching it from another thread. """
+    number: int
+    white: str
+    black: str
+    board: chess.Board
+    white_time: float
+    black_time: float
+    result: str = "*"
+
+class MatchGame:
+    """ One scheduled game: who plays which side from which opening. """
+
+    def __init__(self, number: int, white, black, opening: Opening, time_control: TimeControl,
+                 margin: float = 0.0) -> None:
+        self.number = number
+        self.white = white
+        self.black = black
+        self.opening = opening
+        self.board = chess.Board(opening.fen)
+        self.clock = Clock(time_control, margin)
+        self.token = object() # the engines see one game from start to end
+        self.scores = [] # white's score in centipawns per ply, None when unknown
+        self.game = chess.pgn.Game()
+        self.node = self.game
+        self.result = "*"
+        self.termination = ""
+        self.snapshot = None
+        self.update_snapshot()
+
+    def engine_def(self, color: chess.Color):
+        return self.white if color == chess.WHITE else self.black
+
+    def update_snapshot(self) -> None:
+        # replaced as a whole, so a reader never sees half a move
+        self.snapshot = GameSnapshot(self.number, self.white.name, self.black.name, self.board.copy(),
+                                     self.clock.remaining[chess.WHITE], self.clock.remaining[chess.BLACK],
+                                     self.result)
+
+    def push(self, move: chess.Move, comment: str = "", score=None) -> None:
+        self.board.push(move)
+        self.node = self.node.add_variation(move, comment=comment)
+        self.scores.append(score)
+        self.update_snapshot()
+
+    def finish(self, result: str, termination: str) -> None:
+        self.result = result
+        self.termination = termination
+        self.update_snapshot()
+
+    def pgn(self, event: str, time_control: TimeControl) -> str:
+        headers = self.game.headers
+        headers["Event"] = event
+        headers["Site"] = "ChessBoy"
+        headers["Date"] = time.strftime("%Y.%m.%d")
+        headers["Round"] = str(self.number)
+        headers["White"] = self.white.name
+        headers["Black"] = self.black.name
+        headers["Result"] = self.result
+        headers["TimeControl"] = str(time_control)
+        headers["Termination"] = self.termination
+        headers["Opening"] = self.opening.name
+        if self.opening.fen != chess.STARTING_FEN:
+            headers["FEN"] = self.opening.fen
+            headers["SetUp"] = "1"
+        return str(self.game) + "\n\n"
+
+def termination_of(board: chess.Board) -> str:
+    outcome = board.outcome(claim_draw=True)
+    return outcome.termination.name.replace("_", " ").capitalize()
+
+def format_comment(score, depth, elapsed: float) -> str:
+    """ Like "+0.35/18 1.234s", the way match PGNs usually carry it. """
+    if score is None:
+        return f"{elapsed:.3f}s"
+    if score.is_mate():
+        text = f"{'+' if score.mate() > 0 else '-'}M{abs(score.mate())}"
+    else:
+        text = f"{score.score()/100:+.2f}"
+    return f"{text}/{depth or 0} {elapsed:.3f}s"
+
+# ---- Matches
+
+class EngineCrashed(Exception):
+    pass
+
+class Match:
+    """ Plays a match or round robin tournament between engines.
+
+    Every pairing plays each opening twice with colours reversed, for
+    `rounds` openings. Up to `concurrency` games run at once on one
+    asyncio loop, each holding its two engines from an own EnginePool
+    for the whole game. An engine that crashes is restarted and asked
+    for the move again; a second crash in the same game loses it.
+    Snapshots of the running games can be read from any thread. Disk
+    I/O, tablebase probes and the PGN output, runs in threads off the
+    loop, so it is never charged to the clocks of the running games.
+    """
+
+    def __init__(self, engine_defs: list, time_control: TimeControl, openings: list = None,
+                 rounds: int = 1, concurrency: int = None, adjudication: Adjudication = None,
+                 output: str = None, sprt: Sprt = None, margin: float = 0.05, event: str = "Engine Match",
+                 progress=None) -> None:
+        self.engine_defs = engine_defs
+        self.time_control = time_control
+        self.openings = openings or [ Opening("Start position") ]
+        self.rounds = rounds
+        self.concurrency = concurrency or max_engine_instances()
+        self.adjudication = adjudication or Adjudication()
+        self.output = output
+        self.sprt = sprt
+        self.margin = margin
+        self.event = event
+        self.progress = progress or (lambda message: print(message, file=sys.stderr))
+        self.pool = EnginePool(max_instances=2*self.concurrency)
+        # by engine names, which have to be distinct
+        self.scores = { (first.name, second.name): MatchScore(first.name, second.name)
+                        for first, second in itertools.combinations(engine_defs, 2) }
+        self.schedule = self.make_schedule()
+        self.running = () # MatchGames in progress, replaced as a whole
+        self.writer = None  # appends finished games to the output in order
+        self.writes = []
+        self.tasks = []
+        self.finished = 0
+        self.stopped = False
+        self.conclusion = None
+
+    def make_schedule(self) -> list:
+        games = []
+        for round_index in range(self.rounds):
+            opening = self.openings[round_index % len(self.openings)]
+            for first, second in itertools.combinations(self.engine_defs, 2):
+                for white, black in ((first, second), (second, first)):
+                    games.append(MatchGame(len(games)+1, white, black, opening, self.time_control, self.margin))
+        return games
+
+    def snapshots(self) -> list:
+        """ The GameSnapshots of the running games, safe to call from any thread. """
+        return [ game.snapshot for game in self.running ]
+
+    def stop(self) -> None:
+        """ Ends the match, games in progress are dropped. Call on the match loop. """
+        self.stopped = True
+        for task in self.tasks:
+            task.cancel()
+
+    async def run(self) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        if self.output is not None:
+            open(self.output, "a").close()
+
+        async def play(game: MatchGame) -> None:
+            async with semaphore:
+                if self.stopped:
+                    return
+                self.running += (game,)
+                try:
+                    await self.play_game(game)
+                except (OSError, chess.engine.EngineError) as error:
+                    game.finish("*", f"Aborted: {error}")
+                finally:
+                    self.running = tuple(running for running in self.running if running is not game)
+                self.game_finished(game)
+
+        self.tasks = [ asyncio.ensure_future(play(game)) for game in self.schedule ]
+        try:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        finally:
+            await self.pool.close()
+            await asyncio.gather(*self.writes)
+            if self.writer is not None:
+                self.writer.shutdown()
+
+    def game_finished(self, game: MatchGame) -> None:
+        self.finished += 1
+        if self.output is not None:
+            if self.writer is None:
+                self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="MatchOutput")
+            self.writes.append(asyncio.get_running_loop().run_in_executor(
+                self.writer, self.write_game, game.pgn(self.event, self.time_control)))
+        self.progress(f"Game {game.number} ({self.finished}/{len(self.schedule)}): "
+                      f"{game.white.name} - {game.black.name} {game.result} {{{game.termination}}}")
+        if game.result == "*":
+            return
+        for (first, second), score in self.scores.items():
+            if {first, second} == {game.white.name, game.black.name}:
+                score.add(game.result, game.white.name == first)
+                sprt = self.sprt if len(self.scores) == 1 else None
+                self.progress(score.summary(sprt))
+                if sprt is not None:
+                    self.conclusion = sprt.status(score)
+                    if self.conclusion is not None:
+                        self.progress(f"SPRT: {self.conclusion}")
+                        self.stop()
+
+    def write_game(self, pgn: str) -> None:
+        # Runs in the writer thread
+        with open(self.output, "a", encoding="utf-8") as output:
+            output.write(pgn)
+
+    async def adjudicate(self, game: MatchGame):
+        """ Adjudication.adjudicate(), in the tablebase thread if it may read the tables. """
+        tablebases = self.adjudication.tablebases
+        if tablebases is None:
+            return self.adjudication.adjudicate(game.board, game.scores)
+        return await asyncio.wrap_future(tablebases.submit(self.adjudication.adjudicate,
+                                                           game.board.copy(), list(game.scores)))
+
+    async def play_game(self, game: MatchGame) -> None:
+        for move in game.opening.moves:
+            game.push(move, comment="book")
+        engines = dict()
+        try:
+            for color in chess.COLORS:
+                engines[color] = await self.pool.acquire(game.engine_def(color), game.engine_def(color).options)
+            while True:
+                if game.board.is_game_over(claim_draw=True):
+                    game.finish(game.board.result(claim_draw=True), termination_of(game.board))
+                    return
+                adjudicated = await self.adjudicate(game)
+                if adjudicated is not None:
+                    game.finish(*adjudicated)
+                    return
+                color = game.board.turn
+                try:
+                    result, elapsed = await self.play_move(game, engines, color)
+                except EngineCrashed as error:
+                    game.finish(lose(color), f"{game.engine_def(color).name} crashed: {error}")
+                    return
+                if game.clock.flagged(color):
+                    opponent_can_win = not game.board.has_insufficient_material(not color)
+                    game.finish(lose(color) if opponent_can_win else "1/2-1/2", "Time forfeit")
+                    return
+                if result.move is None or not game.board.is_legal(result.move):
+                    game.finish(lose(color), f"No legal move from {game.engine_def(color).name}")
+                    return
+                score = result.info.get("score")
+                white_score = score.white() if score is not None else None
+                game.push(result.move, format_comment(white_score, result.info.get("depth"), elapsed),
+                          white_score.score(mate_score=MATE_SCORE) if white_score is not None else None)
+        finally:
+            for pooled in engines.values():
+                if pooled.alive():
+                    await self.pool.release(pooled)
+                else:
+                    await self.pool.discard(pooled)
+
+    async def play_move(self, game: MatchGame, engines: dict, color: chess.Color) -> tuple:
+        """ The engine's PlayResult and the time it took, restarting a crashed engine once. """
+        engine_def = game.engine_def(color)
+        game.clock.start(color)
+        for attempt in range(2):
+            try:
+                result = await asyncio.wait_for(
+                    engines[color].protocol.play(game.board, game.clock.limit(), game=game.token,
+                                                 info=chess.engine.INFO_SCORE),
+                    game.clock.deadline(color) + 1.0)
+                return result, game.clock.stop()
+            except asyncio.TimeoutError:
+                # it never answered in time, the clock decides
+                return chess.engine.PlayResult(None, None), game.clock.stop()
+            except (chess.engine.EngineTerminatedError, chess.engine.EngineError) as error:
+                await self.pool.discard(engines[color])
+                if attempt:
+                    game.clock.stop()
+                    raise EngineCrashed(str(error) or type(error).__name__)
+                self.progress(f"{engine_def.name} crashed in game {game.number}, restarting")
+                engines[color] = await self.pool.acquire(engine_def, engine_def.options)
+
+    def summary(self) -> str:
+        lines = [ score.summary(self.sprt if len(self.scores) == 1 else None) for score in self.scores.values() ]
+        if len(self.engine_defs) > 2:
+            points = { engine_def.name: 0.0 for engine_def in self.engine_defs }
+            for score in self.scores.values():
+                points[score.first] += score.wins + score.draws/2
+                points[score.second] += score.losses + score.draws/2
+            lines.append("Standings:")
+            lines += [ f"{rank:3}. {name:30} {value:g}"
+                       for rank, (name, value) in enumerate(sorted(points.items(), key=lambda item: -item[1]), 1) ]
+        if self.conclusion is not None:
+            lines.append(f"SPRT: {self.conclusion}")
+        return "\n".join(lines)
+
+def lose(color: chess.Color) -> str:
+    return "0-1" if color == chess.WHITE else "1-0"
+
+# ---- Main
+
+def find_engines(args) -> list:
+    from Preferences import EngineDef, EnginesSettings
+    engine_defs = []
+    if args.engine:
+        engine_settings = EnginesSettings()
+        engine_settings.restore_settings(args.settings)
+        for name in args.engine:
+            matches = [ engine_def for engine_def in engine_settings.engine_defs if engine_def.name == name ]
+            if not matches:
+                raise SystemExit(f"Engine {name} is not configured in {args.settings}")
+            engine_defs.append(matches[-1])
+    for command in args.engine_cmd or []:
+        name, _, filepath = command.rpartition("=")
+        engine_defs.append(EngineDef(name or os.path.basename(filepath), filepath))
+    names = [ engine_def.name for engine_def in engine_defs ]
+    if len(engine_defs) < 2:
+        raise SystemExit("A match needs at least two engines")
+    if len(set(names)) < len(names):
+        raise SystemExit("Engines need distinct names, use --engine-cmd NAME=PATH")
+    return engine_defs
+
+def make_match(args) -> Match:
+    tablebases = None
+    if args.tablebases:
+        from Tablebases import Tablebases
+        tablebases = Tablebases(args.tablebases)
+        tablebases.preload()
+    adjudication = Adjudication(args.resign_score, args.resign_moves, args.draw_score, args.draw_moves,
+                                args.draw_start, tablebases)
+    openings = load_openings(args.openings) if args.openings else None
+    sprt = Sprt(*args.sprt) if args.sprt else None
+    return Match(find_engines(args), TimeControl.parse(args.tc), openings, args.rounds, args.concurrency,
+                 adjudication, args.output, sprt, args.margin, args.event)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Play engine matches and tournaments without the GUI.")
+    parser.add_argument("--engine", action="append", help="engine name from the settings, repeatable")
+    parser.add_argument("--engine-cmd", action="append", help="engine executable as PATH or NAME=PATH, repeatable")
+    parser.add_argument("--settings", default="settings/engines.json")
+    parser.add_argument("--tc", default="10+0.1", help="seconds per game plus increment per move")
+    parser.add_argument("--margin", type=float, default=0.05, help="seconds an engine may overrun its clock")
+    parser.add_argument("--rounds", type=int, default=1, help="openings per pairing, each played with both colours")
+    parser.add_argument("--openings", help="EPD or PGN file of start positions")
+    parser.add_argument("--concurrency", type=int, help="games at once, default one per core")
+    parser.add_argument("--resign-score", type=int, default=0, help="centipawns, 0 never resigns")
+    parser.add_argument("--resign-moves", type=int, default=3)
+    parser.add_argument("--draw-score", type=int, default=0, help="centipawns, 0 never adjudicates draws")
+    parser.add_argument("--draw-moves", type=int, default=8)
+    parser.add_argument("--draw-start", type=int, default=40, help="first move number for draw adjudication")
+    parser.add_argument("--tablebases", action="append", help="Syzygy directory, repeatable")
+    parser.add_argument("--sprt", type=float, nargs=2, metavar=("ELO0", "ELO1"), help="stop once the SPRT decides")
+    parser.add_argument("--event", default="Engine Match")
+    parser.add_argument("-o", "--output", help="PGN file the games are appended to")
+    return parser.parse_args(argv)
+
+if __name__=="__main__":
+    match = make_match(parse_args())
+    try:
+        asyncio.run(match.run())
+    except KeyboardInterrupt:
+        pass
+    print(match.summary())
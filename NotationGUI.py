@@ -1,12 +1,172 @@
-
-from PyQt5.QtCore import Qt, QAbstractTableModel
-from PyQt5.QtGui import QPalette, QColor, QIcon, QBrush, QPen, QPainter, QTransform
-from PyQt5.QtWidgets import QFrame, QDockWidget, QLabel, QHBoxLayout, QVBoxLayout
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QPointF
+from PyQt5.QtGui import QPalette, QColor, QIcon, QBrush, QPen, QPainter, QTransform, QFont, QPolygonF
+from PyQt5.QtWidgets import QDockWidget, QWidget, QVBoxLayout, QTableView, QHeaderView, QAbstractItemView, QLabel
 import chess
 from ChessEventManager import eventManager
+from GameAnalysis import PlyEval, judge, format_score
 
 # Tutorial from https://www.pythonguis.com/tutorials/qtableview-modelviews-numpy-pandas/
 
+class NotationModel(QAbstractTableModel):
+    """ The moves of the game as a table with one row per move pair. """
+
+    marker_colors = { "??": QColor(220, 40, 40), "?": QColor(230, 130, 30), "?!": QColor(200, 170, 40) }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.moves = [] # san per ply
+        self.current_ply = 0 # number of plies played on the board
+        self.annotations = dict() # ply -> (marker, score text) from the game analysis
+        self.bold = QFont()
+        self.bold.setBold(True)
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return (len(self.moves)+1)//2
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return 2
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        ply = self.index_to_ply(index)
+        if ply >= len(self.moves):
+            return None
+        if role == Qt.DisplayRole:
+            if ply in self.annotations:
+                marker, score = self.annotations[ply]
+                return f"{self.moves[ply]}{marker}  {score}"
+            return self.moves[ply]
+        if role == Qt.FontRole and ply == self.current_ply-1:
+            return self.bold
+        if role == Qt.ForegroundRole and ply in self.annotations:
+            return self.marker_colors.get(self.annotations[ply][0])
+        return None
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Vertical:
+            return f"{section+1}:"
+        return ("White", "Black")[section]
+
+    def index_to_ply(self, index: QModelIndex) -> int:
+        return index.row()*2 + index.column()
+
+    def ply_to_index(self, ply: int) -> QModelIndex:
+        return self.index(ply//2, ply%2)
+
+    def set_move(self, ply: int, san: str) -> None:
+        """ Sets the move of `ply`, dropping all moves after it. """
+        if ply < len(self.moves):
+            self.truncate(ply)
+        if ply%2 == 0:
+            self.beginInsertRows(QModelIndex(), ply//2, ply//2)
+            self.moves.append(san)
+            self.endInsertRows()
+        else:
+            self.moves.append(san)
+            self.dataChanged.emit(self.ply_to_index(ply), self.ply_to_index(ply))
+
+    def set_annotation(self, ply: int, marker: str, score: str) -> None:
+        self.annotations[ply] = (marker, score)
+        self.dataChanged.emit(self.ply_to_index(ply), self.ply_to_index(ply))
+
+    def clear_annotations(self) -> None:
+        self.beginResetModel()
+        self.annotations.clear()
+        self.endResetModel()
+
+    def truncate(self, plies: int) -> None:
+        for ply in [ ply for ply in self.annotations if ply >= plies ]:
+            del self.annotations[ply]
+        rows = (plies+1)//2
+        if rows < self.rowCount():
+            self.beginRemoveRows(QModelIndex(), rows, self.rowCount()-1)
+            del self.moves[plies:]
+            self.endRemoveRows()
+        else:
+            del self.moves[plies:]
+        if plies%2:
+            self.dataChanged.emit(self.ply_to_index(plies), self.ply_to_index(plies))
+
+    def set_current_ply(self, ply: int) -> None:
+        old = self.current_ply
+        self.current_ply = ply
+        for changed in (old-1, ply-1):
+            if changed >= 0:
+                self.dataChanged.emit(self.ply_to_index(changed), self.ply_to_index(changed))
+
+    def set_moves(self, moves: list) -> None:
+        self.beginResetModel()
+        self.moves = list(moves)
+        self.annotations.clear()
+        self.current_ply = 0
+        self.endResetModel()
+
+    def clear(self) -> None:
+        self.beginResetModel()
+        self.moves = []
+        self.annotations.clear()
+        self.current_ply = 0
+        self.endResetModel()
+
+class EvalGraph(QWidget):
+    """ White's expected score over the plies of the game, click to jump to a ply. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setMinimumHeight(80)
+        self.values = [] # expected score per position, None if not analysed yet
+        self.current_ply = 0
+
+    def set_value(self, ply: int, value: float) -> None:
+        if ply >= len(self.values):
+            self.values.extend([None]*(ply+1-len(self.values)))
+        self.values[ply] = value
+        self.update()
+
+    def set_current_ply(self, ply: int) -> None:
+        self.current_ply = ply
+        self.update()
+
+    def clear(self) -> None:
+        self.values = []
+        self.update()
+
+    def truncate(self, plies: int) -> None:
+        del self.values[plies+1:]
+        self.update()
+
+    def ply_x(self, ply: int) -> float:
+        return ply*self.width()/max(1, len(self.values)-1)
+
+    def paintEvent(self, event) -> None:
+        painter = QPainter(self)
+        width, height = self.width(), self.height()
+        painter.fillRect(0, 0, width, height, QColor(50, 50, 50))
+        points = [ QPointF(self.ply_x(ply), height*(1-value))
+                   for ply, value in enumerate(self.values) if value is not None ]
+        if points:
+            area = QPolygonF([ QPointF(points[0].x(), height) ] + points + [ QPointF(points[-1].x(), height) ])
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(QColor(235, 235, 235))
+            painter.drawPolygon(area)
+        painter.setPen(QPen(QColor(128, 128, 128), 1, Qt.DashLine))
+        painter.drawLine(0, height//2, width, height//2)
+        if self.values:
+            painter.setPen(QPen(QColor(42, 130, 218), 2))
+            x = round(self.ply_x(self.current_ply))
+            painter.drawLine(x, 0, x, height)
+        painter.end()
+
+    def mousePressEvent(self, event) -> None:
+        if len(self.values) > 1:
+            ply = round(event.x()*(len(self.values)-1)/max(1, self.width()))
+            eventManager.onJumpTry(max(0, min(ply, len(self.values)-1)))
+
 class NotationGUI(QDockWidget):
 
     def __init__(self, *args, **kwargs):
@@ -15,72 +175,112 @@ class NotationGUI(QDockWidget):
         self.setMinimumSize(300, 500)
         self.setWindowTitle("Notation")
         eventManager.onMove += self.update
+        eventManager.onJump += self.jumped
+        eventManager.onTakeback += self.taken_back
         eventManager.newGame += self.clear
-        
-        self.data = [["", "", ""]]
+        eventManager.onGameLoaded += self.game_loaded
 
-        self.centralWidget = QFrame()
-        self.centralWidget.setFrameStyle(QFrame.StyledPanel | QFrame.Plain)
-        self.moveLayout = QVBoxLayout()
-        self.moveLayout.setAlignment(Qt.AlignTop)
-        self.centralWidget.setLayout(self.moveLayout)
-        self.setWidget(self.centralWidget)
+        self.model = NotationModel()
+
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setShowGrid(False)
+        # fixed row heights, the view never has to measure rows
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.clicked.connect(self.move_clicked)
+
+        self.evals = [] # PlyEval per position of the analysed game, None if not there yet
+        self.graph = EvalGraph()
+        self.graph.hide()
+        self.status = QLabel()
+        self.status.hide()
+        self.mainWidget = QWidget()
+        self.mainWidget.setLayout(QVBoxLayout())
+        self.mainWidget.layout().setContentsMargins(0, 0, 0, 0)
+        self.mainWidget.layout().addWidget(self.table)
+        self.mainWidget.layout().addWidget(self.graph)
+        self.mainWidget.layout().addWidget(self.status)
+        self.setWidget(self.mainWidget)
 
     def set_board(self, board:chess.Board) -> None:
         self.board = board
         # self.game = chess.pgn.Game.from_board(self.board)
 
     def line_count(self) -> int:
-        mv = len(self.board.move_stack)
-        return mv//2+mv%2
+        return self.model.rowCount()
 
     def clear(self) -> None:
-        pass
+        self.model.clear()
+        self.clear_evaluations()
 
     def update(self, move: chess.Move, san: str, *args) -> None:
+        ply = len(self.board.move_stack)
+        if ply-1 >= len(self.model.moves) or self.model.moves[ply-1] != san:
+            # a move off the mainline drops the rest of the game
+            del self.evals[ply:]
+            self.graph.truncate(ply-1)
+            self.model.set_move(ply-1, san)
+        self.model.set_current_ply(ply)
+        self.graph.set_current_ply(ply)
+        self.table.scrollTo(self.model.ply_to_index(ply-1))
+
+    def game_loaded(self, game) -> None:
+        self.model.set_moves([ node.san() for node in game.mainline() ])
+        self.clear_evaluations()
+
+    def taken_back(self, ply: int) -> None:
+        self.model.truncate(ply)
+        del self.evals[ply+1:]
+        self.graph.truncate(ply)
+
+    def jumped(self, ply: int) -> None:
+        self.model.set_current_ply(ply)
+        self.graph.set_current_ply(ply)
+        if ply > 0:
+            self.table.scrollTo(self.model.ply_to_index(ply-1))
+
+    def move_clicked(self, index: QModelIndex) -> None:
+        ply = self.model.index_to_ply(index)
+        if ply < len(self.model.moves):
+            # jump to the position after the clicked move
+            eventManager.onJumpTry(ply+1)
+
+    # ---- Game analysis
+
+    def clear_evaluations(self) -> None:
+        self.evals = []
+        self.model.clear_annotations()
+        self.graph.clear()
+        self.graph.hide()
+        self.status.hide()
+
+    def set_evaluation(self, ply_eval: PlyEval) -> None:
+        """ Shows the evaluation of the position after `ply_eval.ply` moves. """
+        ply = ply_eval.ply
+        if ply >= len(self.evals):
+            self.evals.extend([None]*(ply+1-len(self.evals)))
+        current = self.evals[ply]
+        if current is not None and current.final and not ply_eval.final:
+            return
+        self.evals[ply] = ply_eval
+        self.graph.set_value(ply, ply_eval.score.wdl().expectation())
+        self.graph.show()
+        # the moves into and out of the position
+        for move_ply in (ply-1, ply):
+            self.annotate(move_ply)
+
+    def annotate(self, move_ply: int) -> None:
+        if not 0 <= move_ply < len(self.model.moves) or move_ply+1 >= len(self.evals):
+            return
+        before, after = self.evals[move_ply], self.evals[move_ply+1]
+        if after is None:
+            return
+        marker = judge(before.score, after.score, before.turn) if before is not None else ""
+        self.model.set_annotation(move_ply, marker, format_score(after.score))
 
-        # Do we need to add a new line?
-        if self.moveLayout.count()<self.line_count():
-        
-            # create labels
-            self.move_number_label = QLabel(f"<b>{self.line_count()}:</b>")
-            self.white_move_label = QLabel()
-            self.black_move_label = QLabel()
-
-            # create line
-            self.current_line = QHBoxLayout()
-            self.current_line.addWidget(self.move_number_label)
-            self.current_line.addWidget(self.white_move_label)
-            self.current_line.addWidget(self.black_move_label)
-
-            # add line to layout
-            self.moveLayout.addLayout(self.current_line)
-        
-        if self.board.turn == chess.WHITE:
-            # black played last
-            # self.black_move_label.setText( move.uci() )
-            self.black_move_label.setText(san)
-        elif self.board.turn == chess.BLACK:
-            # self.white_move_label.setText( move.uci() )               
-            self.white_move_label.setText(san)
-
-
-    def update_old(self, move: chess.Move, *args) -> None:
-        m=0
-        while m<len(self.board.move_stack):
-            line = QHBoxLayout()
-            self.moveLayout.addLayout(line)
-            moveNumber = QLabel(f"<b>{m//2+1}:</b> ")
-            # self.moveLayout.addWidget(moveNumber, m//2, 0, Qt.AlignTop)
-            line.addWidget(moveNumber)
-            whiteMove = QLabel(f"{self.board.move_stack[m].uci()}")
-            # self.moveLayout.addWidget(whiteMove, m//2, 1, Qt.AlignTop)
-            line.addWidget(whiteMove)
-            if (m+1) < len(self.board.move_stack):
-                blackMove = QLabel(f"{self.board.move_stack[m+1].uci()}")
-                # self.moveLayout.addWidget(blackMove, m//2, 2, Qt.AlignTop)
-                line.addWidget(blackMove)
-            else:
-                # self.moveLayout.addWidget(QLabel(""), m//2, 2, Qt.AlignTop)
-                line.addWidget(QLabel(""))
-            m+=2
+    def set_analysis_status(self, message: str) -> None:
+        self.status.setText(message)
+        self.status.show()
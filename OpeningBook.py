@@ -0,0 +1,82 @@
+# -------------------------------
+# OpeningBook
+# -------------------------------
+
+import random, threading
+from dataclasses import dataclass, field
+import chess
+import chess.polyglot
+
+@dataclass
+class BookMove:
+    """ A book move with its share of the combined weight of all books. """
+    move: chess.Move
+    weight: float
+    books: list = field(default_factory=list) # names of the books that have it
+
+class OpeningBooks:
+    """ Polyglot books, looked up together.
+
+    Every book is memory mapped on first use and searched by binary
+    search over its sorted Zobrist keys, so a lookup reads a few pages
+    of the file no matter how large it is. Within a book, moves share
+    the position by their entry weights. Across books, each book
+    counts by the weight it was given in the preferences.
+    """
+
+    def __init__(self, book_defs: list) -> None:
+        self.book_defs = book_defs
+        self.readers = dict() # filepath -> MemoryMappedReader, None if it can't be opened
+        self.lock = threading.Lock()
+
+    def reader(self, book_def):
+        with self.lock:
+            if book_def.filepath not in self.readers:
+                try:
+                    self.readers[book_def.filepath] = chess.polyglot.open_reader(book_def.filepath)
+                except OSError as error:
+                    print(f"OpeningBooks: Can't open {book_def.filepath}: {error.strerror}")
+                    self.readers[book_def.filepath] = None
+            return self.readers[book_def.filepath]
+
+    def moves(self, board: chess.Board) -> list:
+        """ The book moves of the position, highest weight first. """
+        found = dict()
+        total_weight = 0.0
+        for book_def in self.book_defs:
+            reader = self.reader(book_def)
+            if reader is None or book_def.weight <= 0:
+                continue
+            entries = list(reader.find_all(board))
+            entries_weight = sum(entry.weight for entry in entries)
+            if not entries_weight:
+                continue
+            total_weight += book_def.weight
+            for entry in entries:
+                book_move = found.get(entry.move)
+                if book_move is None:
+                    book_move = found[entry.move] = BookMove(entry.move, 0.0)
+                book_move.weight += book_def.weight * entry.weight / entries_weight
+                book_move.books.append(book_def.name)
+        for book_move in found.values():
+            book_move.weight /= total_weight
+        return sorted(found.values(), key=lambda book_move: book_move.weight, reverse=True)
+
+    def choose(self, board: chess.Board, rng: random.Random = random):
+        """ A book move picked at random by weight, None when out of book. """
+        moves = self.moves(board)
+        if not moves:
+            return None
+        return rng.choices([ book_move.move for book_move in moves ],
+                           weights=[ book_move.weight for book_move in moves ])[0]
+
+    def set_books(self, book_defs: list) -> None:
+        self.close()
+        self.book_defs = book_defs
+
+    def close(self) -> None:
+        with self.lock:
+            for reader in self.readers.values():
+                if reader is not None:
+                    reader.close()
+            self.readers.clear()
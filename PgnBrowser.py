@@ -0,0 +1,130 @@
+from array import array
+import threading
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, pyqtSignal
+from PyQt5.QtWidgets import QDockWidget, QWidget, QVBoxLayout, QHBoxLayout, \
+                            QTableView, QHeaderView, QAbstractItemView, \
+                            QComboBox, QLineEdit, QLabel
+import chess
+from ChessEventManager import eventManager
+from PgnIndex import PgnIndex
+
+class PgnGamesModel(QAbstractTableModel):
+    """ The games of a PgnIndex, only the visible rows are ever looked up. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.index_ = None
+        self.rows = array("I") # game numbers after filtering
+
+    def set_index(self, index: PgnIndex) -> None:
+        self.beginResetModel()
+        self.index_ = index
+        self.rows = array("I", range(len(index)))
+        self.endResetModel()
+
+    def set_rows(self, rows: array) -> None:
+        self.beginResetModel()
+        self.rows = rows
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(PgnIndex.fields)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or self.index_ is None:
+            return None
+        return self.index_.header(self.rows[index.row()], PgnIndex.fields[index.column()])
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return PgnIndex.fields[section]
+        return str(self.rows[section]+1) if self.index_ is not None else None
+
+class PgnBrowser(QDockWidget):
+    """ Lists the games of a PGN file and loads the selected one. """
+
+    indexReady = pyqtSignal(object)
+    indexFailed = pyqtSignal(str)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setAllowedAreas(Qt.LeftDockWidgetArea | Qt.RightDockWidgetArea | Qt.BottomDockWidgetArea)
+        self.setMinimumSize(300, 200)
+        self.setWindowTitle("Games")
+        self.pgn_index = None
+        self.indexReady.connect(self.index_ready)
+        self.indexFailed.connect(self.status_message)
+
+        self.mainWidget = QWidget()
+        self.mainWidget.setLayout(QVBoxLayout())
+
+        filterRow = QWidget()
+        filterRow.setLayout(QHBoxLayout())
+        filterRow.layout().setContentsMargins(0, 0, 0, 0)
+        self.filterField = QComboBox()
+        self.filterField.addItems(PgnIndex.fields)
+        filterRow.layout().addWidget(self.filterField)
+        self.filterText = QLineEdit()
+        self.filterText.setPlaceholderText("Filter")
+        self.filterText.returnPressed.connect(self.apply_filter)
+        filterRow.layout().addWidget(self.filterText)
+        self.mainWidget.layout().addWidget(filterRow)
+
+        self.model = PgnGamesModel()
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.activated.connect(self.game_selected)
+        self.table.doubleClicked.connect(self.game_selected)
+        self.mainWidget.layout().addWidget(self.table)
+
+        self.status = QLabel()
+        self.mainWidget.layout().addWidget(self.status)
+        self.setWidget(self.mainWidget)
+
+    def open_file(self, filepath: str) -> None:
+        """ Indexes the file in the background, the list fills in when done. """
+        self.status.setText(f"Indexing {filepath}...")
+        threading.Thread(target=self.index_file, args=(filepath,), daemon=True).start()
+
+    def index_file(self, filepath: str) -> None:
+        # Runs in the indexing thread
+        try:
+            self.indexReady.emit(PgnIndex(filepath).open())
+        except OSError as error:
+            self.indexFailed.emit(f"Can't open {filepath}: {error.strerror}")
+
+    def status_message(self, message: str) -> None:
+        self.status.setText(message)
+
+    def index_ready(self, pgn_index: PgnIndex) -> None:
+        if self.pgn_index is not None:
+            self.pgn_index.close()
+        self.pgn_index = pgn_index
+        self.model.set_index(pgn_index)
+        self.status.setText(f"{len(pgn_index)} games")
+
+    def apply_filter(self) -> None:
+        if self.pgn_index is None:
+            return
+        rows = array("I", range(len(self.pgn_index)))
+        text = self.filterText.text().strip()
+        if text:
+            rows = self.pgn_index.filter(rows, self.filterField.currentText(), text)
+        self.model.set_rows(rows)
+        self.status.setText(f"{len(rows)} of {len(self.pgn_index)} games")
+
+    def game_selected(self, index: QModelIndex) -> None:
+        if not index.isValid():
+            return
+        game = self.pgn_index.game(self.model.rows[index.row()])
+        if game is not None:
+            eventManager.onGameLoadTry(game)
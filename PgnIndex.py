@@ -0,0 +1,169 @@
+# -------------------------------
+# PgnIndex
+# -------------------------------
+
+import io, json, mmap, os, re, struct, sys
+from array import array
+import chess
+import chess.pgn
+
+# A game starts with a tag after a blank line, or at the start of the file
+GAME_START = re.compile(rb"\n[ \t\r]*\n[ \t\r\n]*\[")
+FILE_START = re.compile(rb"(?:\xef\xbb\xbf)?\s*\[")
+HEADER_END = re.compile(rb"\n[ \t\r]*\n")
+# a tag starts a line, or the file right after a UTF-8 BOM
+TAG = re.compile(rb'(?:^|(?<=\A\xef\xbb\xbf))\[([A-Za-z0-9_]+)\s+"((?:[^"\\\r\n]|\\.)*)"\s*\]', re.M)
+
+INDEX_VERSION = 3
+CACHE_MAGIC = b"CBI\n"
+
+class PgnIndex:
+    """ Offsets and a few headers of every game in a PGN file.
+
+    Opening scans the memory mapped file once and only reads the header
+    blocks. Every header value is stored as an id into a per-field string
+    table, so a game costs a few bytes per field. The index is cached in
+    a file beside the PGN and reused while the PGN is unchanged. Games
+    are parsed when asked for with game().
+    """
+
+    fields = ("White", "Black", "Result", "Date", "Event", "ECO")
+
+    def __init__(self, filepath: str) -> None:
+        self.filepath = filepath
+        self.cachepath = filepath + ".cbi"
+        self.offsets = array("Q")
+        self.strings = { field: [] for field in self.fields }
+        self.columns = { field: array("I") for field in self.fields }
+        self.file = None
+        self.map = None
+
+    def __len__(self) -> int:
+        return max(0, len(self.offsets)-1)
+
+    def open(self) -> "PgnIndex":
+        self.file = open(self.filepath, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        if size:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if not self.load_cache():
+            self.scan()
+            self.store_cache()
+        return self
+
+    def close(self) -> None:
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def file_key(self) -> tuple:
+        stat = os.stat(self.filepath)
+        return (INDEX_VERSION, stat.st_size, stat.st_mtime_ns)
+
+    # ---- Scanning
+
+    def scan(self) -> None:
+        data = self.map
+        self.offsets = array("Q")
+        self.strings = { field: [] for field in self.fields }
+        self.columns = { field: array("I") for field in self.fields }
+        if data is None:
+            self.offsets.append(0)
+            return
+        ids = { field: dict() for field in self.fields }
+        for start in self.game_starts(data):
+            self.offsets.append(start)
+            end = HEADER_END.search(data, start)
+            end = end.start() if end else len(data)
+            headers = dict()
+            for match in TAG.finditer(data, start, end):
+                headers[match.group(1)] = match.group(2)
+            for field in self.fields:
+                value = headers.get(field.encode(), b"?").decode("utf-8", "replace")
+                table = ids[field]
+                string_id = table.get(value)
+                if string_id is None:
+                    string_id = table[value] = len(self.strings[field])
+                    self.strings[field].append(value)
+                self.columns[field].append(string_id)
+        self.offsets.append(len(data))
+
+    def game_starts(self, data):
+        first = FILE_START.match(data)
+        if first:
+            yield first.end()-1
+        for match in GAME_START.finditer(data):
+            if not first or match.end() != first.end():
+                yield match.end()-1
+
+    # ---- Cache beside the PGN
+
+    # The cache is a JSON header with the string tables followed by the
+    # raw offsets and columns. Nothing in it is executed, a broken or
+    # foreign file is just a cache miss.
+
+    def load_cache(self) -> bool:
+        try:
+            with open(self.cachepath, "rb") as cachefile:
+                if cachefile.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                    return False
+                header_size, = struct.unpack("<Q", cachefile.read(8))
+                header = json.loads(cachefile.read(header_size).decode("utf-8"))
+                if header["key"] != list(self.file_key()) or header["byteorder"] != sys.byteorder:
+                    return False
+                games = header["games"]
+                offsets = self.read_array(cachefile, "Q", games+1)
+                strings, columns = dict(), dict()
+                for field in self.fields:
+                    strings[field] = [ str(value) for value in header["strings"][field] ]
+                    columns[field] = self.read_array(cachefile, "I", games)
+                    if games and max(columns[field]) >= len(strings[field]):
+                        return False
+        except Exception:
+            return False # unreadable, truncated or not ours: scan again
+        self.offsets, self.strings, self.columns = offsets, strings, columns
+        return True
+
+    def read_array(self, cachefile, typecode: str, count: int) -> array:
+        values = array(typecode)
+        data = cachefile.read(count*values.itemsize)
+        if len(data) != count*values.itemsize:
+            raise ValueError("truncated index cache")
+        values.frombytes(data)
+        return values
+
+    def store_cache(self) -> None:
+        header = json.dumps({ "key": self.file_key(), "byteorder": sys.byteorder, "games": len(self),
+                              "strings": self.strings }).encode("utf-8")
+        try:
+            with open(self.cachepath, "wb") as cachefile:
+                cachefile.write(CACHE_MAGIC)
+                cachefile.write(struct.pack("<Q", len(header)))
+                cachefile.write(header)
+                cachefile.write(self.offsets.tobytes())
+                for field in self.fields:
+                    cachefile.write(self.columns[field].tobytes())
+        except OSError:
+            pass # read-only directory, scan again next time
+
+    # ---- Queries
+
+    def header(self, game: int, field: str) -> str:
+        return self.strings[field][self.columns[field][game]]
+
+    def text(self, game: int) -> str:
+        return self.map[self.offsets[game]:self.offsets[game+1]].decode("utf-8", "replace")
+
+    def game(self, game: int) -> chess.pgn.Game:
+        return chess.pgn.read_game(io.StringIO(self.text(game)))
+
+    def filter(self, rows, field: str, text: str) -> array:
+        """ The games of `rows` whose `field` contains `text`, ignoring case. """
+        text = text.lower()
+        matching = { string_id for string_id, value in enumerate(self.strings[field])
+                     if text in value.lower() }
+        column = self.columns[field]
+        return array("I", [ row for row in rows if column[row] in matching ])
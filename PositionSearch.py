@@ -0,0 +1,388 @@
+# -------------------------------
+# PositionSearch
+# -------------------------------
+# Pattern search over all positions of the game database. Positions are
+# kept as packed bitboards in a memory mapped NumPy file beside the
+# database, queries are evaluated on whole batches of positions at once.
+#
+#   python PositionSearch.py update
+#   python PositionSearch.py search --piece R:7 --opposite-bishops
+
+import argparse, multiprocessing, os, sys, threading, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import chess
+
+from GameDatabase import GameDatabase, gameDatabase
+
+# 12 bitboards, white pawn to king then black pawn to king
+POSITION = np.dtype([ ("pieces", "<u8", (12,)), ("game", "<u4"), ("ply", "<u2"),
+                      ("flags", "u1"), ("reserved", "u1") ])
+
+FLAG_WHITE = 1
+FLAG_CASTLING = { chess.BB_H1: 2, chess.BB_A1: 4, chess.BB_H8: 8, chess.BB_A8: 16 }
+
+def piece_index(piece: chess.Piece) -> int:
+    return piece.piece_type-1 + (0 if piece.color == chess.WHITE else 6)
+
+def board_bitboards(board: chess.Board) -> list:
+    bitboards = []
+    for color_mask in (board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK]):
+        bitboards.extend((board.pawns & color_mask, board.knights & color_mask, board.bishops & color_mask,
+                          board.rooks & color_mask, board.queens & color_mask, board.kings & color_mask))
+    return bitboards
+
+def board_flags(board: chess.Board) -> int:
+    flags = FLAG_WHITE if board.turn == chess.WHITE else 0
+    for rook, flag in FLAG_CASTLING.items():
+        if board.castling_rights & rook:
+            flags |= flag
+    return flags
+
+if hasattr(np, "bitwise_count"):
+    def popcount(bitboards: np.ndarray) -> np.ndarray:
+        return np.bitwise_count(bitboards)
+else:
+    BYTE_COUNTS = np.array([ bin(byte).count("1") for byte in range(256) ], dtype=np.uint8)
+
+    def popcount(bitboards: np.ndarray) -> np.ndarray:
+        counts = BYTE_COUNTS[np.ascontiguousarray(bitboards).view(np.uint8)]
+        return counts.reshape(bitboards.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+def game_positions(games: list) -> bytes:
+    """ The packed positions of (id, start fen, uci moves) games.
+
+    Runs in the worker processes while updating.
+    """
+    records = []
+    for game_id, fen, moves in games:
+        board = chess.Board(fen or chess.STARTING_FEN)
+        records.append((board_bitboards(board), game_id, 0, board_flags(board), 0))
+        for ply, uci in enumerate(moves.split(), 1):
+            board.push(chess.Move.from_uci(uci))
+            records.append((board_bitboards(board), game_id, ply, board_flags(board), 0))
+    return np.array(records, dtype=POSITION).tobytes()
+
+# ---- Predicates
+
+class Predicate:
+    """ A condition on positions, evaluated on a batch at a time.
+
+    mask() takes an array of POSITION records and returns one bool per
+    record. Predicates combine with &, | and ~. They are plain objects
+    so they can be sent to the worker processes.
+    """
+
+    def mask(self, positions: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def __and__(self, other: "Predicate") -> "Predicate":
+        return All([ self, other ])
+
+    def __or__(self, other: "Predicate") -> "Predicate":
+        return Any([ self, other ])
+
+    def __invert__(self) -> "Predicate":
+        return Not(self)
+
+class All(Predicate):
+
+    def __init__(self, predicates: list) -> None:
+        self.predicates = predicates
+
+    def mask(self, positions: np.ndarray) -> np.ndarray:
+        result = np.ones(len(positions), dtype=bool)
+        for predicate in self.predicates:
+            result &= predicate.mask(positions)
+        return result
+
+class Any(Predicate):
+
+    def __init__(self, predicates: list) -> None:
+        self.predicates = predicates
+
+    def mask(self, positions: np.ndarray) -> np.ndarray:
+        result = np.zeros(len(positions), dtype=bool)
+        for predicate in self.predicates:
+            result |= predicate.mask(positions)
+        return result
+
+class Not(Predicate):
+
+    def __init__(self, predicate: Predicate) -> None:
+        self.predicate = predicate
+
+    def mask(self, positions: np.ndarray) -> np.ndarray:
+        return ~self.predicate.mask(positions)
+
+class PieceCount(Predicate):
+    """ Between `low` and `high` pieces of a kind on the `squares` mask. """
+
+    def __init__(self, piece: chess.Piece, low: int = 1, high: int = 64, squares: int = chess.BB_ALL) -> None:
+        self.index = piece_index(piece)
+        self.low = low
+        self.high = high
+        self.squares = np.uint64(squares)
+
+    def mask(self, positions: np.ndarray) -> np.ndarray:
+        counts = popcount(positions["pieces"][:, self.index] & self.squares)
+        return (counts >= self.low) & (counts <= self.high)
+
+class Bitboards(Predicate):
+    """ Bitboards of `indices` equal to `bitboards` or, with `subset`, containing them. """
+
+    def __init__(self, indices: list, bitboards: list, subset: bool = False) -> None:
+        self.indices = list(indices)
+        self.bitboards = np.array(bitboards, dtype=np.uint64)
+        self.subset = subset
+
+    def mask(self, positions: np.ndarray) -> np.ndarray:
+        pieces = positions["pieces"][:, self.indices]
+        if self.subset:
+            pieces = pieces & self.bitboards
+        return (pieces == self.bitboards).all(axis=1)
+
+class Material(Predicate):
+    """ Exactly `counts` pieces of every kind, indexed like the bitboards. """
+
+    def __init__(self, counts: list) -> None:
+        self.counts = np.array(counts, dtype=np.uint8)
+
+    def mask(self, positions: np.ndarray) -> np.ndarray:
+        return (popcount(positions["pieces"]) == self.counts).all(axis=1)
+
+class OppositeBishops(Predicate):
+    """ One bishop each, on squares of different colours. """
+
+    def mask(self, positions: np.ndarray) -> np.ndarray:
+        white = positions["pieces"][:, piece_index(chess.Piece(chess.BISHOP, chess.WHITE))]
+        black = positions["pieces"][:, piece_index(chess.Piece(chess.BISHOP, chess.BLACK))]
+        light = np.uint64(chess.BB_LIGHT_SQUARES)
+        single = (popcount(white) == 1) & (popcount(black) == 1)
+        return single & (((white & light) != 0) != ((black & light) != 0))
+
+class SideToMove(Predicate):
+
+    def __init__(self, color: chess.Color) -> None:
+        self.color = color
+
+    def mask(self, positions: np.ndarray) -> np.ndarray:
+        return ((positions["flags"] & FLAG_WHITE) != 0) == (self.color == chess.WHITE)
+
+class Query(All):
+    """ Builds a search from conditions, all of which have to hold.
+
+        Query().piece_on(chess.Piece(chess.ROOK, chess.WHITE), chess.BB_RANK_7).opposite_bishops()
+    """
+
+    def __init__(self) -> None:
+        super().__init__([])
+
+    def where(self, predicate: Predicate) -> "Query":
+        self.predicates.append(predicate)
+        return self
+
+    def piece_on(self, piece: chess.Piece, squares: int, count: int = 1) -> "Query":
+        return self.where(PieceCount(piece, count, 64, squares))
+
+    def piece_count(self, piece: chess.Piece, low: int, high: int = None) -> "Query":
+        return self.where(PieceCount(piece, low, low if high is None else high))
+
+    def material(self, signature: str) -> "Query":
+        """ The exact material, as piece letters like "KRPPkr". """
+        counts = [0]*12
+        for symbol in signature:
+            counts[piece_index(chess.Piece.from_symbol(symbol))] += 1
+        return self.where(Material(counts))
+
+    def opposite_bishops(self) -> "Query":
+        return self.where(OppositeBishops())
+
+    def side_to_move(self, color: chess.Color) -> "Query":
+        return self.where(SideToMove(color))
+
+    # ---- Templates from a board
+
+    def same_material(self, board: chess.Board) -> "Query":
+        return self.where(Material([ chess.popcount(bitboard) for bitboard in board_bitboards(board) ]))
+
+    def same_pawns(self, board: chess.Board) -> "Query":
+        bitboards = board_bitboards(board)
+        return self.where(Bitboards([ 0, 6 ], [ bitboards[0], bitboards[6] ]))
+
+    def same_pieces(self, board: chess.Board) -> "Query":
+        """ Every piece of the board on its square, other pieces may be there too. """
+        return self.where(Bitboards(range(12), board_bitboards(board), subset=True))
+
+    @classmethod
+    def from_board(cls, board: chess.Board, material: bool = True, pawns: bool = False,
+                   pieces: bool = False) -> "Query":
+        query = cls()
+        if material:
+            query.same_material(board)
+        if pawns:
+            query.same_pawns(board)
+        if pieces:
+            query.same_pieces(board)
+        return query
+
+# ---- The position file
+
+def search_range(path: str, predicate: Predicate, start: int, stop: int, batch_size: int) -> np.ndarray:
+    """ Indices of the matching positions in [start, stop).
+
+    Runs in the worker processes of a search, each maps the file itself.
+    """
+    positions = np.memmap(path, dtype=POSITION, mode="r")
+    found = []
+    for batch_start in range(start, stop, batch_size):
+        batch = positions[batch_start:min(stop, batch_start+batch_size)]
+        found.append(np.flatnonzero(predicate.mask(batch)) + batch_start)
+    del positions
+    return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+
+class PositionFile:
+    """ Every position of every game in the database as packed bitboards.
+
+    The file only grows, update() appends the games imported since the
+    last update. Searches map it read only and split it into ranges
+    for `workers` processes. The processes are spawned on first use and
+    kept for later updates and searches until close().
+    """
+
+    def __init__(self, path: str, batch_size: int = 1 << 16) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self.executor = None
+        self.executor_workers = 0
+        self.lock = threading.Lock()
+
+    def pool(self, workers: int) -> ProcessPoolExecutor:
+        """ The worker processes, started again only if `workers` changed. """
+        with self.lock:
+            if self.executor is not None and self.executor_workers != workers:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+            if self.executor is None:
+                # spawned, forking the GUI's threads and Qt state is unsafe
+                self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+                self.executor_workers = workers
+            return self.executor
+
+    def close(self) -> None:
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+    def __len__(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path) // POSITION.itemsize
+
+    def positions(self) -> np.ndarray:
+        if not len(self):
+            return np.zeros(0, dtype=POSITION)
+        return np.memmap(self.path, dtype=POSITION, mode="r")
+
+    def last_game(self) -> int:
+        count = len(self)
+        if not count:
+            return 0
+        with open(self.path, "rb") as positionfile:
+            positionfile.seek((count-1)*POSITION.itemsize)
+            return int(np.frombuffer(positionfile.read(POSITION.itemsize), dtype=POSITION)["game"][0])
+
+    def update(self, database: GameDatabase, workers: int = None, progress=None) -> int:
+        """ Appends the positions of games not yet in the file, returns their number. """
+        workers = workers or os.cpu_count() or 1
+        added = 0
+        # a record cut short by an interrupted update is dropped
+        count = len(self)
+        if count and os.path.getsize(self.path) != count*POSITION.itemsize:
+            os.truncate(self.path, count*POSITION.itemsize)
+        with open(self.path, "ab") as positionfile:
+            batches = database.game_moves(after=self.last_game())
+            if workers == 1:
+                for games in batches:
+                    added += self.write(positionfile, game_positions(games), progress, added)
+            else:
+                executor = self.pool(workers)
+                pending = deque()
+                for games in batches:
+                    pending.append(executor.submit(game_positions, games))
+                    if len(pending) >= workers*2:
+                        added += self.write(positionfile, pending.popleft().result(), progress, added)
+                while pending:
+                    added += self.write(positionfile, pending.popleft().result(), progress, added)
+        return added
+
+    def write(self, positionfile, packed: bytes, progress, added: int) -> int:
+        positionfile.write(packed)
+        count = len(packed) // POSITION.itemsize
+        if progress is not None:
+            progress(added+count)
+        return count
+
+    def search(self, predicate: Predicate, workers: int = None) -> np.ndarray:
+        """ Indices of all positions matching `predicate`, in file order. """
+        count = len(self)
+        workers = workers or os.cpu_count() or 1
+        if workers == 1 or count <= self.batch_size*4:
+            return search_range(self.path, predicate, 0, count, self.batch_size) if count else \
+                   np.zeros(0, dtype=np.int64)
+        chunk = -(-count // (workers*4))
+        starts = range(0, count, chunk)
+        found = self.pool(workers).map(search_range, [self.path]*len(starts), [predicate]*len(starts),
+                                       starts, [ min(count, start+chunk) for start in starts ],
+                                       [self.batch_size]*len(starts))
+        return np.concatenate(list(found))
+
+    def games(self, indices: np.ndarray) -> np.ndarray:
+        """ The ids of the games of the positions at `indices`, each game once in file order. """
+        if not len(indices):
+            return np.zeros(0, dtype=np.uint32)
+        game_ids = self.positions()["game"][indices]
+        keep = np.ones(len(game_ids), dtype=bool)
+        keep[1:] = game_ids[1:] != game_ids[:-1]
+        return game_ids[keep]
+
+def position_file(database: GameDatabase) -> PositionFile:
+    return PositionFile(os.path.splitext(database.path)[0] + ".positions")
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Pattern search over the positions of the game database.")
+    parser.add_argument("command", choices=["update", "search"])
+    parser.add_argument("--db", default=gameDatabase.path)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--material", help="exact material like KRPPkr")
+    parser.add_argument("--piece", action="append", default=[],
+                        help="piece letter and rank, R:7 is a white rook on the 7th rank")
+    parser.add_argument("--opposite-bishops", action="store_true")
+    args = parser.parse_args()
+
+    database = GameDatabase(args.db)
+    positions = position_file(database)
+    start = time.perf_counter()
+    if args.command == "update":
+        added = positions.update(database, args.workers)
+        print(f"{added} positions added, {len(positions)} in total, {time.perf_counter()-start:.1f}s",
+              file=sys.stderr)
+    else:
+        query = Query()
+        if args.material:
+            query.material(args.material)
+        for piece in args.piece:
+            symbol, rank = piece.split(":")
+            query.piece_on(chess.Piece.from_symbol(symbol), chess.BB_RANKS[int(rank)-1])
+        if args.opposite_bishops:
+            query.opposite_bishops()
+        indices = positions.search(query, args.workers)
+        game_ids = positions.games(indices)
+        elapsed = time.perf_counter()-start
+        for row in database.game_rows([ int(game_id) for game_id in game_ids[:20] ]):
+            print(f"{row.id}: {row.white} - {row.black} {row.result} {row.date} {row.event}")
+        print(f"{len(indices)} of {len(positions)} positions in {len(game_ids)} games, {elapsed*1000:.0f} ms",
+              file=sys.stderr)
+    positions.close()
@@ -3,15 +3,15 @@
 # -------------------------------
 
 import os, json
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from collections import OrderedDict
 import chess
-import chess.engine
+from ChessEventManager import eventManager
 from PyQt5.QtWidgets import (QWidget, QDialog, QStackedLayout,
                              QFormLayout, QHBoxLayout, QVBoxLayout,
                              QListWidget, QComboBox, QLineEdit, QLabel,
                              QGroupBox, QPushButton, QAbstractItemView,
-                             QMessageBox
+                             QMessageBox, QFileDialog
                             )
 
 @dataclass(order=True)
@@ -19,8 +19,10 @@ class EngineDef:
     """Defines everything necessary to communicate with an engine"""
     name: str
     filepath: str
+    options: dict = field(default_factory=dict, compare=False) # UCI options set on start
 
-    def init_settings_gui(self) -> QWidget:
+    def init_settings_gui(self, info=None) -> QWidget:
+        """ The settings page, `info` is the cached EngineInfo or None while it's probed. """
         engine_settings_window = QWidget()
         engine_settings_layout = QFormLayout()
         engine_settings_window.setLayout(engine_settings_layout)
@@ -35,8 +37,43 @@ class EngineDef:
         filepath_widget.textChanged.connect(
             lambda tx: filepath_widget.setText(tx))
 
+        engine_settings_window.info_box = EngineInfoBox()
+        engine_settings_window.info_box.set_info(info)
+        engine_settings_layout.addRow(engine_settings_window.info_box)
+
         return engine_settings_window
 
+class EngineInfoBox(QGroupBox):
+    """ What the engine reports about itself: id, variants and UCI options. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__("Engine", *args, **kwargs)
+        self.setLayout(QFormLayout())
+        self.summary = QLabel()
+        self.summary.setWordWrap(True)
+        self.layout().addRow("Id:", self.summary)
+        self.variants = QLabel()
+        self.layout().addRow("Variants:", self.variants)
+        self.option_list = QListWidget()
+        self.option_list.setSelectionMode(QAbstractItemView.NoSelection)
+        self.layout().addRow("Options:", self.option_list)
+
+    def set_info(self, info) -> None:
+        self.option_list.clear()
+        if info is None:
+            self.summary.setText("Not probed yet")
+            self.variants.setText("")
+            return
+        self.summary.setText(info.summary())
+        self.variants.setText(", ".join(info.variants))
+        for option in info.options:
+            text = f"{option['name']} ({option['type']}"
+            if option["default"] not in (None, ""):
+                text += f", default {option['default']}"
+            if option["min"] is not None and option["max"] is not None:
+                text += f", {option['min']}-{option['max']}"
+            self.option_list.addItem(text + ")")
+
 class EnginesSettings:
 
     def __init__(self, *args, **kwargs):
@@ -55,8 +92,8 @@ class EnginesSettings:
         if not os.path.exists(filepath):
             return
         with open(filepath) as settingsfile:
-            settings = json.read(settingsfile)
-        for enginedata in settings["engines"]:
+            settings = json.load(settingsfile)
+        for enginedata in settings["engines"].values():
             self.engine_defs.append(EngineDef(**enginedata))
 
     def DEBUG_add_stockfish(self):
@@ -114,6 +151,111 @@ class EnginesSettings:
         print(f"Removing Engine {engine_name}")
         
 
+@dataclass(order=True)
+class BookDef:
+    """A Polyglot opening book and how much its moves count"""
+    name: str
+    filepath: str
+    weight: float = field(default=1.0, compare=False)
+
+class BooksSettings:
+
+    def __init__(self, *args, **kwargs):
+        self.book_defs = []
+
+    def store_settings(self, filepath):
+        settings = dict()
+        settings["books"] = dict()
+        for book in self.book_defs:
+            settings["books"][book.name] = asdict(book)
+        with open(filepath, "w") as settingsfile:
+            json.dump(settings, settingsfile, indent=2)
+
+    def restore_settings(self, filepath):
+        if not os.path.exists(filepath):
+            return
+        with open(filepath) as settingsfile:
+            settings = json.load(settingsfile)
+        for bookdata in settings["books"].values():
+            self.book_defs.append(BookDef(**bookdata))
+
+    def init_settings_gui(self) -> QWidget:
+        book_settings_window = QWidget()
+        book_settings_window.setLayout(QFormLayout())
+
+        books_group = QGroupBox("Opening Books")
+        books_group.setLayout(QVBoxLayout())
+        self.book_list = QListWidget()
+        self.book_list.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.book_list.addItems( [ f"{book.name} ({book.weight:g})" for book in self.book_defs ] )
+        books_group.layout().addWidget(self.book_list)
+        book_settings_window.layout().addWidget(books_group)
+
+        return book_settings_window
+
+class TablebaseSettings:
+
+    def __init__(self, *args, **kwargs):
+        self.directories = []
+        self.changed = None # called with the directories after a change
+
+    def store_settings(self, filepath):
+        with open(filepath, "w") as settingsfile:
+            json.dump({ "directories": self.directories }, settingsfile, indent=2)
+
+    def restore_settings(self, filepath):
+        if not os.path.exists(filepath):
+            return
+        with open(filepath) as settingsfile:
+            settings = json.load(settingsfile)
+        self.directories.extend(settings["directories"])
+
+    def init_settings_gui(self) -> QWidget:
+        tablebase_settings_window = QWidget()
+        tablebase_settings_window.setLayout(QFormLayout())
+
+        directories_group = QGroupBox("Syzygy Directories")
+        directories_group.setLayout(QVBoxLayout())
+        self.directory_list = QListWidget()
+        self.directory_list.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.directory_list.addItems(self.directories)
+        directories_group.layout().addWidget(self.directory_list)
+
+        buttons_row = QWidget()
+        buttons_row.setLayout(QHBoxLayout())
+        bAdd = QPushButton("Add Directory")
+        bAdd.released.connect(self.add_directory)
+        buttons_row.layout().addWidget(bAdd)
+        bRemove = QPushButton("Remove Directory")
+        bRemove.released.connect(self.remove_directory)
+        buttons_row.layout().addWidget(bRemove)
+        directories_group.layout().addWidget(buttons_row)
+        tablebase_settings_window.layout().addWidget(directories_group)
+
+        return tablebase_settings_window
+
+    def add_directory(self):
+        directory = QFileDialog.getExistingDirectory(self.directory_list, "Syzygy Directory")
+        if not directory or directory in self.directories:
+            return
+        self.directories.append(directory)
+        self.directory_list.addItem(directory)
+        self.save()
+
+    def remove_directory(self):
+        if self.directory_list.selectedItems() == []:
+            return
+        row = self.directory_list.currentRow()
+        self.directory_list.takeItem(row)
+        del self.directories[row]
+        self.save()
+
+    def save(self):
+        os.makedirs("settings", exist_ok=True)
+        self.store_settings("settings/tablebases.json")
+        if self.changed is not None:
+            self.changed(self.directories)
+
 class Preferences(QDialog):
     
     def __init__(self, parent, *args, **kwargs):
@@ -121,9 +263,32 @@ class Preferences(QDialog):
 
         self.pages = OrderedDict()
         self.engine_settings = EnginesSettings()
+        self.book_settings = BooksSettings()
+        self.tablebase_settings = TablebaseSettings()
+        self.engine_info = None # the EngineInfoCache, once the engines are set up
+        self.refresh_engine_info = None # probes new or changed engine binaries
+        self.info_boxes = dict() # engine name -> EngineInfoBox of its page
 
         self.load_prefs()
-        self.init_dialog()
+        eventManager.onEngineInfo += self.engine_probed
+
+    def show(self):
+        # the pages are built when they are first needed, not at startup
+        if not self.pages:
+            self.init_dialog()
+        if self.refresh_engine_info is not None:
+            # binaries replaced since startup are probed again, the others come from the cache
+            self.refresh_engine_info(self.engine_settings.engine_defs)
+        super().show()
+
+    def set_engine_info(self, engine_info, refresh=None) -> None:
+        """ Sets the EngineInfoCache and how to probe stale engines, pages built before are filled in. """
+        self.engine_info = engine_info
+        self.refresh_engine_info = refresh
+        for engine in self.engine_settings.engine_defs:
+            info_box = self.info_boxes.get(engine.name)
+            if info_box is not None:
+                info_box.set_info(engine_info.get(engine))
 
     def init_dialog(self):
         self.setWindowTitle("ChessBoy Preferences")
@@ -154,7 +319,12 @@ class Preferences(QDialog):
         self.pages["Engines"] = self.engine_settings.init_settings_gui()
 
         for engine in self.engine_settings.engine_defs:
-            self.pages["  "+engine.name] = engine.init_settings_gui()
+            info = self.engine_info.get(engine) if self.engine_info is not None else None
+            page = self.pages["  "+engine.name] = engine.init_settings_gui(info)
+            self.info_boxes[engine.name] = page.info_box
+
+        self.pages["Opening Books"] = self.book_settings.init_settings_gui()
+        self.pages["Tablebases"] = self.tablebase_settings.init_settings_gui()
 
     def init_appearances(self) -> QWidget:
         self.theme = QComboBox()
@@ -170,7 +340,6 @@ class Preferences(QDialog):
         self.selection_list.clear()
         list_id=0
         for page_name, page_widget in self.pages.items():
-            print(f"Adding {page_name}")
             self.selection_list.insertItem(list_id, page_name)
             self.settings.layout().addWidget(page_widget)
             list_id+=1
@@ -180,6 +349,13 @@ class Preferences(QDialog):
 
     def load_prefs(self):
         self.engine_settings.restore_settings("settings/engines.json")
+        self.book_settings.restore_settings("settings/books.json")
+        self.tablebase_settings.restore_settings("settings/tablebases.json")
+
+    def engine_probed(self, engine_def, info) -> None:
+        info_box = self.info_boxes.get(engine_def.name)
+        if info_box is not None:
+            info_box.set_info(info)
 
     def change_page(self, index):
         self.settings.layout().setCurrentIndex(index)
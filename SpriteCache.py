@@ -0,0 +1,157 @@
+# -------------------------------
+# SpriteCache
+# -------------------------------
+
+import threading
+from collections import OrderedDict
+from PyQt5.QtCore import Qt, QRectF
+from PyQt5.QtGui import QImage, QPixmap, QPainter, QColor
+from PyQt5.QtWidgets import QGraphicsScene, QGraphicsPixmapItem, QGraphicsDropShadowEffect
+from Instrumentation import instrumentation
+
+sprite_source = dict()
+
+sprite_source["P"] = "imgs//Pawn White.png"
+sprite_source["R"] = "imgs//Rook White.png"
+sprite_source["N"] = "imgs//Knight White.png"
+sprite_source["B"] = "imgs//Bishop White.png"
+sprite_source["Q"] = "imgs//Queen White.png"
+sprite_source["K"] = "imgs//King White.png"
+
+sprite_source["p"] = "imgs//Pawn Black.png"
+sprite_source["r"] = "imgs//Rook Black.png"
+sprite_source["n"] = "imgs//Knight Black.png"
+sprite_source["b"] = "imgs//Bishop Black.png"
+sprite_source["q"] = "imgs//Queen Black.png"
+sprite_source["k"] = "imgs//King Black.png"
+
+sprite_source["light"] = "imgs//Field Light.png"
+sprite_source["dark"] = "imgs//Field Dark.png"
+
+class SpriteCache:
+    """ Decodes every sprite once and keeps pre-scaled pixmaps per pixel size.
+
+    The size is the pixel size of one board square, the sources are
+    drawn for squares of `source_size` pixels. Sizes are kept in least recently used order, the oldest size is
+    evicted once more than `max_sizes` are alive.
+    """
+
+    shadow_margin = 24 # source pixels around a shadowed sprite
+
+    def __init__(self, source_size: int = 256, max_sizes: int = 4) -> None:
+        self.source_size = source_size
+        self.max_sizes = max_sizes
+        self.images = dict()        # key -> decoded source QImage
+        self.sources = dict()       # key -> unscaled QPixmap
+        self.sizes = OrderedDict()  # size -> { key: QPixmap }
+        self.loads = 0
+        self.lock = threading.Lock() # decoding, see preload()
+
+    def image(self, key: str) -> QImage:
+        image = self.images.get(key)
+        if image is None:
+            with self.lock:
+                image = self.images.get(key)
+                if image is None:
+                    image = self.decode(key)
+        return image
+
+    def decode(self, key: str) -> QImage:
+        with instrumentation.span("SpriteCache.load", "pixmap"):
+            image = QImage(sprite_source[key])
+        self.images[key] = image
+        self.loads += 1
+        instrumentation.count("sprite loads")
+        return image
+
+    def preload(self, keys=None) -> threading.Thread:
+        """ Decodes the sprites on a worker thread while startup goes on.
+
+        Decoding a PNG doesn't hold the GIL. QImage may be used off the
+        GUI thread, the pixmaps are still made in the GUI thread. image()
+        waits for a sprite that is being decoded right now.
+        """
+        keys = [ key for key in keys or sprite_source if key not in self.images ]
+        def decode_all():
+            for key in keys:
+                with self.lock:
+                    if key not in self.images:
+                        self.decode(key)
+        thread = threading.Thread(target=decode_all, name="Sprite decoder", daemon=True)
+        thread.start()
+        return thread
+
+    def source(self, key: str) -> QPixmap:
+        """ The unscaled sprite, used for item geometry. """
+        pixmap = self.sources.get(key)
+        if pixmap is None:
+            pixmap = self.sources[key] = QPixmap.fromImage(self.image(key))
+        return pixmap
+
+    def pixmap(self, key: str, size: int) -> QPixmap:
+        size = max(1, int(size))
+        pixmaps = self.sizes.get(size)
+        if pixmaps is None:
+            pixmaps = self.sizes[size] = dict()
+            self.evict()
+        else:
+            self.sizes.move_to_end(size)
+        pixmap = pixmaps.get(key)
+        if pixmap is None:
+            with instrumentation.span("SpriteCache.scale", "pixmap"):
+                image = self.image(key)
+                if size != self.source_size:
+                    factor = size/self.source_size
+                    image = image.scaled(round(image.width()*factor), round(image.height()*factor),
+                                         Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+                pixmap = pixmaps[key] = QPixmap.fromImage(image)
+            instrumentation.count("pixmap scales")
+        return pixmap
+
+    def shadow(self, key: str, size: int) -> QPixmap:
+        """ The sprite with a drop shadow, `shadow_margin` larger on every side.
+
+        The blur is rendered once per size, dragging a piece only blits it.
+        """
+        size = max(1, int(size))
+        shadow_key = "shadow " + key
+        pixmap = self.sizes.get(size, dict()).get(shadow_key)
+        if pixmap is not None:
+            self.sizes.move_to_end(size)
+            return pixmap
+        sprite = self.pixmap(key, size)
+        margin = round(self.shadow_margin*size/self.source_size)
+        image = QImage(sprite.width()+2*margin, sprite.height()+2*margin,
+                       QImage.Format_ARGB32_Premultiplied)
+        image.fill(Qt.transparent)
+        effect = QGraphicsDropShadowEffect()
+        effect.setBlurRadius(margin)
+        effect.setOffset(margin/3, margin/3)
+        effect.setColor(QColor(0, 0, 0, 140))
+        item = QGraphicsPixmapItem(sprite)
+        item.setGraphicsEffect(effect)
+        scene = QGraphicsScene()
+        scene.addItem(item)
+        painter = QPainter(image)
+        scene.render(painter, QRectF(image.rect()),
+                     QRectF(-margin, -margin, image.width(), image.height()))
+        painter.end()
+        pixmap = self.sizes[size][shadow_key] = QPixmap.fromImage(image)
+        return pixmap
+
+    @instrumentation.timed("pixmap")
+    def prescale(self, size: int, keys=None) -> None:
+        """ Scale all sprites for a new board size ahead of painting. """
+        for key in keys or sprite_source:
+            self.pixmap(key, size)
+
+    def evict(self) -> None:
+        while len(self.sizes) > self.max_sizes:
+            self.sizes.popitem(last=False)
+
+    def clear(self) -> None:
+        self.images.clear()
+        self.sources.clear()
+        self.sizes.clear()
+
+spriteCache = SpriteCache()
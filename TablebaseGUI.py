@@ -0,0 +1,123 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, pyqtSignal
+from PyQt5.QtWidgets import QDockWidget, QWidget, QVBoxLayout, QTableView, QHeaderView, \
+                            QAbstractItemView, QLabel
+import chess
+from ChessEventManager import eventManager
+from Tablebases import Tablebases, WDL_NAMES, describe
+
+class TablebaseMovesModel(QAbstractTableModel):
+    """ The legal moves of the current position with their tablebase outcome. """
+
+    headers = ("Move", "Result", "DTZ")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.moves = []
+        self.sans = []
+
+    def set_moves(self, board: chess.Board, moves: list) -> None:
+        self.beginResetModel()
+        self.moves = moves
+        self.sans = [ board.san(tablebase_move.move) for tablebase_move in moves ]
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.moves)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        tablebase_move = self.moves[index.row()]
+        if index.column() == 0:
+            return self.sans[index.row()]
+        if index.column() == 1:
+            return "Mate" if tablebase_move.mate else WDL_NAMES[tablebase_move.wdl].capitalize()
+        return str(abs(tablebase_move.dtz))
+
+    def headerData(self, section: int, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or orientation != Qt.Horizontal:
+            return None
+        return self.headers[section]
+
+class TablebaseGUI(QDockWidget):
+    """ The tablebase verdict on the board position and on each move.
+
+    Probes run in the tablebase thread, answers for positions that were
+    left in the meantime are dropped by request id.
+    """
+
+    resultsReady = pyqtSignal(int, object, object, object)
+
+    def __init__(self, tablebases: Tablebases, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setAllowedAreas(Qt.LeftDockWidgetArea | Qt.RightDockWidgetArea)
+        self.setMinimumSize(300, 200)
+        self.setWindowTitle("Tablebase")
+        self.tablebases = tablebases
+        self.board = None
+        self.request_id = 0
+        self.resultsReady.connect(self.results_ready)
+        eventManager.onMove += self.position_changed
+        eventManager.onJump += self.position_changed
+        eventManager.onGameLoaded += self.position_changed
+        eventManager.newGame += self.position_changed
+
+        self.verdict = QLabel()
+        self.model = TablebaseMovesModel()
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setShowGrid(False)
+        self.table.verticalHeader().hide()
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.clicked.connect(self.move_clicked)
+        self.status = QLabel()
+
+        self.mainWidget = QWidget()
+        self.mainWidget.setLayout(QVBoxLayout())
+        self.mainWidget.layout().addWidget(self.verdict)
+        self.mainWidget.layout().addWidget(self.table)
+        self.mainWidget.layout().addWidget(self.status)
+        self.setWidget(self.mainWidget)
+
+    def set_board(self, board: chess.Board) -> None:
+        self.board = board
+
+    def position_changed(self, *args) -> None:
+        self.request_id += 1
+        if self.board is None or not self.tablebases.covers(self.board):
+            self.verdict.setText("Not in the tablebases")
+            self.model.set_moves(self.board, [])
+            return
+        request_id = self.request_id
+        board = self.board.copy()
+        future = self.tablebases.submit(self.probe, board)
+        future.add_done_callback(lambda future: self.probe_done(future, request_id, board))
+
+    def probe(self, board: chess.Board) -> tuple:
+        # Runs in the tablebase thread
+        return self.tablebases.probe(board), self.tablebases.moves(board)
+
+    def probe_done(self, future, request_id: int, board: chess.Board) -> None:
+        if request_id == self.request_id and future.exception() is None:
+            result, moves = future.result()
+            self.resultsReady.emit(request_id, board, result, moves)
+
+    def results_ready(self, request_id: int, board: chess.Board, result, moves: list) -> None:
+        if request_id != self.request_id:
+            return
+        self.verdict.setText(describe(board, result) if result is not None else "Not in the tablebases")
+        self.model.set_moves(board, moves)
+        stats = self.tablebases.stats()
+        self.status.setText(f"{stats['probes']} probes, {100*stats['hit_rate']:.0f}% cached, "
+                            f"{stats['entries']} entries")
+
+    def move_clicked(self, index: QModelIndex) -> None:
+        if index.isValid():
+            eventManager.onMoveTry(self.model.moves[index.row()].move)
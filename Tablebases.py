@@ -0,0 +1,161 @@
+# -------------------------------
+# Tablebases
+# -------------------------------
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import chess
+import chess.polyglot
+import chess.syzygy
+
+@dataclass
+class TablebaseResult:
+    """ WDL and DTZ of a position, from the side to move's point of view. """
+    wdl: int
+    dtz: int
+
+@dataclass
+class TablebaseMove:
+    """ A move with the WDL it keeps for the side that plays it. """
+    move: chess.Move
+    wdl: int
+    dtz: int       # of the position after the move, from the opponent's point of view
+    zeroing: bool
+    mate: bool
+
+    def rank(self) -> tuple:
+        """ Higher is better: win, mate, reset the 50 move count, then the shortest way. """
+        if self.wdl > 0:
+            return (self.wdl, self.mate, self.zeroing, -abs(self.dtz))
+        if self.wdl < 0:
+            return (self.wdl, False, not self.zeroing, abs(self.dtz))
+        return (0, False, False, 0)
+
+WDL_NAMES = { 2: "wins", 1: "wins (cursed)", 0: "draws", -1: "loses (blessed)", -2: "loses" }
+
+class Tablebases:
+    """ Syzygy tables from the configured directories.
+
+    The directories are listed in the probing thread, after preload()
+    or the first covers(), and chess.syzygy maps each table file when
+    it is first probed. Results are kept in a
+    least recently used cache of `capacity` positions, which also
+    remembers positions the tables can't answer. Probing can take a
+    while on a cold disk, so callers run it with submit().
+    """
+
+    def __init__(self, directories: list, capacity: int = 100000) -> None:
+        self.directories = directories
+        self.capacity = capacity
+        self.tablebase = None
+        self.max_pieces = 0
+        self.entries = OrderedDict() # zobrist hash -> TablebaseResult, None if not in the tables
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Tablebases")
+        self.probes = 0
+        self.hits = 0
+
+    def open(self) -> chess.syzygy.Tablebase:
+        with self.lock:
+            if self.tablebase is None:
+                tablebase = chess.syzygy.Tablebase()
+                for directory in self.directories:
+                    try:
+                        tablebase.add_directory(directory)
+                    except OSError as error:
+                        print(f"Tablebases: Can't read {directory}: {error.strerror}")
+                self.max_pieces = max([ len(key)-1 for key in tablebase.wdl ], default=0)
+                self.tablebase = tablebase # covers() only sees it complete
+            return self.tablebase
+
+    def preload(self):
+        """ Lists the directories in the probing thread, returns its Future. """
+        return self.submit(self.open)
+
+    def set_directories(self, directories: list) -> None:
+        self.close()
+        self.directories = directories
+        self.preload()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.tablebase is not None:
+                self.tablebase.close()
+                self.tablebase = None
+                self.max_pieces = 0
+            self.entries.clear()
+
+    def submit(self, function, *args):
+        """ Runs `function` in the probing thread, returns a concurrent.futures.Future. """
+        return self.executor.submit(function, *args)
+
+    def covers(self, board: chess.Board) -> bool:
+        """ Whether the tables for the material of `board` are there.
+
+        Never touches the disk: until the directories are listed in the
+        probing thread, no position is covered.
+        """
+        tablebase = self.tablebase
+        if tablebase is None:
+            self.preload()
+            return False
+        if board.castling_rights or chess.popcount(board.occupied) > self.max_pieces:
+            return False
+        if board.occupied == board.kings:
+            return True # a draw without any table
+        key = chess.syzygy.calc_key(board)
+        return key in tablebase.wdl and key in tablebase.dtz
+
+    def probe(self, board: chess.Board):
+        """ The TablebaseResult of the position, None if the tables can't tell. """
+        key = chess.polyglot.zobrist_hash(board)
+        with self.lock:
+            self.probes += 1
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        tablebase = self.open()
+        try:
+            result = TablebaseResult(tablebase.probe_wdl(board), tablebase.probe_dtz(board))
+        except (KeyError, OSError):
+            # MissingTableError is a KeyError, so are castling rights
+            result = None
+        with self.lock:
+            self.entries[key] = result
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        return result
+
+    def moves(self, board: chess.Board) -> list:
+        """ All legal moves with their outcome, best first. Empty if the tables can't tell. """
+        moves = []
+        for move in board.legal_moves:
+            zeroing = board.is_zeroing(move)
+            board.push(move)
+            try:
+                mate = board.is_checkmate()
+                result = self.probe(board)
+            finally:
+                board.pop()
+            if result is None:
+                return []
+            moves.append(TablebaseMove(move, -result.wdl, result.dtz, zeroing, mate))
+        return sorted(moves, key=TablebaseMove.rank, reverse=True)
+
+    def best_move(self, board: chess.Board):
+        moves = self.moves(board)
+        return moves[0].move if moves else None
+
+    def stats(self) -> dict:
+        return { "entries": len(self.entries), "probes": self.probes, "hits": self.hits,
+                 "hit_rate": self.hits/self.probes if self.probes else 0.0 }
+
+def describe(board: chess.Board, result: TablebaseResult) -> str:
+    """ Like "White wins, DTZ 13". """
+    side = "White" if board.turn == chess.WHITE else "Black"
+    if result.wdl == 0:
+        return "Draw"
+    return f"{side} {WDL_NAMES[result.wdl]}, DTZ {abs(result.dtz)}"
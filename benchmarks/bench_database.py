@@ -0,0 +1,95 @@
+# -------------------------------
+# Game database benchmark
+# -------------------------------
+# Import speed and position query latency of GameDatabase.
+#
+#   python benchmarks/bench_database.py [games.pgn] --games 20000
+#
+# Without a PGN file, random games are generated first.
+
+import argparse, os, random, statistics, sys, tempfile, time
+import chess
+import chess.pgn
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from GameDatabase import GameDatabase
+
+def write_random_games(filepath: str, count: int, seed: int = 1) -> None:
+    """ Random games that share their first moves often enough to make
+    the common positions as crowded as in a real database. """
+    rng = random.Random(seed)
+    openings = [ [ "e4", "e5", "Nf3", "Nc6" ], [ "d4", "d5", "c4" ], [ "e4", "c5", "Nf3", "d6" ],
+                 [ "d4", "Nf6", "c4", "e6" ], [ "c4" ], [ "Nf3", "d5" ] ]
+    with open(filepath, "w") as pgn:
+        for number in range(count):
+            board = chess.Board()
+            for san in rng.choice(openings):
+                board.push_san(san)
+            for ply in range(rng.randint(20, 100)):
+                moves = list(board.legal_moves)
+                if not moves:
+                    break
+                board.push(rng.choice(moves))
+            game = chess.pgn.Game.from_board(board)
+            game.headers["Event"] = f"Bench {number}"
+            game.headers["White"] = f"Player {rng.randint(1, 500)}"
+            game.headers["Black"] = f"Player {rng.randint(1, 500)}"
+            game.headers["Result"] = rng.choice([ "1-0", "0-1", "1/2-1/2" ])
+            print(game, file=pgn, end="\n\n")
+
+def sample_positions(database: GameDatabase, count: int, seed: int = 2) -> list:
+    """ Positions from the imported games, early plies most often. """
+    rng = random.Random(seed)
+    total = database.count()
+    boards = [ chess.Board() ]
+    while len(boards) < count:
+        game = database.game(rng.randint(1, total))
+        board = game.board()
+        moves = list(game.mainline_moves())
+        for move in moves[:rng.choice([ 2, 4, 8, 16, len(moves) ])]:
+            board.push(move)
+        boards.append(board)
+    return boards
+
+def measure(query, boards: list) -> dict:
+    times = []
+    for board in boards:
+        start = time.perf_counter()
+        query(board)
+        times.append((time.perf_counter()-start)*1000)
+    times.sort()
+    return { "median_ms": statistics.median(times), "p95_ms": times[int(len(times)*0.95)],
+             "max_ms": times[-1] }
+
+def run(args) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        filepath = args.pgn
+        if filepath is None:
+            filepath = os.path.join(directory, "games.pgn")
+            write_random_games(filepath, args.games)
+        database = GameDatabase(os.path.join(directory, "games.sqlite"))
+        start = time.perf_counter()
+        imported = database.import_pgn(filepath)
+        elapsed = time.perf_counter()-start
+        boards = sample_positions(database, args.queries)
+        results = { "games": imported, "import_s": elapsed, "games_per_s": imported/elapsed,
+                    "db_mb": os.path.getsize(database.path)/1e6,
+                    "move_stats": measure(database.move_stats, boards),
+                    "games_reaching": measure(database.games_reaching, boards),
+                    "start_position_games": database.move_stats(chess.Board()) and
+                        sum(stat.games for stat in database.move_stats(chess.Board())) }
+        database.close()
+    return results
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the game database.")
+    parser.add_argument("pgn", nargs="?", help="games to import, random games if missing")
+    parser.add_argument("--games", type=int, default=20000, help="number of random games")
+    parser.add_argument("--queries", type=int, default=500)
+    results = run(parser.parse_args())
+    print(f"import: {results['games']} games in {results['import_s']:.1f}s, "
+          f"{results['games_per_s']:.0f} games/s, {results['db_mb']:.1f} MB")
+    for query in ("move_stats", "games_reaching"):
+        timing = results[query]
+        print(f"{query}: median {timing['median_ms']:.2f} ms, p95 {timing['p95_ms']:.2f} ms, "
+              f"max {timing['max_ms']:.2f} ms")
@@ -0,0 +1,259 @@
+# -------------------------------
+# GUI benchmark
+# -------------------------------
+# Board rendering, move handling, notation and startup of the real GUI
+# code, headless:
+#
+#   QT_QPA_PLATFORM=offscreen python benchmarks/bench_gui.py [games.pgn] --json results.json
+#   QT_QPA_PLATFORM=offscreen python benchmarks/bench_gui.py --baseline results.json
+#
+# Without a PGN file, random games are generated first. With --baseline,
+# every benchmark is compared against the stored results and the exit
+# code is 1 if one got slower by more than --threshold.
+
+import argparse, json, os, platform, random, statistics, subprocess, sys, tempfile, time
+import chess
+import chess.pgn
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, root)
+os.chdir(root) # sprites and settings are loaded relative to the project
+
+from PyQt5.QtCore import Qt, QEvent, QPointF, PYQT_VERSION_STR, QT_VERSION_STR
+from PyQt5.QtGui import QMouseEvent
+from PyQt5.QtWidgets import QApplication
+
+from bench_database import write_random_games
+
+def summarize(times: list) -> dict:
+    """ Timings in seconds to milliseconds statistics. """
+    times = sorted(time*1000 for time in times)
+    return { "count": len(times), "median_ms": statistics.median(times),
+             "p95_ms": times[min(len(times)-1, int(len(times)*0.95))], "max_ms": times[-1],
+             "total_ms": sum(times) }
+
+def timed(call, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    call(*args, **kwargs)
+    return time.perf_counter()-start
+
+def read_games(filepath: str, count: int) -> list:
+    """ Mainlines of the first `count` games as (start fen, moves). """
+    games = []
+    with open(filepath, encoding="utf-8", errors="replace") as pgn:
+        while len(games) < count:
+            game = chess.pgn.read_game(pgn)
+            if game is None:
+                break
+            moves = list(game.mainline_moves())
+            if moves:
+                games.append((game.board().fen(), moves))
+    return games
+
+def random_positions(games: list, count: int, seed: int = 3) -> list:
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < count:
+        fen, moves = rng.choice(games)
+        board = chess.Board(fen)
+        for move in moves[:rng.randint(0, len(moves))]:
+            board.push(move)
+        boards.append(board)
+    return boards
+
+def shuffle_moves(count: int) -> list:
+    """ Knights going back and forth, a legal game of any length. """
+    cycle = [ chess.Move.from_uci(uci) for uci in ("g1f3", "g8f6", "f3g1", "f6g8") ]
+    return [ cycle[ply % 4] for ply in range(count) ]
+
+def bench_setup_board(window, games: list, positions: int) -> dict:
+    scene = window.board_scene
+    return summarize([ timed(scene.setup_board, board) for board in random_positions(games, positions) ])
+
+def bench_make_move(window, games: list) -> dict:
+    """ Full round trips through MainWindow.makeMoveEvent, every handler of onMove included. """
+    times = []
+    for fen, moves in games:
+        window.new_game()
+        if fen != chess.STARTING_FEN:
+            window.board.set_fen(fen)
+            window.history.reset(fen)
+            window.board_scene.setup_board(window.board)
+        for move in moves:
+            times.append(timed(window.makeMoveEvent, move))
+    window.new_game()
+    return summarize(times)
+
+def bench_notation(plies: int) -> dict:
+    from NotationGUI import NotationGUI
+    board = chess.Board()
+    notation = NotationGUI()
+    notation.set_board(board)
+    times = []
+    for move in shuffle_moves(plies):
+        san = board.san(move)
+        board.push(move)
+        times.append(timed(notation.update, move, san))
+    notation.deleteLater()
+    return summarize(times)
+
+def bench_board_gfx(count: int) -> dict:
+    from BoardGUI import BoardGfx
+    return { "single_layer": summarize([ timed(BoardGfx) for i in range(count) ]),
+             "square_items": summarize([ timed(BoardGfx, single_layer=False) for i in range(count) ]) }
+
+def send_mouse(view, kind, pos: QPointF, buttons) -> None:
+    """ Delivers a mouse event to the view like the window system would. """
+    local = view.mapFromScene(pos)
+    event = QMouseEvent(kind, QPointF(local), QPointF(view.viewport().mapTo(view.window(), local)),
+                        QPointF(view.viewport().mapToGlobal(local)), Qt.LeftButton, buttons, Qt.NoModifier)
+    QApplication.sendEvent(view.viewport(), event)
+
+def drag_step(view, pos: QPointF) -> None:
+    """ A mouse move and the piece move it causes, which the scene defers to its drag timer. """
+    send_mouse(view, QEvent.MouseMove, pos, Qt.LeftButton)
+    view.scene().apply_drag()
+
+def bench_drag(window, drags: int, steps: int = 30) -> dict:
+    """ Lifting e2, dragging it over the board and dropping it on e4,
+    which plays the move; the game is reset after every drag. The
+    events go through the view, the scene and the grabbing piece. """
+    from BoardGUI import square_to_pos
+    app = QApplication.instance()
+    view = window.board_view
+    start, target = QPointF(*square_to_pos(chess.E2)), QPointF(*square_to_pos(chess.E4))
+    press, moves, release = [], [], []
+    for drag in range(drags):
+        window.new_game()
+        app.processEvents()
+        press.append(timed(send_mouse, view, QEvent.MouseButtonPress, start, Qt.LeftButton))
+        for step in range(1, steps+1):
+            moves.append(timed(drag_step, view, start + (target-start)*(step/steps)))
+            app.processEvents()
+        release.append(timed(send_mouse, view, QEvent.MouseButtonRelease, target, Qt.NoButton))
+        if len(window.board.move_stack) != 1:
+            raise RuntimeError("the dragged move was not played")
+    window.new_game()
+    return { "press": summarize(press), "move": summarize(moves), "release": summarize(release) }
+
+startup_script = """
+import json, sys, time
+start = time.perf_counter()
+import GameDatabase, EvalCache
+GameDatabase.gameDatabase.path = sys.argv[1]
+EvalCache.evalCache.path = None
+from PyQt5.QtWidgets import QApplication
+app = QApplication([])
+import ChessBoy
+from Instrumentation import startup
+def open_window(begin):
+    marks = len(startup.marks)
+    window = ChessBoy.MainWindow()
+    while not window.ready:
+        app.processEvents()
+    phases = { phase: startup.start+seconds-begin for phase, seconds in startup.marks[marks:] }
+    window.close()
+    window.deleteLater()
+    app.processEvents()
+    return phases["first frame"], phases["ready"]
+cold_frame, cold_ready = open_window(start)
+warm_frame, warm_ready = open_window(time.perf_counter())
+print(json.dumps({ "cold": cold_frame, "cold_ready": cold_ready, "warm": warm_frame, "warm_ready": warm_ready }))
+"""
+
+def bench_startup(runs: int, directory: str) -> dict:
+    """ Cold: a fresh interpreter importing everything and opening the
+    window. Warm: a second window in the same process. Both until the
+    first frame of the board, and until the docks are ready as well. """
+    phases = dict()
+    for run in range(runs):
+        output = subprocess.run([ sys.executable, "-c", startup_script, os.path.join(directory, "startup.sqlite") ],
+                                cwd=root, capture_output=True, text=True, check=True).stdout
+        for phase, seconds in json.loads(output.strip().splitlines()[-1]).items():
+            phases.setdefault(phase, []).append(seconds)
+    return { phase: summarize(times) for phase, times in phases.items() }
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """ { "drag": { "move": {...} } } to { "drag.move": {...} }. """
+    flat = dict()
+    for name, value in results.items():
+        if "median_ms" in value:
+            flat[prefix+name] = value
+        else:
+            flat.update(flatten(value, prefix+name+"."))
+    return flat
+
+def compare(results: dict, baseline: dict, threshold: float, noise_ms: float) -> list:
+    """ (name, baseline ms, current ms, ratio, regressed) per benchmark in both. """
+    current, before = flatten(results["results"]), flatten(baseline["results"])
+    rows = []
+    for name, timing in current.items():
+        if name not in before:
+            continue
+        old, new = before[name]["median_ms"], timing["median_ms"]
+        ratio = new/old if old > 0 else float("inf")
+        rows.append((name, old, new, ratio, ratio > 1+threshold and new-old > noise_ms))
+    return rows
+
+def run(args) -> dict:
+    import GameDatabase, EvalCache
+    with tempfile.TemporaryDirectory() as directory:
+        GameDatabase.gameDatabase.path = os.path.join(directory, "games.sqlite")
+        EvalCache.evalCache.path = None
+        filepath = args.pgn
+        if filepath is None:
+            filepath = os.path.join(directory, "games.pgn")
+            write_random_games(filepath, args.games)
+        games = read_games(filepath, args.games)
+
+        app = QApplication.instance() or QApplication([])
+        import ChessBoy
+        window = ChessBoy.MainWindow()
+        window.init_deferred()
+        window.resize(1200, 900)
+        app.processEvents()
+        results = { "setup_board": bench_setup_board(window, games, args.positions),
+                    "make_move": bench_make_move(window, games),
+                    "notation_update": bench_notation(args.plies),
+                    "board_gfx": bench_board_gfx(args.boards),
+                    "drag": bench_drag(window, args.drags) }
+        window.close()
+        app.processEvents()
+        if args.startup_runs:
+            results["startup"] = bench_startup(args.startup_runs, directory)
+    meta = { "date": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+             "qt": QT_VERSION_STR, "pyqt": PYQT_VERSION_STR, "chess": chess.__version__,
+             "platform": platform.platform(), "games": len(games), "plies": sum(len(moves) for fen, moves in games) }
+    return { "meta": meta, "results": results }
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the board, move handling, notation and startup.")
+    parser.add_argument("pgn", nargs="?", help="games to replay, random games if missing")
+    parser.add_argument("--games", type=int, default=50, help="number of games to replay")
+    parser.add_argument("--positions", type=int, default=500, help="random positions for setup_board")
+    parser.add_argument("--plies", type=int, default=500, help="moves written to the notation")
+    parser.add_argument("--boards", type=int, default=200, help="BoardGfx instances to construct")
+    parser.add_argument("--drags", type=int, default=20)
+    parser.add_argument("--startup-runs", type=int, default=3, help="0 skips the startup benchmark")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against results written with --json")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown of the median, 0.2 is 20%%")
+    parser.add_argument("--noise", type=float, default=0.02, help="slowdowns below this many ms are ignored")
+    args = parser.parse_args()
+    results = run(args)
+    for name, timing in flatten(results["results"]).items():
+        print(f"{name}: median {timing['median_ms']:.3f} ms, p95 {timing['p95_ms']:.3f} ms, "
+              f"max {timing['max_ms']:.3f} ms ({timing['count']} runs)")
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = 0
+        print(f"\ncompared to {args.baseline} ({baseline['meta']['date']}):")
+        for name, old, new, ratio, regressed in compare(results, baseline, args.threshold, args.noise):
+            regressions += regressed
+            print(f"{'REGRESSION ' if regressed else ''}{name}: {old:.3f} -> {new:.3f} ms ({ratio:.2f}x)")
+        sys.exit(1 if regressions else 0)
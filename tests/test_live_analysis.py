@@ -0,0 +1,82 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+import chess
+import chess.engine
+
+import LiveAnalysis
+from LiveAnalysis import AnalysisRunner
+
+class FakeAnalysis:
+    """ An infinite search sending one info line per loop turn until stopped. """
+
+    def __init__(self, board: chess.Board) -> None:
+        self.board = board
+        self.stopped = False
+
+    def stop(self) -> None:
+        self.stopped = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        await asyncio.sleep(0)
+        if self.stopped:
+            raise StopAsyncIteration
+        move = next(iter(self.board.legal_moves))
+        return { "depth": 1, "pv": [move], "score": chess.engine.PovScore(chess.engine.Cp(0), self.board.turn) }
+
+class FakeEngine:
+    """ Starting a search waits for `release`, like an engine busy with its handshake. """
+
+    def __init__(self) -> None:
+        self.release = asyncio.Event()
+        self.starting = asyncio.Event()
+        self.analyses = []
+
+    async def analysis(self, board: chess.Board, multipv: int = None, game=None) -> FakeAnalysis:
+        self.starting.set()
+        await self.release.wait()
+        analysis = FakeAnalysis(board)
+        self.analyses.append(analysis)
+        return analysis
+
+class FakePool:
+
+    def __init__(self, engine: FakeEngine) -> None:
+        self.fake_engine = engine
+        self.game = object()
+
+    @asynccontextmanager
+    async def engine(self, engine_def, options: dict = None):
+        yield self.fake_engine
+
+def test_position_change_while_analysis_starts(monkeypatch):
+    async def scenario():
+        engine = FakeEngine()
+        monkeypatch.setattr(LiveAnalysis, "enginePool", FakePool(engine))
+        runner = AnalysisRunner(SimpleNamespace(name="Fake", options=dict()), 1)
+        task = asyncio.ensure_future(runner.run())
+
+        runner.set_position((1, chess.Board()))
+        await engine.starting.wait()
+        moved = chess.Board()
+        moved.push_uci("e2e4")
+        runner.set_position((2, moved)) # the first search isn't running yet
+        engine.release.set()
+
+        for turn in range(100):
+            await asyncio.sleep(0)
+            if runner.latest is not None and runner.latest.session == 2:
+                break
+        first = engine.analyses[0]
+        runner.set_position(None)
+        await asyncio.wait_for(task, 1)
+        return runner, first
+
+    runner, first = asyncio.run(scenario())
+    assert first.stopped
+    assert first.board.fen() == chess.Board().fen()
+    assert runner.latest.session == 2
+    assert runner.latest.lines